@@ -0,0 +1,72 @@
+"""
+Import-time benchmark: measures import cost of marspy modules in fresh interpreters (python -X importtime) and
+fails if a budget is exceeded or optional heavy dependencies (plotting, JVM bindings) are imported eagerly.
+Time spent in numpy / pandas is reported separately and not charged to marspy.
+
+Run from Analysis_software: python benchmarks/bench_import.py --budget 0.1
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ANALYSIS_SOFTWARE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# modules that must not be imported by importing marspy / marspy.convert.archive
+LAZY_MODULES = ('seaborn', 'matplotlib', 'scyjava', 'jnius', 'sklearn', 'awesome_data')
+
+# modules measured by default (each in a fresh interpreter)
+MODULES = ('marspy', 'marspy.convert.archive', 'marspy.stats', 'marspy.diffusion')
+
+
+def import_times(module):
+    """
+    Imports module in a fresh interpreter.
+    Returns cumulative import time (s) of module, time (s) spent in marspy's own modules and the set of
+    top-level packages imported.
+    """
+    code = f'import sys, {module}; print(",".join(sorted({{name.split(".")[0] for name in sys.modules}})))'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ANALYSIS_SOFTWARE,
+                            capture_output=True, text=True, check=True)
+    total, own = 0., 0.
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        if name.startswith('marspy'):
+            own += int(self_us) / 1e6
+        if name == module:
+            total = int(cumulative_us) / 1e6
+    return total, own, set(result.stdout.strip().split(','))
+
+
+def bench_import(modules=MODULES, repeat=5):
+    """
+    Returns dict: module -> (best cumulative import time, best marspy-own import time, eagerly imported heavy
+    dependencies)
+    """
+    results = dict()
+    for module in modules:
+        runs = [import_times(module) for _ in range(repeat)]
+        loaded = set.union(*(packages for _, _, packages in runs))
+        results[module] = (min(total for total, _, _ in runs), min(own for _, own, _ in runs),
+                           sorted(loaded.intersection(LAZY_MODULES)))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', nargs='+', default=list(MODULES))
+    parser.add_argument('--budget', type=float, default=0.1, help='maximal marspy-own import time (s) per module')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    results = bench_import(modules=args.modules, repeat=args.repeat)
+    failed = False
+    print(f'{"module":<28} {"total (s)":>10} {"marspy (s)":>11}  eager imports')
+    for module, (total, own, eager) in results.items():
+        print(f'{module:<28} {total:>10.3f} {own:>11.3f}  {", ".join(eager) or "-"}')
+        failed |= own > args.budget or bool(eager)
+    if failed:
+        sys.exit(f'Import budget of {args.budget} s exceeded or heavy dependencies imported eagerly.')
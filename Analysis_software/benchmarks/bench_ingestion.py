@@ -0,0 +1,50 @@
+"""
+Ingestion benchmark: time to convert a synthetic archive (marspy.convert.synthetic) into a DnaMoleculeArchive
+for an increasing number of worker threads.
+latency simulates the cost of a single Python/Java round-trip.
+
+Run from Analysis_software: python benchmarks/bench_ingestion.py --molecules 500 --latency 0.0005
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from marspy.convert.archive import DnaMoleculeArchive
+from marspy.convert.synthetic import synthetic_archive
+
+
+def bench_ingestion(n_molecules=500, n_frames=500, latency=0.0005, workers=(1, 2, 4, 8), repeat=3):
+    """
+    Returns dict: number of workers -> best wall time (s) of repeat runs.
+    """
+    archive_link = synthetic_archive(n_molecules=n_molecules, n_frames=n_frames, latency=latency)
+    timings = dict()
+    for n_workers in workers:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            archive = DnaMoleculeArchive('synthetic.yama', accept_tag='accept', labels=dict(Cohesin='', MCM=''),
+                                         workers=n_workers, archive_link=archive_link)
+            best = min(best, time.perf_counter() - start)
+            DnaMoleculeArchive.collection.remove(archive)
+        timings[n_workers] = best
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--molecules', type=int, default=500)
+    parser.add_argument('--frames', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.0005)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results = bench_ingestion(n_molecules=args.molecules, n_frames=args.frames, latency=args.latency,
+                              workers=args.workers, repeat=args.repeat)
+    print(f'{"workers":>8} {"time (s)":>10} {"speedup":>8}')
+    for n_workers, timing in results.items():
+        print(f'{n_workers:>8} {timing:>10.3f} {results[args.workers[0]] / timing:>8.2f}')
@@ -0,0 +1,146 @@
+"""
+Benchmark suite: times the main marspy stages on a synthetic archive (marspy.convert.synthetic, no JVM needed) and
+compares them against a JSON baseline, e.g. one saved at an earlier commit.
+Stages: ingestion, molecule tables, add_segments_tables, detect_pauses, add_df_noidle, stats.bootstrap and the
+per-molecule summary table.
+
+The committed baseline benchmarks/baselines/suite.json holds the default configuration; --compare without a path
+checks against it and exits non-zero on a regression. Re-save it when the reference machine or commit changes.
+
+Run from Analysis_software:
+    python benchmarks/bench_suite.py --compare --tolerance 0.2
+    python benchmarks/bench_suite.py --save benchmarks/baselines/suite.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ANALYSIS_SOFTWARE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ANALYSIS_SOFTWARE)
+
+from marspy.convert.archive import DnaMoleculeArchive, summarize_molecules
+from marspy.convert.synthetic import synthetic_archive
+from marspy.stats import bootstrap
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'suite.json')
+STAGES = ('ingestion', 'tables', 'add_segments_tables', 'detect_pauses', 'add_df_noidle', 'bootstrap', 'summary')
+
+
+def run_stages(archive_link, workers=1, bulk=False, batch=True, n_boot=10000):
+    """
+    Runs all stages once on archive_link.
+    Returns dict: stage -> wall time (s)
+    """
+    timings = dict()
+
+    def timed(stage, fn):
+        start = time.perf_counter()
+        result = fn()
+        timings[stage] = time.perf_counter() - start
+        return result
+
+    archive = timed('ingestion', lambda: DnaMoleculeArchive('synthetic.yama', accept_tag='accept',
+                                                            labels=dict(Cohesin='', MCM=''), workers=workers,
+                                                            archive_link=archive_link, bulk=bulk))
+    try:
+        timed('tables', lambda: [molecule.df for molecule in archive.molecules])
+        timed('add_segments_tables', lambda: (archive.add_segments_tables(),
+                                              [molecule.seg_dfs for molecule in archive.molecules]))
+        timed('detect_pauses', lambda: archive.detect_pauses(batch=batch))
+        timed('add_df_noidle', lambda: (archive.add_df_noidle('Cohesin_1_'),
+                                        [molecule.df_noidle for molecule in archive.molecules]))
+        rates = np.concatenate([seg_df.df['B'].to_numpy() for molecule in archive.molecules
+                                for seg_df in molecule.seg_dfs if seg_df.type == 'rate'])
+        timed('bootstrap', lambda: bootstrap(rates, n_boot=n_boot, seed=0))
+        timed('summary', lambda: summarize_molecules([archive]))
+    finally:
+        DnaMoleculeArchive.collection.remove(archive)
+    return timings
+
+
+def bench_suite(n_molecules=500, n_frames=500, pause_density=0.2, latency=0.0, workers=1, bulk=False, batch=True,
+                n_boot=10000, repeat=3):
+    """
+    Returns dict: stage -> best wall time (s) of repeat runs.
+    """
+    archive_link = synthetic_archive(n_molecules=n_molecules, n_frames=n_frames, pause_density=pause_density,
+                                     latency=latency)
+    runs = [run_stages(archive_link, workers=workers, bulk=bulk, batch=batch, n_boot=n_boot) for _ in range(repeat)]
+    return {stage: min(run[stage] for run in runs) for stage in STAGES}
+
+
+def environment():
+    """
+    Versions and commit the timings were measured with (stored with the baseline).
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ANALYSIS_SOFTWARE, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(commit=commit, python=platform.python_version(), numpy=np.__version__, pandas=pd.__version__,
+                machine=platform.machine())
+
+
+def compare(timings, baseline, tolerance=0.2):
+    """
+    Compares timings with baseline timings.
+    Returns DataFrame (index: stage) with baseline, current, ratio and regression (ratio > 1 + tolerance)
+    """
+    stages = [stage for stage in STAGES if stage in timings and stage in baseline]
+    df = pd.DataFrame(dict(baseline=[baseline[stage] for stage in stages],
+                           current=[timings[stage] for stage in stages]), index=pd.Index(stages, name='stage'))
+    df['ratio'] = df['current'] / df['baseline']
+    df['regression'] = df['ratio'] > 1 + tolerance
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--molecules', type=int, default=500)
+    parser.add_argument('--frames', type=int, default=500)
+    parser.add_argument('--pause-density', type=float, default=0.2, help='fraction of rate segments which are pauses')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated round-trip latency (s) per API call')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--bulk', action='store_true', help='bulk extraction into a ColumnarStore')
+    parser.add_argument('--no-batch', dest='batch', action='store_false', help='detect pauses per SegmentsTable')
+    parser.add_argument('--n-boot', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help='write timings to this JSON baseline')
+    parser.add_argument('--compare', nargs='?', const=BASELINE,
+                        help='compare timings against this JSON baseline (default: the committed baseline)')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown per stage')
+    args = parser.parse_args()
+
+    config = dict(molecules=args.molecules, frames=args.frames, pause_density=args.pause_density,
+                  latency=args.latency, workers=args.workers, bulk=args.bulk, batch=args.batch, n_boot=args.n_boot)
+    timings = bench_suite(n_molecules=args.molecules, n_frames=args.frames, pause_density=args.pause_density,
+                          latency=args.latency, workers=args.workers, bulk=args.bulk, batch=args.batch,
+                          n_boot=args.n_boot, repeat=args.repeat)
+
+    print(f'{"stage":<22} {"time (s)":>10}')
+    for stage, timing in timings.items():
+        print(f'{stage:<22} {timing:>10.4f}')
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(dict(config=config, environment=environment(), timings=timings), f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['config'] != config:
+            print(f'Warning: baseline was measured with a different configuration: {baseline["config"]}')
+        result = compare(timings, baseline['timings'], tolerance=args.tolerance)
+        print(f'\nbaseline: commit {baseline["environment"]["commit"]}')
+        print(result.to_string(float_format='{:.4f}'.format))
+        if result['regression'].any():
+            sys.exit(f'Regression of more than {args.tolerance:.0%} in: {", ".join(result.index[result["regression"]])}')
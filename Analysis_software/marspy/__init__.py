@@ -1,22 +1,18 @@
-# Let users know if they're missing any of our hard dependencies
-hard_dependencies = ("re", "numpy", "seaborn", "scyjava", "jnius")
-missing_dependencies = []
+import importlib
 
-for dependency in hard_dependencies:
-    try:
-        __import__(dependency)
-    except ImportError as e:
-        missing_dependencies.append(f"{dependency}: {e}")
+__all__ = ['convert', 'stats', 'diffusion', 'fit', 'instrument', 'plot']
 
-if missing_dependencies:
-    raise ImportError(
-        "Unable to import required dependencies:\n" + "\n".join(missing_dependencies)
-    )
-del hard_dependencies, dependency, missing_dependencies
 
-__all__ = ['convert']
+def __getattr__(name):
+    # submodules are imported on first access (PEP 562), import marspy stays cheap and free of side effects
+    if name in __all__:
+        return importlib.import_module(f'{__name__}.{name}')
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
 
-print(f'{__name__} initialized.')
 
 # module level doc-string
 __doc__ = """
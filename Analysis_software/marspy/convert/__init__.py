@@ -1 +1,15 @@
-__all__ = ['molecule', 'archive']
+import importlib
+
+__all__ = ['molecule', 'archive', 'cache', 'collection', 'columnar', 'diskcache', 'parallel', 'records', 'scan',
+           'synthetic', 'yama']
+
+
+def __getattr__(name):
+    # submodules are imported on first access (PEP 562)
+    if name in __all__:
+        return importlib.import_module(f'{__name__}.{name}')
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
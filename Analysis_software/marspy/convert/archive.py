@@ -1,188 +1,363 @@
+import sys
+import warnings
+
+import numpy as np
 import pandas as pd
-from jnius import autoclass
 
-from awesome_data import DataSet
+from marspy.convert.cache import TableCache
+from marspy.convert.collection import ArchiveCollection, ArchiveInstances
+from marspy.convert.columnar import extract_archive
+from marspy.convert.diskcache import DiskCache
 from marspy.convert.molecule import *
+from marspy.convert.parallel import MoleculePayload, process_map, thread_map
+from marspy.convert.scan import CONDITION_FIELDS, scan_archive
+from marspy.convert.yama import read_yama
+from marspy.instrument import stage
 
 
 class Archive:
+    # all instantiated archives (one per filepath, a re-instantiated archive replaces and releases the previous one)
+    collection = ArchiveCollection()
+    # archives of the class in collection, e.g. DnaMoleculeArchive.instances
+    instances = ArchiveInstances()
 
-    def __init__(self, filepath):
+    def __init__(self, filepath, memory_budget=None, workers=1, archive_link=None, bulk=False, cache_dir=None,
+                 reader='jvm', compact=False):
         self.filepath = filepath
         self.name = self.filepath.split('/')[-1]
-        self.File = autoclass('java.io.File')
-        self.yamaFile = self.File(self.filepath)
+        # LRU cache shared by all molecules, memory_budget (bytes) limits the tables kept in memory
+        self.cache = TableCache(max_bytes=memory_budget)
+        # number of threads used to convert molecules
+        self.workers = workers
+        # archive_link can be provided directly (e.g. stand-ins from marspy.convert.records)
+        self.archive_link = archive_link
+        # bulk extraction of all molecule tables into one ColumnarStore
+        self.bulk = bulk
+        self.store = None
+        # directory of the persistent conversion cache (None: no disk cache)
+        self.cache_dir = cache_dir
+        # 'jvm': open .yama file with MARS, 'native': read .yama file without JVM (marspy.convert.yama)
+        if reader not in ('jvm', 'native'):
+            raise MarsPyException(f'Unknown reader {reader}. Use jvm or native.')
+        self.reader = reader
+        # narrow dtypes of molecule tables where lossless (float32 / int32, categorical strings)
+        self.compact = compact
+        # structured array of all molecule regions (see region_array), set up by index_molecules
+        self.regions = region_array([])
+        # single-pass scan of metadata parameters and molecule tags (see scan_archive_link)
+        self.scan = None
+
+    def open_archive_link(self, java_class, accept_tag=None):
+        """
+        Opens .yama file as instance of the passed MARS archive class (unless archive_link was provided).
+        If a cache_dir was set, the archive is loaded from the disk cache without starting the JVM. On a cache miss
+        the archive is opened through the JVM (or read natively) and written to the cache.
+        accept_tag: native reader only keeps tables of accepted molecules (ignored with disk cache)
+        """
+        if self.archive_link is not None:
+            return
+        if self.cache_dir is not None:
+            disk_cache = DiskCache(self.cache_dir)
+            # the .yama file is hashed at most once for lookup and store (not at all on a hit)
+            file_fingerprint = disk_cache.fingerprint(self.filepath)
+            self.archive_link = disk_cache.load(self.filepath, file_fingerprint=file_fingerprint)
+            if self.archive_link is not None:
+                return
+
+        with stage('open_archive'):
+            if self.reader == 'native':
+                # the disk cache needs all tables
+                self.archive_link = read_yama(self.filepath, accept_tag=None if self.cache_dir else accept_tag)
+            else:
+                from jnius import autoclass
+                self.File = autoclass('java.io.File')
+                self.yamaFile = self.File(self.filepath)
+                self.Archive = autoclass(java_class)
+                self.archive_link = self.Archive(self.yamaFile)
+
+        if self.cache_dir is not None:
+            disk_cache.store(self.filepath, self.archive_link, file_fingerprint=file_fingerprint)
+
+    def create_molecules(self, uids, factory):
+        """
+        Instantiates molecules for all uids. factory(uid, snapshot, store) returns the molecule object.
+        With bulk extraction all records are read in one pass and their tables are concatenated into the
+        archive-wide ColumnarStore (self.store), molecule DataFrames are views on it.
+        Tags collected by scan_archive_link are passed on and not read from the records again.
+        """
+        tags = None if self.scan is None else self.scan.tags
+        with stage('create_molecules'):
+            if self.bulk:
+                snapshots, self.store = extract_archive(self.archive_link, uids, workers=self.workers, tags=tags)
+                if self.compact:
+                    self.store = self.store.compact()
+                return [factory(uid, snapshots[uid], self.store) for uid in uids]
+            return thread_map(lambda uid: factory(uid, fetch_snapshot(self.archive_link, uid,
+                                                                      tags=None if tags is None else tags[uid]), None),
+                              uids, workers=self.workers)
+
+    def scan_archive_link(self, fields=CONDITION_FIELDS):
+        """
+        Reads metadata parameters and molecule tags of the archive in a single pass (see scan_archive) and sets
+        metadata_uids and one attribute per condition field (e.g. nucleotide, nacl, mcm).
+        Returns ArchiveScan (also kept as self.scan)
+        """
+        with stage('scan'):
+            self.scan = scan_archive(self.archive_link, fields=fields, workers=self.workers)
+        self.metadata_uids = self.scan.metadata_uids
+        for name, value in self.scan.conditions.items():
+            setattr(self, name, value)
+        return self.scan
+
+    def index_molecules(self):
+        """
+        Builds the UID -> molecule hash index and the inverted tag -> UIDs index and packs all molecule regions into
+        one structured array (self.regions, molecules keep views on it).
+        Called after self.molecules was set up, kept up to date by add_tag / remove_tag.
+        """
+        self.uid_index = {molecule.uid: molecule for molecule in self.molecules}
+        # position of molecule in self.molecules (used to return query results in archive order)
+        self._positions = {molecule.uid: position for position, molecule in enumerate(self.molecules)}
+        self.tag_index = dict()
+        for molecule in self.molecules:
+            for tag in molecule.tags:
+                self.tag_index.setdefault(tag, set()).add(molecule.uid)
+        # define archive tags union of all molecule tags
+        self.tags = set(self.tag_index)
+
+        self.regions = region_array([region for molecule in self.molecules for region in molecule._region_rows()])
+        offsets = np.cumsum([0] + [len(molecule._regions) for molecule in self.molecules])
+        for molecule, start, end in zip(self.molecules, offsets[:-1], offsets[1:]):
+            molecule._regions = self.regions[start:end]
 
     def get_molecule_by_uid(self, uid):
-        raise NotImplementedError
+        """
+        Returns molecule object with provided UID.
+        """
+        try:
+            return self.uid_index[uid]
+        except KeyError:
+            raise MarsPyException(f'Molecule {uid} not found in archive {self.name}.')
 
-    def get_molecules_by_tags(self, tags):
-        raise NotImplementedError
+    def get_molecules_by_tags(self, tags=(), any_tags=(), exclude_tags=()):
+        """
+        Provide tags as list.
+        Returns list of all molecules which have all the specified tags (AND), at least one of any_tags (OR)
+        and none of exclude_tags (NOT). Molecules are returned in archive order.
+        """
+        uids = self.get_uids_by_tags(tags=tags, any_tags=any_tags, exclude_tags=exclude_tags)
+        return [self.uid_index[uid] for uid in sorted(uids, key=self._positions.__getitem__)]
 
-    def validate_params(self):
-        pass
+    def get_uids_by_tags(self, tags=(), any_tags=(), exclude_tags=()):
+        """
+        Same query as get_molecules_by_tags, returns set of UIDs (unordered).
+        """
+        # AND: intersect starting from the smallest tag set
+        if tags:
+            tag_sets = sorted((self.tag_index.get(tag, set()) for tag in set(tags)), key=len)
+            uids = tag_sets[0].intersection(*tag_sets[1:])
+        else:
+            uids = None
+        # OR
+        if any_tags:
+            any_uids = set().union(*(self.tag_index.get(tag, set()) for tag in set(any_tags)))
+            uids = any_uids if uids is None else uids & any_uids
+        if uids is None:
+            uids = set(self.uid_index)
+        # NOT
+        for tag in set(exclude_tags):
+            uids = uids - self.tag_index.get(tag, set())
+        return uids
+
+    def add_tag(self, uid, tag):
+        """
+        Adds tag to molecule (Python representation only) and updates the tag index.
+        """
+        molecule = self.get_molecule_by_uid(uid)
+        if tag not in molecule.tags:
+            molecule.tags.append(tag)
+        self.tag_index.setdefault(tag, set()).add(uid)
+        self.tags.add(tag)
 
+    def remove_tag(self, uid, tag):
+        """
+        Removes tag from molecule (Python representation only) and updates the tag index.
+        """
+        molecule = self.get_molecule_by_uid(uid)
+        if tag in molecule.tags:
+            molecule.tags.remove(tag)
+        uids = self.tag_index.get(tag)
+        if uids is not None:
+            uids.discard(uid)
+            # drop tags no molecule carries anymore
+            if not uids:
+                del self.tag_index[tag]
+                self.tags.discard(tag)
 
-class SingleMoleculeArchive(Archive):
-    instances = []
-
-    def __init__(self, filepath, accept_tag, label=dict()):
-        Archive.__init__(self, filepath)
-        self.instances.append(self)
-        self.Archive = autoclass('de.mpg.biochem.mars.molecule.SingleMoleculeArchive')
-        self.archive_link = self.Archive(self.yamaFile)
-        self.metadata_uids = tuple(sc.to_python(self.archive_link.getMetadataUIDs()))
-        self.label = label
+    def __len__(self):
+        return len(self.molecules)
 
-        # nucleotide
-        # check if all metadata parameters match & raise warning if conditions to in one archive are not identical
-        if len({self.archive_link.getMetadata(metadata_uid).getStringParameter('nucleotide')
-                for metadata_uid in self.metadata_uids}) > 1:
-            raise MarsPyWarning()
-        # if StringParameter is not set, getStringParameter returns empty string ''
-        if len(self.archive_link.getMetadata(self.metadata_uids[0]).getStringParameter('nucleotide')) == 0:
-            # default n/a
-            self.nucleotide = 'n/a'
-            print(f'nucleotide not found. Setting default to {self.nucleotide}')
-        # parameter properly set
-        else:
-            self.nucleotide = self.archive_link.getMetadata(self.metadata_uids[0]).getStringParameter('nucleotide')
-
-        # NaCl concentration
-        # check if all metadata parameters match & raise warning if conditions to in one archive are not identical
-        if len({self.archive_link.getMetadata(metadata_uid).getStringParameter('nacl')
-                for metadata_uid in self.metadata_uids}) > 1:
-            raise MarsPyWarning()
-        # if StringParameter is not set, getStringParameter returns empty string ''
-        if len(self.archive_link.getMetadata(self.metadata_uids[0]).getStringParameter('nucleotide')) == 0:
-            # default n/a
-            self.nacl = 'n/a'
-            print(f'NaCl concentration not found. Setting default to {self.nacl}')
-        # parameter properly set
-        else:
-            self.nacl = self.archive_link.getMetadata(self.metadata_uids[0]).getStringParameter('nacl')
-
-        # MCM variant
-        # check if all metadata parameters match & raise warning if conditions to in one archive are not identical
-        if len({self.archive_link.getMetadata(metadata_uid).getStringParameter('mcm')
-                for metadata_uid in self.metadata_uids}) > 1:
-            raise MarsPyWarning()
-        # if StringParameter is not set, getStringParameter returns empty string ''
-        if len(self.archive_link.getMetadata(self.metadata_uids[0]).getStringParameter('mcm')) == 0:
-            # default n/a
-            self.mcm = 'n/a'
-            print(f'MCM variant not found. Setting default to {self.mcm}')
-        # parameter properly set
-        else:
-            self.mcm = self.archive_link.getMetadata(self.metadata_uids[0]).getStringParameter('mcm')
+    def validate_params(self):
+        pass
 
-        self.protein = list(self.label.keys())[0]
+    def clear_cache(self):
+        """
+        Releases all converted tables. They are reloaded on next access.
+        """
+        self.cache.clear()
 
-        # instantiate a new SingleMolecule for each uid and store instances as list
-        self.molecules = [SingleMolecule(uid, self.protein, archive=self.archive_link) for uid in
-                          sc.to_python(self.archive_link.getMoleculeUIDs()) if
-                          self.archive_link.get(uid).hasTag(accept_tag)]
-        self.tags = set()
+    def release(self):
+        """
+        Releases everything the archive holds (called when the archive is replaced in an ArchiveCollection):
+        converted tables, SegmentsTables, the ColumnarStore, the region array, the indices and the link to the
+        archive. The archive has no molecules afterwards, instantiate it again to use it.
+        """
+        self.cache.clear()
         for molecule in self.molecules:
-            self.tags.update(molecule.tags)
-
-    def get_molecule_by_uid(self, uid):
+            molecule.seg_dfs = None
+            # molecules kept elsewhere must not keep the store / archive alive
+            molecule.store = None
+            molecule.archive = None
+            molecule._regions = region_array([])
+        self.molecules = list()
+        self.store = None
+        self.archive_link = None
+        self.scan = None
+        self.index_molecules()
+
+    def memory_usage(self):
         """
-        Returns molecule object with provided UID.
+        Approximate memory footprint (bytes) of the archive per component.
+        Returns pandas Series (molecule objects, regions, cached tables, columnar store, SegmentsTables, indices and
+        total)
+        """
+        objects = sum(sys.getsizeof(molecule) + sys.getsizeof(molecule.params) + sys.getsizeof(molecule.tags) +
+                      sys.getsizeof(molecule.columns) for molecule in self.molecules)
+        # tables assigned to SegmentsTables and cached pause detection results (raw tables are part of the cache)
+        segments = sum(int(df.memory_usage(index=True, deep=True).sum())
+                       for molecule in self.molecules if molecule._seg_dfs for seg_df in molecule._seg_dfs
+                       for df in [seg_df._raw, *seg_df.results.values()] if df is not None)
+        indices = sum(sys.getsizeof(index) for index in (self.uid_index, self._positions, self.tag_index))
+        usage = pd.Series({'molecules': objects,
+                           'regions': self.regions.nbytes,
+                           'cache': self.cache.nbytes,
+                           'store': 0 if self.store is None else self.store.nbytes,
+                           'segments_tables': segments,
+                           'indices': indices}, name='bytes')
+        usage['total'] = usage.sum()
+        return usage
+
+    def map(self, fn, workers=1, chunksize=16, noidle=False, segments=False, errors='warn'):
         """
-        return list(filter(lambda molecule: molecule.uid == uid, self.molecules))[0]
+        Applies fn to all molecules in worker processes. Molecules are shipped as MoleculePayloads (uid, params,
+        tags, prefixes, table and SegmentsTables as NumPy arrays, see marspy.convert.parallel).
+        fn: picklable (module-level) function fn(payload)
+        workers: number of processes (1: run in this process)
+        chunksize: molecules per task
+        noidle: ship df_noidle instead of df (run add_df_noidle first)
+        segments: ship SegmentsTables
+        errors: 'warn' (default), 'raise' or 'ignore' - how failures of single molecules are reported
+        Returns list of results in order of archive.molecules (MoleculeFailure for molecules fn failed for)
+        """
+        results, failures = process_map(fn, self._payloads(noidle, segments), workers=workers, chunksize=chunksize)
+        self._report_failures(failures, errors)
+        return results
 
-    def get_molecules_by_tags(self, tags):
+    def reduce(self, fn, reducer, initial=None, workers=1, chunksize=16, noidle=False, segments=False,
+               errors='warn'):
         """
-        Provide tags as list.
-        Returns filter of all molecules which have all the specified tags
+        Map-reduce over all molecules: results of fn (see map) are combined with reducer(a, b) within each worker
+        chunk first and then across chunks (in archive order). Failed molecules are skipped.
+        reducer: picklable (module-level) function, needs to be associative
+        initial: start value (default None: first result)
+        """
+        partials, failures = process_map(fn, self._payloads(noidle, segments), workers=workers, chunksize=chunksize,
+                                         reducer=reducer)
+        self._report_failures(failures, errors)
+        if initial is not None:
+            partials = [initial] + partials
+        if not partials:
+            return None
+        value = partials[0]
+        for partial in partials[1:]:
+            value = reducer(value, partial)
+        return value
+
+    def _payloads(self, noidle, segments):
+        return (MoleculePayload.from_molecule(molecule, noidle=noidle, segments=segments)
+                for molecule in self.molecules)
+
+    @staticmethod
+    def _report_failures(failures, errors):
+        if not failures or errors == 'ignore':
+            return
+        message = f'{len(failures)} molecule(s) failed:\n' + '\n'.join(
+            f'{failure.uid}: {failure.error}' for failure in failures)
+        if errors == 'raise':
+            raise MarsPyException(message)
+        warnings.warn(message, MarsPyWarning)
+
+    def summarize(self, metrics=None, prefix_metrics=None):
         """
-        return filter(lambda molecule: set(tags).issubset(set(molecule.tags)), self.molecules)
+        Per-molecule summary table of this archive, see summarize_molecules().
+        """
+        return summarize_molecules([self], metrics=metrics, prefix_metrics=prefix_metrics)
 
-    def __len__(self):
-        return len(self.molecules)
+
+class SingleMoleculeArchive(Archive):
+    def __init__(self, filepath, accept_tag, label=dict(), memory_budget=None, workers=1, archive_link=None,
+                 bulk=False, cache_dir=None, reader='jvm', compact=False):
+        Archive.__init__(self, filepath, memory_budget=memory_budget, workers=workers, archive_link=archive_link,
+                         bulk=bulk, cache_dir=cache_dir, reader=reader, compact=compact)
+        self.open_archive_link('de.mpg.biochem.mars.molecule.SingleMoleculeArchive', accept_tag=accept_tag)
+        self.scan_archive_link()
+        self.label = label
+
+        self.protein = list(self.label.keys())[0]
+
+        # instantiate a new SingleMolecule for each uid and store instances as list
+        accepted_uids = self.scan.uids_with_tag(accept_tag)
+        self.molecules = self.create_molecules(
+            accepted_uids, lambda uid, snapshot, store: SingleMolecule(uid, self.protein, archive=self.archive_link,
+                                                                       cache=self.cache, snapshot=snapshot,
+                                                                       store=store, compact=self.compact))
+        self.index_molecules()
+        self.collection.add(self)
 
 
 class DnaMoleculeArchive(Archive):
-    instances = []
-
-    def __init__(self, filepath, accept_tag, labels=dict()):
-        Archive.__init__(self, filepath)
-        self.instances.append(self)
-        self.Archive = autoclass('de.mpg.biochem.mars.molecule.DnaMoleculeArchive')
-        self.archive_link = self.Archive(self.yamaFile)
-        self.metadata_uids = tuple(sc.to_python(self.archive_link.getMetadataUIDs()))
-        self.dna_molecule_count = 0
-        for metadata in self.metadata_uids:
-            self.dna_molecule_count += dict(sc.to_python(self.archive_link.getMetadata(metadata).getParameters()))[
-                'DnaMoleculeCount']
+    def __init__(self, filepath, accept_tag, labels=dict(), memory_budget=None, workers=1, archive_link=None,
+                 bulk=False, cache_dir=None, reader='jvm', compact=False):
+        Archive.__init__(self, filepath, memory_budget=memory_budget, workers=workers, archive_link=archive_link,
+                         bulk=bulk, cache_dir=cache_dir, reader=reader, compact=compact)
+        self.open_archive_link('de.mpg.biochem.mars.molecule.DnaMoleculeArchive', accept_tag=accept_tag)
+        self.scan_archive_link()
         # subtract # of reject_dna tags
-        self.dna_molecule_count -= len(list(filter(lambda uid:
-                                                   self.archive_link.get(uid).hasTag('reject_dna'),
-                                                   sc.to_python(self.archive_link.moleculeUIDs))))
+        self.dna_molecule_count = (self.scan.sum_metadata_param('DnaMoleculeCount') -
+                                   self.scan.count_tag('reject_dna'))
         self.labels = labels
 
-        # nucleotide
-        # check if all metadata parameters match & raise warning if conditions to in one archive are not identical
-        if len({self.archive_link.getMetadata(metadata_uid).getStringParameter('nucleotide')
-                for metadata_uid in self.metadata_uids}) > 1:
-            raise MarsPyWarning()
-        # if StringParameter is not set, getStringParameter returns empty string ''
-        if len(self.archive_link.getMetadata(self.metadata_uids[0]).getStringParameter('nucleotide')) == 0:
-            # default n/a
-            self.nucleotide = 'n/a'
-            print(f'nucleotide not found. Setting default to {self.nucleotide}')
-        # parameter properly set
-        else:
-            self.nucleotide = self.archive_link.getMetadata(self.metadata_uids[0]).getStringParameter('nucleotide')
-
-        # NaCl concentration
-        # check if all metadata parameters match & raise warning if conditions to in one archive are not identical
-        if len({self.archive_link.getMetadata(metadata_uid).getStringParameter('nacl')
-                for metadata_uid in self.metadata_uids}) > 1:
-            raise MarsPyWarning()
-        # if StringParameter is not set, getStringParameter returns empty string ''
-        if len(self.archive_link.getMetadata(self.metadata_uids[0]).getStringParameter('nucleotide')) == 0:
-            # default n/a
-            self.nacl = 'n/a'
-            print(f'NaCl concentration not found. Setting default to {self.nacl}')
-        # parameter properly set
-        else:
-            self.nacl = self.archive_link.getMetadata(self.metadata_uids[0]).getStringParameter('nacl')
-
-        # MCM variant
-        # check if all metadata parameters match & raise warning if conditions to in one archive are not identical
-        if len({self.archive_link.getMetadata(metadata_uid).getStringParameter('mcm')
-                for metadata_uid in self.metadata_uids}) > 1:
-            raise MarsPyWarning()
-        # if StringParameter is not set, getStringParameter returns empty string ''
-        if len(self.archive_link.getMetadata(self.metadata_uids[0]).getStringParameter('mcm')) == 0:
-            # default n/a
-            self.mcm = 'n/a'
-            print(f'MCM variant not found. Setting default to {self.mcm}')
-        # parameter properly set
-        else:
-            self.mcm = self.archive_link.getMetadata(self.metadata_uids[0]).getStringParameter('mcm')
-
         self.proteins = set()
 
         # will get all columns in DataTable with 'Protein_n_Position_on_Dna'
-        for match in re.findall('\w+_Position_on_DNA', '$'.join(set(sc.to_python(
+        for match in re.findall('\w+_Position_on_DNA', '$'.join(set(to_python(
                 self.archive_link.properties().getColumnSet())))):
             self.proteins.add(match.split('_')[0])
 
         # instantiate a new DnaMolecule for each uid and store instances as list
-        self.molecules = [DnaMolecule(uid, self.proteins, archive=self.archive_link) for uid in
-                          sc.to_python(self.archive_link.getMoleculeUIDs())
-                          if self.archive_link.get(uid).hasTag(accept_tag)]
-
-        # define archive tags union of all molecule tags
+        accepted_uids = self.scan.uids_with_tag(accept_tag)
+        self.molecules = self.create_molecules(
+            accepted_uids, lambda uid, snapshot, store: DnaMolecule(uid, self.proteins, archive=self.archive_link,
+                                                                    cache=self.cache, snapshot=snapshot,
+                                                                    store=store, compact=self.compact))
+
+        # UID and tag indices (also defines archive tags as union of all molecule tags)
+        self.index_molecules()
         # define archive prefixes as union of all molecule prefixes (will be used for top level columns in big df later)
-        self.tags = set()
         self.prefixes = set()
         for molecule in self.molecules:
-            self.tags.update(molecule.tags)
             self.prefixes.update(molecule.prefixes)
+        self.collection.add(self)
 
     def validate_params(self):
         """
@@ -200,31 +375,40 @@ class DnaMoleculeArchive(Archive):
 
         return 'passed'
 
-    def add_segments_tables(self):
+    def add_segments_tables(self, types=None, prefixes=None, lazy=True):
         """
-        Attach all segment tables to molecule records (stored as dict)
+        Attach segment tables to molecule records (stored as list in molecule.seg_dfs).
+        types: SegmentsTable types to attach, e.g. ['rate'] (default None: 'rate' and 'bleaching')
+        prefixes: prefixes to attach, e.g. ['Cohesin_1_'] (default None: all)
+        lazy: Set to False to convert all selected tables right away (otherwise on first access of SegmentsTable.df)
+        Table names are resolved on first access of molecule.seg_dfs. Raw tables are kept in the archive's TableCache
+        and reused if add_segments_tables is called again with another selection.
         """
+        if isinstance(types, str):
+            types = [types]
+        if isinstance(prefixes, str):
+            prefixes = [prefixes]
+        if types is not None and not set(types).issubset(SEGMENTS_TYPES.values()):
+            raise MarsPyException(f'Unknown SegmentsTable type in {list(types)}. Use rate and/or bleaching.')
+        segments_filter = (None if types is None else frozenset(types),
+                           None if prefixes is None else frozenset(prefixes))
         for molecule in self.molecules:
-            molecule.seg_dfs = list()
-
-            # all segmentTableNames
-            for x, y, region in (sc.to_python(self.archive_link.get(molecule.uid).getSegmentsTableNames())):
-                # internal control that all seg_dfs are valid
-                _assigned = False
-                # all proteins on molecule
-                for prefix in molecule.prefixes:
-                    if re.match(prefix, x) and re.match(prefix, y):
-                        molecule.seg_dfs.append(SegmentsTable(molecule=molecule, prefix=prefix,
-                                                              col_x=x, col_y=y, region=region))
-                        _assigned = True
-                        break
-                if not _assigned:
-                    err_message = f"Conflict in molecule {molecule.uid}!\nSegmentTable {x} {y} {region} not assigned!"
-                    raise MarsPyException(err_message)
-
-    def detect_pauses(self, thresh=200, sigma_max=30, global_thresh=True, length=1, col='B'):
+            molecule.seg_dfs = None
+            molecule.segments_requested = True
+            molecule.segments_filter = segments_filter
+            # df_noidle depends on the attached SegmentsTables
+            self.cache.discard((molecule.uid, 'noidle_mask'))
+            self.cache.discard((molecule.uid, 'df_noidle'))
+        if not lazy:
+            thread_map(lambda molecule: [seg_df.raw for seg_df in molecule.seg_dfs], self.molecules,
+                       workers=self.workers)
+
+    def detect_pauses(self, thresh=200, sigma_max=30, global_thresh=True, length=1, col='B', batch=False):
         """
         Detect pauses in translocation for all SegmentTables of all molecules in archive.
+        Pauses are always detected on the raw SegmentsTables, results are cached per parameter tuple (repeated calls
+        with the same parameters only switch the active result). Use sweep_pauses to compare many parameter sets.
+        batch: Set to True to process all rate SegmentsTables of the archive in one concatenated pass
         Also see detect_pauses() in SegmentsTable object:
 
             Detection pauses in SegmentTable (only for type = 'rate', others are skipped)
@@ -235,89 +419,270 @@ class DnaMoleculeArchive(Archive):
             If global_thresh is False, a molecule-specific threshold is calculated with thresh^-1 * np.mean(col)
             col: column evaluated for pauses
         """
+        with stage('detect_pauses'):
+            if batch:
+                self._detect_pauses_batch(thresh=thresh, sigma_max=sigma_max, global_thresh=global_thresh,
+                                          length=length, col=col)
+            else:
+                for molecule in self.molecules:
+                    seg_dfs = molecule.seg_dfs
+                    with stage('molecule_pauses', molecule.uid):
+                        for seg_df in seg_dfs:
+                            seg_df.detect_pauses(thresh=thresh, sigma_max=sigma_max, global_thresh=global_thresh,
+                                                 length=length, col=col)
+
         for molecule in self.molecules:
-            for seg_df in molecule.seg_dfs:
-                seg_df.detect_pauses(thresh=thresh, sigma_max=sigma_max, global_thresh=global_thresh, length=length,
-                                     col=col)
+            # df_noidle depends on detected pauses
+            self.cache.discard((molecule.uid, 'noidle_mask'))
+            self.cache.discard((molecule.uid, 'df_noidle'))
 
-    def add_df_noidle(self, prefix):
+    def _detect_pauses_batch(self, thresh, sigma_max, global_thresh, length, col):
+        """
+        Pause detection for all rate SegmentsTables concatenated into one DataFrame.
+        Only SegmentsTables without cached result for these parameters are processed.
+        """
+        params = (thresh, sigma_max, global_thresh, length, col)
+        seg_dfs = [seg_df for molecule in self.molecules for seg_df in molecule.seg_dfs
+                   if seg_df.type == 'rate' and not seg_df.use_result(params)]
+        if not seg_dfs:
+            return
+
+        df = pd.concat([seg_df.raw for seg_df in seg_dfs], ignore_index=True)
+        # SegmentsTable each row belongs to
+        groups = np.repeat(np.arange(len(seg_dfs)), [len(seg_df.raw) for seg_df in seg_dfs])
+        df['pause_' + col] = flag_pauses(df, thresh=thresh, sigma_max=sigma_max, global_thresh=global_thresh,
+                                         length=length, col=col, groups=groups)
+        df['_group'] = groups
+        df = merge_pauses(df, pause_col='pause_' + col, groups=groups)
+
+        # split back into SegmentsTables
+        bounds = np.searchsorted(df['_group'].to_numpy(), np.arange(len(seg_dfs) + 1))
+        df = df.drop(columns='_group')
+        for seg_df, start, end in zip(seg_dfs, bounds[:-1], bounds[1:]):
+            seg_df.set_result(params, df.iloc[start:end].reset_index(drop=True))
+
+    def sweep_pauses(self, thresholds, sigma_max=30, global_thresh=True, length=1, col='B', prefix=None):
+        """
+        Evaluates pause detection for a grid of parameters on the raw rate SegmentsTables of all molecules in one
+        vectorized pass (see sweep_pauses() in marspy.convert.molecule). Detected pauses and df_noidle are unchanged.
+        thresholds, sigma_max, length: scalars or sequences, every combination is evaluated
+        prefix: only use SegmentsTables of this prefix (default: all)
+        Returns DataFrame with one row per setting: pauses, pause_segments, idle_time, total_time and fraction_idle
+        """
+        seg_dfs = [seg_df for molecule in self.molecules for seg_df in molecule.seg_dfs
+                   if seg_df.type == 'rate' and (prefix is None or seg_df.prefix == prefix)]
+        if not seg_dfs:
+            raise MarsPyException(f'No rate SegmentsTables found in archive {self.name}. Run add_segments_tables first.')
+        df = pd.concat([seg_df.raw for seg_df in seg_dfs], ignore_index=True)
+        groups = np.repeat(np.arange(len(seg_dfs)), [len(seg_df.raw) for seg_df in seg_dfs])
+        return sweep_pauses(df, thresholds, sigma_max=sigma_max, global_thresh=global_thresh, length=length, col=col,
+                            groups=groups)
+
+    def analyze_bleaching(self, prefixes=None, col='A', min_step=0.):
+        """
+        Photobleaching steps of all bleaching SegmentsTables in one vectorized pass (see bleaching_steps() in
+        marspy.convert.molecule) compared with the {protein}_bleaching_steps parameter of each molecule.
+        Need to run add_segments_tables (types including 'bleaching') first!
+        prefixes: only analyze these prefixes (default: all)
+        col: column with segment levels (default A)
+        min_step: minimal intensity drop counted as step
+        Returns DataFrame (index: uid, prefix, region) with steps, step_sizes, initial_intensity, final_intensity,
+        lifetime, protein_steps (steps of all prefixes of the protein on the molecule in the same region, independent
+        of prefixes), expected_steps (parameter, NaN if not set) and mismatch (protein_steps != expected_steps)
+        """
+        # steps are detected on all bleaching tables, so that protein_steps covers every prefix of the protein
+        seg_dfs = [(molecule, seg_df) for molecule in self.molecules for seg_df in molecule.seg_dfs or ()
+                   if seg_df.type == 'bleaching']
+        if prefixes is not None:
+            proteins = {prefix.split('_')[0] for prefix in prefixes}
+            seg_dfs = [(molecule, seg_df) for molecule, seg_df in seg_dfs if seg_df.prefix.split('_')[0] in proteins]
+        if not seg_dfs or (prefixes is not None and not any(seg_df.prefix in prefixes for _, seg_df in seg_dfs)):
+            raise MarsPyException(f'No bleaching SegmentsTables found in archive {self.name}. '
+                                  f'Run add_segments_tables first.')
+
+        tables = [seg_df.df for _, seg_df in seg_dfs]
+        df = pd.concat(tables, ignore_index=True)
+        groups = np.repeat(np.arange(len(tables)), [len(table) for table in tables])
+        steps, step_sizes, initial, final, lifetime = bleaching_steps(df, groups, len(tables), col=col,
+                                                                      min_step=min_step)
+
+        proteins = [seg_df.prefix.split('_')[0] for _, seg_df in seg_dfs]
+        result = pd.DataFrame(dict(steps=steps, step_sizes=step_sizes, initial_intensity=initial,
+                                   final_intensity=final, lifetime=lifetime),
+                              index=pd.MultiIndex.from_tuples([(molecule.uid, seg_df.prefix, seg_df.region)
+                                                               for molecule, seg_df in seg_dfs],
+                                                              names=['uid', 'prefix', 'region']))
+        result['protein_steps'] = result['steps'].groupby([result.index.get_level_values('uid'), proteins,
+                                                           result.index.get_level_values('region')]).transform('sum')
+        result['expected_steps'] = [molecule.params.get(protein + '_bleaching_steps', np.nan)
+                                    for (molecule, _), protein in zip(seg_dfs, proteins)]
+        result['mismatch'] = result['expected_steps'].notna() & (result['protein_steps'] != result['expected_steps'])
+        if prefixes is not None:
+            result = result[result.index.get_level_values('prefix').isin(prefixes)]
+        return result
+
+    def calc_ars1_encounters(self, prefix='Cohesin_1_', barrier=None, barrier_prefix='MCM_1_',
+                             default_barrier=5557.5, ref_length=35.94, time_col='Time_(s)', noidle=True):
+        """
+        Encounters with ARS1 (or any other barrier) and their outcome for all molecules in one vectorized pass.
+        See calc_encounters() in marspy.convert.molecule.
+        Returns DataFrame (index: uid) with encounters, passes, blocks, pass_times and pass_diff
+        """
+        return calc_encounters(self.molecules, prefix=prefix, barrier=barrier, barrier_prefix=barrier_prefix,
+                               default_barrier=default_barrier, ref_length=ref_length, time_col=time_col,
+                               noidle=noidle)
+
+    def add_df_noidle(self, prefix, copy=True):
         """
         Generates a copy of molecule.df (df_noidle) with all rows removed falling in pause segments
+        df_noidle is generated on first access from the boolean row mask molecule.noidle_mask.
+        copy: Set to False to only keep the boolean mask, df_noidle is then generated on every access but never kept
+        in memory.
         Need to run detect_pauses first!
         """
         for molecule in self.molecules:
-
-            molecule.df_noidle = molecule.df.copy()
-            # list of rows marked for removal
-            drop_rows = []
-            # pause looping here
-
             for seg_df in filter(lambda df: df.type == 'rate' and df.prefix == prefix, molecule.seg_dfs):
-                try:
-                    for row, index in seg_df.df[seg_df.df['pause_B']].iterrows():
-                        pause_start = seg_df.df[seg_df.df['pause_B']].loc[row, 'X1']
-                        pause_end = seg_df.df[seg_df.df['pause_B']].loc[row, 'X2']
-
-                        for row2, index2 in molecule.df.iterrows():
-                            if pause_start <= molecule.df.loc[row2, seg_df.prefix + seg_df.col_x] <= pause_end:
-                                drop_rows.append(row2)
-
-                except KeyError:
+                if 'pause_B' not in seg_df.df.columns:
                     err_message = f"Conflict in molecule {molecule.uid}!\n\
                     No pauses were not detected yet!"
                     raise MarsPyException(err_message)
 
-            molecule.df_noidle.drop(drop_rows, inplace=True)
-            molecule.df_noidle.reset_index(drop=True, inplace=True)
+            molecule.noidle_prefix = prefix
+            molecule.noidle_copy = copy
+            # discard df_noidle generated for a previous prefix / previous pause detection
+            self.cache.discard((molecule.uid, 'noidle_mask'))
+            self.cache.discard((molecule.uid, 'df_noidle'))
 
-    def get_molecule_by_uid(self, uid):
-        """
-        Returns molecule object with provided UID.
-        """
-        return list(filter(lambda molecule: molecule.uid == uid, self.molecules))[0]
 
-    def get_molecules_by_tags(self, tags):
-        """
-        Provide tags as list.
-        Returns filter of all molecules which have all the specified tags
-        """
-        return filter(lambda molecule: set(tags).issubset(set(molecule.tags)), self.molecules)
-
-    def __len__(self):
-        return len(self.molecules)
-
-
-def instantiate_archive(name, datasets):
+def instantiate_archive(name, datasets, memory_budget=None, workers=1, bulk=False, cache_dir=None, reader='jvm',
+                        compact=False):
     """
     Instantiates passed archive from underlying dataset
+    name: archive name or list of archive names (several archives are opened in parallel if workers > 1)
+    memory_budget: maximal size (bytes) of converted tables kept in memory per archive (default None: no limit)
+    workers: number of threads used to convert molecules (per archive)
+    bulk: Set to True to extract all molecule tables at once into an archive-wide ColumnarStore
+    cache_dir: directory of the persistent conversion cache, archives are loaded from the cache without starting
+    the JVM if the .yama file is unchanged (default None: no disk cache)
+    reader: 'jvm' (default) opens .yama files with MARS, 'native' reads them without JVM
+    compact: Set to True to narrow dtypes of molecule tables where lossless (float32 / int32)
+    Returns archive (list of archives if a list of names was passed)
     """
+    from awesome_data import DataSet
     # check if we have the right data type
     for data in datasets:
         if not isinstance(data, DataSet):
             raise MarsPyException('Dataset contains non-compatible data type.')
+
+    options = dict(memory_budget=memory_budget, workers=workers, bulk=bulk, cache_dir=cache_dir, reader=reader,
+                   compact=compact)
+    if isinstance(name, str):
+        return _instantiate_archive(name, datasets, **options)
+
+    names = list(name)
+    archives = thread_map(lambda _name: _instantiate_archive(_name, datasets, **options),
+                          names, workers=len(names) if workers > 1 else 1)
+    # register archives in the order of passed names (independent of which archive finished first)
+    for archive in archives:
+        Archive.collection.add(archive)
+    return archives
+
+
+def _instantiate_archive(name, datasets, **options):
     data = list(filter(lambda dataset: dataset.name == name, datasets))[0]
     if data.archive_type == 'DnaMoleculeArchive':
-        DnaMoleculeArchive(filepath=data.filepath + data.name, accept_tag=data.accept_tag, labels=data.labels)
+        return DnaMoleculeArchive(filepath=data.filepath + data.name, accept_tag=data.accept_tag, labels=data.labels,
+                                  **options)
     elif data.archive_type == 'SingleMoleculeArchive':
-        SingleMoleculeArchive(filepath=data.filepath + data.name, accept_tag=data.accept_tag, label=data.labels)
+        return SingleMoleculeArchive(filepath=data.filepath + data.name, accept_tag=data.accept_tag,
+                                     label=data.labels, **options)
     else:
         raise MarsPyException(f'Failed to instantiate Archive {data.name}.')
 
 
+def _mcm_variant(archive, molecule):
+    # n/a for DnaMolecules without MCM on DNA, archive default if MCM is not labeled
+    proteins = getattr(molecule, 'proteins', {})
+    if 'MCM' in proteins and not proteins['MCM'] > 0:
+        return 'n/a'
+    return archive.mcm
+
+
+# default per-molecule metrics for summarize_molecules (called with archive, molecule)
+MOLECULE_METRICS = {
+    # DNA length is only defined for DnaMolecules
+    'dna_length': lambda archive, molecule: (molecule.calc_length_dna() if isinstance(molecule, DnaMolecule)
+                                             else np.nan),
+    'nucleotide': lambda archive, molecule: archive.nucleotide,
+    'nacl': lambda archive, molecule: archive.nacl,
+    'MCM_variant': _mcm_variant,
+    'tags': lambda archive, molecule: ','.join(molecule.tags),
+}
+
+# default per-prefix metrics for summarize_molecules (called with archive, molecule, prefix)
+PREFIX_METRICS = {
+    # mean intensity of the first 5 frames
+    'initial_intensity': lambda archive, molecule, prefix: molecule.df.iloc[:5][prefix + 'Intensity'].mean(),
+    # observation time (s) defined by tracking length
+    'timespan_(s)': lambda archive, molecule, prefix: molecule.df.filter(regex=prefix).dropna()[
+        prefix + 'Time_(s)'].max(),
+    'avg_position_on_dna': lambda archive, molecule, prefix: molecule.df[prefix + 'Position_on_DNA'].median(),
+}
+
+
+def summarize_molecules(archives, metrics=None, prefix_metrics=None):
+    """
+    Builds per-molecule summary table of passed archives in one go (values are collected column-wise first).
+    metrics: dict column name: function(archive, molecule) returning a scalar (default MOLECULE_METRICS)
+    prefix_metrics: dict property: function(archive, molecule, prefix) evaluated for every prefix of a molecule
+    (default PREFIX_METRICS)
+    Returns DataFrame (index: uid) with hierarchical columns (molecule, properties): general metrics as (name, ''),
+    prefix metrics as (prefix, property). Prefixes missing on a molecule are NaN.
+    """
+    metrics = MOLECULE_METRICS if metrics is None else metrics
+    prefix_metrics = PREFIX_METRICS if prefix_metrics is None else prefix_metrics
+    if isinstance(archives, Archive):
+        archives = [archives]
+
+    uids = list()
+    columns = {(name, ''): list() for name in metrics}
+    prefix_columns = dict()
+    for archive in archives:
+        for molecule in archive.molecules:
+            row = len(uids)
+            uids.append(molecule.uid)
+            with stage('summary_row', molecule.uid):
+                for name, metric in metrics.items():
+                    columns[(name, '')].append(metric(archive, molecule))
+                for prefix in getattr(molecule, 'prefixes', ()):
+                    for prop, metric in prefix_metrics.items():
+                        # (row, value) pairs, missing rows are filled with NaN below
+                        prefix_columns.setdefault((prefix, prop), list()).append(
+                            (row, metric(archive, molecule, prefix)))
+
+    for key in sorted(prefix_columns, key=lambda key: key[0]):
+        values = np.full(len(uids), np.nan, dtype=object)
+        for row, value in prefix_columns[key]:
+            values[row] = value
+        columns[key] = values
+
+    df = pd.DataFrame(columns, index=pd.Index(uids, name='uid'))
+    df.columns = pd.MultiIndex.from_tuples(list(columns), names=['molecule', 'properties'])
+    return df.infer_objects()
+
+
 def describe_archives(archives):
     """
     Describes passed archives by returning a pandsa DataFrame. Pass archives as iterable object
     """
-    df = pd.DataFrame(
-        columns=['# of datasets', '# of molecules', 'labeled proteins', 'nucleotide', 'NaCl concentration',
-                 'MCM variant', 'archive validation'])
+    columns = ['# of datasets', '# of molecules', 'labeled proteins', 'nucleotide', 'NaCl concentration',
+               'MCM variant', 'archive validation']
+    index, rows = list(), list()
     for archive in archives:
-        _temp_df = pd.DataFrame(index=[archive.name.split('.')[0]],
-                                data=[[len(archive.metadata_uids), len(archive),
-                                       '; '.join([label + '-' + protein for protein, label in archive.labels.items()]),
-                                       archive.nucleotide, archive.nacl, archive.mcm, archive.validate_params()]],
-                                columns=['# of datasets', '# of molecules', 'labeled proteins', 'nucleotide',
-                                         'NaCl concentration', 'MCM variant', 'archive validation'])
-        df = pd.concat([df, _temp_df])
+        index.append(archive.name.split('.')[0])
+        rows.append([len(archive.metadata_uids), len(archive),
+                     '; '.join([label + '-' + protein for protein, label in archive.labels.items()]),
+                     archive.nucleotide, archive.nacl, archive.mcm, archive.validate_params()])
+    df = pd.DataFrame(rows, index=index, columns=columns)
     df = df.infer_objects()
     return df
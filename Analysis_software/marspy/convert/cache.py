@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+class TableCache:
+    """
+    Archive-level LRU cache for molecule tables (DataFrames or arrays).
+    Entries are loaded on first access via the provided loader and the least recently used entries
+    are evicted as soon as the accumulated size exceeds max_bytes (max_bytes=None disables eviction).
+    Entries of size 0 (e.g. views on memory owned elsewhere) are kept apart and never evicted, evicting them would
+    free nothing.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        # current size of all cached entries in bytes
+        self.nbytes = 0
+        # key: (value, size in bytes) - ordered from least to most recently used
+        self._entries = OrderedDict()
+        # key: value of entries with size 0
+        self._free = dict()
+        # entries may be accessed from several threads (see marspy.convert.parallel)
+        self._lock = threading.RLock()
+
+    def get(self, key, loader, size=None):
+        """
+        Returns cached entry for key. On a cache miss loader() is called and its return value is cached.
+        size: bytes counted against max_bytes for a loaded entry (default: sizeof(value))
+        """
+        with self._lock:
+            if key in self._free:
+                return self._free[key]
+            try:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+            except KeyError:
+                pass
+        # load outside of the lock, other entries stay accessible meanwhile
+        value = loader()
+        self.put(key, value, size=size)
+        return value
+
+    def put(self, key, value, size=None):
+        """
+        Stores value for key and evicts least recently used entries if memory budget is exceeded.
+        size: bytes counted against max_bytes (default: sizeof(value))
+        """
+        if size is None:
+            size = sizeof(value)
+        with self._lock:
+            self.discard(key)
+            if size == 0:
+                self._free[key] = value
+                return
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            self._evict()
+
+    def discard(self, key):
+        """
+        Removes entry for key (if present).
+        """
+        with self._lock:
+            self._free.pop(key, None)
+            try:
+                _, size = self._entries.pop(key)
+            except KeyError:
+                return
+            self.nbytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._free.clear()
+            self.nbytes = 0
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        # never evict the most recent entry, otherwise an entry bigger than the budget would be reloaded forever
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.nbytes -= size
+
+    def __contains__(self, key):
+        return key in self._entries or key in self._free
+
+    def __len__(self):
+        return len(self._entries) + len(self._free)
+
+
+def sizeof(value):
+    """
+    Approximate memory footprint (bytes) of a cached entry.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True).sum())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return 0
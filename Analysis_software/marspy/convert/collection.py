@@ -0,0 +1,231 @@
+import threading
+from collections import OrderedDict
+
+from marspy.convert.molecule import MarsPyException
+from marspy.convert.scan import CONDITION_FIELDS
+
+
+class ArchiveCollection:
+    """
+    Archives kept by filepath (one archive per .yama file) with an index on the condition fields (e.g. nucleotide,
+    nacl, mcm). Adding an archive of a filepath already in the collection replaces the previous archive, which is
+    released (see Archive.release) unless release=False.
+    Queries return ArchiveSlices / MoleculeSelections referencing the molecules of the archives (nothing is copied).
+    """
+
+    def __init__(self, archives=(), fields=CONDITION_FIELDS, release=True):
+        self.fields = fields
+        self.release = release
+        # filepath: archive (in order of adding)
+        self._archives = OrderedDict()
+        # condition field name: value: set of filepaths
+        self.condition_index = {field.name: dict() for field in fields}
+        # filepath: indexed condition values (archive attributes may change after adding)
+        self._conditions = dict()
+        # archives are added from the threads of instantiate_archive
+        self._lock = threading.RLock()
+        for archive in archives:
+            self.add(archive)
+
+    def add(self, archive):
+        """
+        Adds archive (moves it to the end if it is already in the collection) and indexes its condition fields.
+        Returns archive
+        """
+        with self._lock:
+            previous = self._archives.pop(archive.filepath, None)
+            if previous is not None:
+                self._unindex(previous)
+            self._archives[archive.filepath] = archive
+            self._conditions[archive.filepath] = {field.name: getattr(archive, field.name, field.default)
+                                                  for field in self.fields}
+            for name, value in self._conditions[archive.filepath].items():
+                self.condition_index[name].setdefault(value, set()).add(archive.filepath)
+        if previous is not None and previous is not archive and self.release:
+            previous.release()
+        return archive
+
+    def remove(self, archive):
+        """
+        Removes archive (not released). Raises MarsPyException if archive is not in the collection.
+        """
+        with self._lock:
+            if self._archives.get(archive.filepath) is not archive:
+                raise MarsPyException(f'Archive {archive.name} not found in collection.')
+            del self._archives[archive.filepath]
+            self._unindex(archive)
+
+    def discard(self, archive):
+        """
+        Removes archive if present.
+        """
+        try:
+            self.remove(archive)
+        except MarsPyException:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._archives.clear()
+            self._conditions.clear()
+            for index in self.condition_index.values():
+                index.clear()
+
+    def _unindex(self, archive):
+        for name, value in self._conditions.pop(archive.filepath).items():
+            filepaths = self.condition_index[name][value]
+            filepaths.discard(archive.filepath)
+            if not filepaths:
+                del self.condition_index[name][value]
+
+    def __iter__(self):
+        return iter(list(self._archives.values()))
+
+    def __len__(self):
+        return len(self._archives)
+
+    def __contains__(self, archive):
+        return self._archives.get(getattr(archive, 'filepath', None)) is archive
+
+    def __getitem__(self, filepath):
+        try:
+            return self._archives[filepath]
+        except KeyError:
+            raise MarsPyException(f'No archive of {filepath} in collection.')
+
+    def of_type(self, archive_type):
+        """
+        Archives which are instances of archive_type (in order of adding).
+        """
+        return [archive for archive in self if isinstance(archive, archive_type)]
+
+    def conditions(self):
+        """
+        Values of each condition field present in the collection.
+        Returns dict: field name -> sorted list of values
+        """
+        with self._lock:
+            return {name: sorted(index, key=str) for name, index in self.condition_index.items()}
+
+    def select_archives(self, archive_type=None, **conditions):
+        """
+        Archives matching all conditions (field name=value or list of accepted values), e.g.
+        select_archives(nacl='150', mcm=['wt', 'dCt']). Archives are returned in order of adding.
+        archive_type: only archives which are instances of archive_type
+        """
+        with self._lock:
+            filepaths = None
+            for name, values in conditions.items():
+                if name not in self.condition_index:
+                    raise MarsPyException(f'Unknown condition {name}. Use one of {list(self.condition_index)}.')
+                if not isinstance(values, (list, tuple, set, frozenset)):
+                    values = [values]
+                matches = set().union(*(self.condition_index[name].get(value, set()) for value in values))
+                filepaths = matches if filepaths is None else filepaths & matches
+            archives = [archive for filepath, archive in self._archives.items()
+                        if filepaths is None or filepath in filepaths]
+        if archive_type is not None:
+            archives = [archive for archive in archives if isinstance(archive, archive_type)]
+        return archives
+
+    def select(self, tags=(), any_tags=(), exclude_tags=(), params=None, archive_type=None, **conditions):
+        """
+        Molecules of all archives matching conditions (see select_archives) which match the tag query (see
+        Archive.get_molecules_by_tags, uses the inverted tag index of each archive) and params.
+        params: dict parameter name: value or function(value) returning True for accepted values, molecules without
+        the parameter are left out, e.g. params={'MCM_bleaching_steps': lambda steps: steps >= 1}
+        Returns MoleculeSelection
+        """
+        slices = list()
+        for archive in self.select_archives(archive_type=archive_type, **conditions):
+            if tags or any_tags or exclude_tags:
+                molecules = archive.get_molecules_by_tags(tags=tags, any_tags=any_tags, exclude_tags=exclude_tags)
+            else:
+                molecules = archive.molecules
+            if params:
+                molecules = [molecule for molecule in molecules if _match_params(molecule.params, params)]
+            if molecules:
+                slices.append(ArchiveSlice(archive, molecules))
+        return MoleculeSelection(slices)
+
+
+def _match_params(molecule_params, params):
+    for name, value in params.items():
+        if name not in molecule_params:
+            return False
+        if callable(value):
+            if not value(molecule_params[name]):
+                return False
+        elif molecule_params[name] != value:
+            return False
+    return True
+
+
+class ArchiveSlice:
+    """
+    Subset of the molecules of an archive, all other attributes are the ones of the archive.
+    Can be passed where archives are expected (e.g. summarize_molecules, fit.pause_durations).
+    """
+
+    def __init__(self, archive, molecules):
+        self.archive = archive
+        self.molecules = molecules
+
+    def __getattr__(self, name):
+        return getattr(self.archive, name)
+
+    def __len__(self):
+        return len(self.molecules)
+
+    def __repr__(self):
+        return f'ArchiveSlice({self.archive.name}, {len(self.molecules)} molecules)'
+
+
+class MoleculeSelection:
+    """
+    Result of ArchiveCollection.select: one ArchiveSlice per archive with matching molecules (archives), iterating
+    yields the molecules of all archives.
+    """
+
+    def __init__(self, archives):
+        self.archives = archives
+
+    def __iter__(self):
+        for archive in self.archives:
+            yield from archive.molecules
+
+    def __len__(self):
+        return sum(len(archive.molecules) for archive in self.archives)
+
+    @property
+    def molecules(self):
+        return list(self)
+
+    @property
+    def uids(self):
+        return [molecule.uid for molecule in self]
+
+    def items(self):
+        """
+        Yields (archive, molecule) pairs.
+        """
+        for archive in self.archives:
+            for molecule in archive.molecules:
+                yield archive.archive, molecule
+
+    def summarize(self, metrics=None, prefix_metrics=None):
+        """
+        Per-molecule summary table of the selected molecules, see summarize_molecules().
+        """
+        from marspy.convert.archive import summarize_molecules
+        return summarize_molecules(self.archives, metrics=metrics, prefix_metrics=prefix_metrics)
+
+
+class ArchiveInstances:
+    """
+    Descriptor returning the archives of the class (and its subclasses) registered in Archive.collection, e.g.
+    DnaMoleculeArchive.instances.
+    """
+
+    def __get__(self, instance, owner):
+        return owner.collection.of_type(owner)
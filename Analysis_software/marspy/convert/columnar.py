@@ -0,0 +1,167 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from marspy.convert.molecule import MarsPyException, compact_array, snapshot_from_record, to_pandas
+from marspy.convert.parallel import thread_map
+
+
+class ColumnarStore:
+    """
+    Archive-wide columnar store of molecule DataTables: one concatenated NumPy array per column and per-molecule
+    row offsets. Molecules lacking a column are padded with NaN (0 for integer, None for non-numeric columns), padded
+    rows are never part of a molecule DataFrame.
+    Per-molecule DataFrames are views on the concatenated arrays and keep the dtypes of the converted tables.
+    """
+
+    def __init__(self, uids, arrays, offsets, molecule_columns, dtypes=None):
+        self.uids = list(uids)
+        # position of each molecule in offsets
+        self.positions = {uid: position for position, uid in enumerate(self.uids)}
+        # column name: concatenated array
+        self.arrays = arrays
+        # rows of molecule i: offsets[i]:offsets[i + 1]
+        self.offsets = offsets
+        # uid: column names of molecule (in DataTable order)
+        self.molecule_columns = molecule_columns
+        # uid: {column: dtype} of molecule columns whose dtype differs from the concatenated array
+        self.dtypes = dict() if dtypes is None else dtypes
+
+    @classmethod
+    def from_frames(cls, uids, frames):
+        """
+        Concatenates per-molecule DataFrames (same order as uids) into one ColumnarStore.
+        """
+        frames = list(frames)
+        builder = ColumnarBuilder(uids, [len(frame) for frame in frames])
+        for position, frame in enumerate(frames):
+            builder.add(position, frame)
+        return builder.finish()
+
+    def frame(self, uid):
+        """
+        DataFrame of molecule uid backed by views on the concatenated arrays.
+        """
+        position = self.positions[uid]
+        start, end = self.offsets[position], self.offsets[position + 1]
+        dtypes = self.dtypes.get(uid, {})
+        return pd.DataFrame({column: self.arrays[column][start:end] if column not in dtypes
+                             else self.arrays[column][start:end].astype(dtypes[column])
+                             for column in self.molecule_columns[uid]}, copy=False)
+
+    def column(self, column):
+        """
+        Returns concatenated array of column and molecule index (position in uids) of each row.
+        """
+        return self.arrays[column], np.repeat(np.arange(len(self.uids)), np.diff(self.offsets))
+
+    def compact(self):
+        """
+        ColumnarStore with narrowed dtypes (see compact_array in marspy.convert.molecule), per-molecule dtypes are
+        dropped.
+        """
+        return ColumnarStore(self.uids, {column: compact_array(array) for column, array in self.arrays.items()},
+                             self.offsets, self.molecule_columns)
+
+    def copied_nbytes(self, uid):
+        """
+        Bytes of the columns of frame(uid) which are copies (cast to the molecule's dtype) instead of views.
+        """
+        position = self.positions[uid]
+        n_rows = int(self.offsets[position + 1] - self.offsets[position])
+        return sum(n_rows * np.dtype(dtype).itemsize for dtype in self.dtypes.get(uid, {}).values())
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values()) + self.offsets.nbytes
+
+    def __len__(self):
+        return len(self.uids)
+
+
+class ColumnarBuilder:
+    """
+    Builds a ColumnarStore frame by frame: the concatenated arrays are allocated from the row counts known in advance
+    and each frame is copied in as soon as it is added, so converted frames do not need to be kept until all of them
+    are converted. Columns are promoted if a frame needs a wider dtype (object for non-numeric columns).
+    Frames may be added from several threads.
+    """
+
+    def __init__(self, uids, n_rows):
+        self.uids = list(uids)
+        self.offsets = np.zeros(len(self.uids) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(n_rows)
+        self.arrays = dict()
+        # column name: positions of the molecules holding the column
+        self.filled = dict()
+        # (uid, column): dtype of the molecule's column
+        self.part_dtypes = dict()
+        self.molecule_columns = dict()
+        self._lock = threading.Lock()
+
+    def add(self, position, frame):
+        """
+        Copies frame of the molecule at position (in uids) into the concatenated arrays.
+        """
+        uid = self.uids[position]
+        start, end = self.offsets[position], self.offsets[position + 1]
+        if len(frame) != end - start:
+            raise MarsPyException(f'Conflict in molecule {uid}!\nTable has {len(frame)} rows, expected {end - start}.')
+        with self._lock:
+            self.molecule_columns[uid] = list(frame.columns)
+            for column in frame.columns:
+                part = frame[column].to_numpy()
+                dtype = part.dtype if part.dtype.kind in 'biuf' else np.dtype(object)
+                array = self.arrays.get(column)
+                if array is None:
+                    array = self.arrays[column] = np.empty(self.offsets[-1], dtype=dtype)
+                    self.filled[column] = list()
+                elif array.dtype != dtype:
+                    promoted = (np.result_type(array.dtype, dtype) if array.dtype.kind != 'O' and dtype.kind != 'O'
+                                else np.dtype(object))
+                    if promoted != array.dtype:
+                        # e.g. int column of earlier molecules, float column of this one
+                        array = self.arrays[column] = array.astype(promoted)
+                array[start:end] = part
+                self.filled[column].append(position)
+                self.part_dtypes[(uid, column)] = part.dtype
+
+    def finish(self):
+        """
+        Pads the rows of molecules lacking a column and returns the ColumnarStore.
+        """
+        for column, array in self.arrays.items():
+            missing = np.ones(len(self.uids), dtype=bool)
+            missing[self.filled[column]] = False
+            padding = np.nan if array.dtype.kind == 'f' else 0 if array.dtype.kind in 'biu' else None
+            for position in np.flatnonzero(missing):
+                array[self.offsets[position]:self.offsets[position + 1]] = padding
+        dtypes = dict()
+        for (uid, column), dtype in self.part_dtypes.items():
+            # e.g. int column of a molecule concatenated with float columns of others
+            if dtype != self.arrays[column].dtype:
+                dtypes.setdefault(uid, dict())[column] = dtype.str
+        return ColumnarStore(self.uids, self.arrays, self.offsets,
+                             {uid: self.molecule_columns.get(uid, []) for uid in self.uids}, dtypes)
+
+
+def extract_archive(archive_link, uids, workers=1, tags=None):
+    """
+    Bulk extraction of all passed molecule records: each record is looked up once to read parameters, tags,
+    regions and its DataTable. Tables are converted one by one and copied into the ColumnarStore right away (see
+    ColumnarBuilder), at most one converted table per worker is held besides the store.
+    tags: dict uid: tags if already known (e.g. ArchiveScan.tags), not read again
+    Returns dict uid: MoleculeSnapshot and ColumnarStore
+    """
+    def fetch(uid):
+        record = archive_link.get(uid)
+        table = record.getTable()
+        return snapshot_from_record(record, table, tags=None if tags is None else tags[uid]), table
+
+    fetched = thread_map(fetch, uids, workers=workers)
+    snapshots = {uid: snapshot for uid, (snapshot, _) in zip(uids, fetched)}
+    builder = ColumnarBuilder(uids, [snapshot.n_rows for snapshot, _ in fetched])
+    thread_map(lambda position: builder.add(position, to_pandas(fetched[position][1])), range(len(fetched)),
+               workers=workers)
+    return snapshots, builder.finish()
@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import warnings
+
+import numpy as np
+
+from marspy.convert.columnar import ColumnarBuilder, ColumnarStore
+from marspy.convert.molecule import MarsPyWarning, snapshot_from_record, to_pandas, to_python
+from marspy.convert.records import ArchiveRecord, MetadataRecord, MoleculeRecord, RegionRecord
+from marspy.convert.scan import CONDITION_FIELDS
+
+# bump if the cache layout changes, old entries are ignored
+CACHE_VERSION = 3
+# default cache location (can be set with environment variable MARSPY_CACHE_DIR)
+DEFAULT_CACHE_DIR = os.environ.get('MARSPY_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'marspy'))
+
+
+def fingerprint(filepath, chunk_size=2 ** 20):
+    """
+    Fingerprint of a .yama file: absolute path, size, modification time and SHA-256 content hash.
+    Reads the whole file, see DiskCache.fingerprint to reuse the hash of a cached entry.
+    """
+    stat = os.stat(filepath)
+    content_hash = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            content_hash.update(chunk)
+    return dict(path=os.path.abspath(filepath), size=stat.st_size, mtime=stat.st_mtime,
+                sha256=content_hash.hexdigest(), version=CACHE_VERSION)
+
+
+class DiskCache:
+    """
+    Persistent on-disk cache of converted archives keyed by the .yama fingerprint.
+    Each entry is a directory with the fingerprint of the .yama file (fingerprint.json), a JSON manifest
+    (parameters, tags, regions, metadata records) and one file per table column (molecule DataTables and
+    SegmentsTables concatenated, see ColumnarStore): numeric columns as .npy files which are memory-mapped on load,
+    non-numeric columns as JSON (nothing is unpickled). Loading an entry does not require a JVM.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = DEFAULT_CACHE_DIR if cache_dir is None else cache_dir
+
+    def entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    @staticmethod
+    def key(file_fingerprint):
+        return hashlib.sha256(json.dumps(file_fingerprint, sort_keys=True).encode()).hexdigest()[:32]
+
+    def fingerprint(self, filepath):
+        """
+        Fingerprint of filepath. If an entry of the same path, size and modification time exists, its fingerprint
+        is returned without reading the file, otherwise the file is hashed (see fingerprint()). Content changes
+        keeping size and modification time are therefore not detected.
+        """
+        stat = os.stat(filepath)
+        path = os.path.abspath(filepath)
+        for _, file_fingerprint in self.fingerprints():
+            if (file_fingerprint['path'], file_fingerprint['size'], file_fingerprint['mtime']) == \
+                    (path, stat.st_size, stat.st_mtime) and file_fingerprint.get('version') == CACHE_VERSION:
+                return file_fingerprint
+        return fingerprint(filepath)
+
+    def load(self, filepath, file_fingerprint=None):
+        """
+        Returns cached archive as ArchiveRecord (same API as archive_link) or None if no valid entry exists.
+        Corrupt or incomplete entries are removed (None is returned, the archive needs to be converted again).
+        file_fingerprint: fingerprint of filepath (see DiskCache.fingerprint, computed if None), pass it on to store
+        on a cache miss
+        """
+        entry = self.entry(self.key(self.fingerprint(filepath) if file_fingerprint is None else file_fingerprint))
+        if not os.path.exists(os.path.join(entry, 'manifest.json')):
+            return None
+        try:
+            return self._load_entry(entry)
+        except (OSError, ValueError, KeyError, TypeError, EOFError) as error:
+            warnings.warn(f'Removing corrupt cache entry {entry} of {filepath}: {error!r}', MarsPyWarning)
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+
+    @staticmethod
+    def _load_entry(entry):
+        with open(os.path.join(entry, 'manifest.json')) as file:
+            manifest = json.load(file)
+
+        tables = _load_store(os.path.join(entry, 'tables'), manifest['tables'])
+        segments = _load_store(os.path.join(entry, 'segments'), manifest['segments'])
+
+        molecules = list()
+        for molecule in manifest['molecules']:
+            molecules.append(MoleculeRecord(
+                uid=molecule['uid'], metadata_uid=molecule['metadata_uid'], table=tables.frame(molecule['uid']),
+                parameters=molecule['parameters'], tags=molecule['tags'],
+                regions={name: RegionRecord(column, start, end) for name, column, start, end in molecule['regions']},
+                segments_tables={(x, y, region): segments.frame(segment_id)
+                                 for x, y, region, segment_id in molecule['segments_tables']},
+                # tables are views on the memory-mapped arrays
+                copy=False))
+        metadata = [MetadataRecord(record['uid'], parameters=record['parameters'],
+                                   string_parameters=record['string_parameters'])
+                    for record in manifest['metadata']]
+        return ArchiveRecord(molecules, metadata)
+
+    def store(self, filepath, archive_link, string_parameters=tuple(field.name for field in CONDITION_FIELDS),
+              file_fingerprint=None):
+        """
+        Converts all molecule and metadata records of archive_link and writes them to the cache.
+        string_parameters: metadata string parameters to keep (archive conditions)
+        file_fingerprint: fingerprint of filepath (computed if None)
+        Older entries of the same file are removed.
+        """
+        if file_fingerprint is None:
+            file_fingerprint = fingerprint(filepath)
+        molecules, tables, segment_ids, segment_frames = list(), list(), list(), list()
+        for uid in to_python(archive_link.getMoleculeUIDs()):
+            record = archive_link.get(uid)
+            table = record.getTable()
+            snapshot = snapshot_from_record(record, table)
+            tables.append((table, snapshot.n_rows))
+
+            segments_tables = list()
+            for x, y, region in to_python(record.getSegmentsTableNames()):
+                segment_id = str(len(segment_ids))
+                segment_ids.append(segment_id)
+                segment_frames.append(to_python(record.getSegmentsTable(x, y, region)))
+                segments_tables.append([x, y, region, segment_id])
+
+            molecules.append(dict(uid=uid, metadata_uid=snapshot.meta_uid, parameters=snapshot.params,
+                                  tags=snapshot.tags, regions=[list(region) for region in snapshot.regions],
+                                  segments_tables=segments_tables))
+
+        # molecule tables are converted one by one and copied into the store right away
+        builder = ColumnarBuilder([molecule['uid'] for molecule in molecules], [n_rows for _, n_rows in tables])
+        for position, (table, _) in enumerate(tables):
+            builder.add(position, to_pandas(table))
+
+        metadata = list()
+        for metadata_uid in to_python(archive_link.getMetadataUIDs()):
+            record = archive_link.getMetadata(metadata_uid)
+            metadata.append(dict(uid=metadata_uid, parameters=dict(to_python(record.getParameters())),
+                                 string_parameters={name: record.getStringParameter(name)
+                                                    for name in string_parameters}))
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # write to temporary directory first, entries only become visible once complete
+        temp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp_')
+        try:
+            manifest = dict(fingerprint=file_fingerprint, molecules=molecules, metadata=metadata,
+                            tables=_save_store(os.path.join(temp_dir, 'tables'), builder.finish()),
+                            segments=_save_store(os.path.join(temp_dir, 'segments'),
+                                                 ColumnarStore.from_frames(segment_ids, segment_frames)))
+            with open(os.path.join(temp_dir, 'manifest.json'), 'w') as file:
+                json.dump(manifest, file)
+            # written last, entries are only looked up by fingerprint once complete
+            with open(os.path.join(temp_dir, 'fingerprint.json'), 'w') as file:
+                json.dump(file_fingerprint, file)
+
+            self.remove(filepath)
+            entry = self.entry(self.key(file_fingerprint))
+            shutil.rmtree(entry, ignore_errors=True)
+            os.rename(temp_dir, entry)
+        except BaseException:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+    def remove(self, filepath):
+        """
+        Removes all cache entries of filepath.
+        """
+        path = os.path.abspath(filepath)
+        for entry, file_fingerprint in self.fingerprints():
+            if file_fingerprint['path'] == path:
+                shutil.rmtree(entry, ignore_errors=True)
+
+    def fingerprints(self):
+        """
+        Yields (entry directory, fingerprint) of all cache entries.
+        """
+        for entry, file_fingerprint in self._read_entries('fingerprint.json'):
+            if not isinstance(file_fingerprint, dict) or not {'path', 'size', 'mtime'} <= set(file_fingerprint):
+                self._remove_corrupt(entry, 'invalid fingerprint')
+                continue
+            yield entry, file_fingerprint
+
+    def manifests(self):
+        """
+        Yields manifests of all cache entries.
+        """
+        for _, manifest in self._read_entries('manifest.json'):
+            yield manifest
+
+    def _read_entries(self, filename):
+        """
+        Yields (entry directory, parsed JSON file filename) of all entries. Entries with an unreadable file are
+        removed, entries still being written (temporary directories) and entries without the file are skipped.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return
+        for key in os.listdir(self.cache_dir):
+            if key.startswith('.'):
+                continue
+            entry = self.entry(key)
+            try:
+                with open(os.path.join(entry, filename)) as file:
+                    data = json.load(file)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            except (OSError, ValueError) as error:
+                self._remove_corrupt(entry, repr(error))
+                continue
+            yield entry, data
+
+    @staticmethod
+    def _remove_corrupt(entry, reason):
+        warnings.warn(f'Removing corrupt cache entry {entry}: {reason}', MarsPyWarning)
+        shutil.rmtree(entry, ignore_errors=True)
+
+
+def _save_store(directory, store):
+    """
+    Saves ColumnarStore arrays as .npy files (non-numeric columns as JSON), returns JSON serializable description of
+    the store.
+    """
+    os.makedirs(directory)
+    np.save(os.path.join(directory, 'offsets.npy'), store.offsets)
+    columns = list(store.arrays)
+    json_columns = list()
+    for i, column in enumerate(columns):
+        array = store.arrays[column]
+        if array.dtype.kind == 'O':
+            json_columns.append(i)
+            with open(os.path.join(directory, f'{i}.json'), 'w') as file:
+                json.dump(array.tolist(), file, default=_json_scalar)
+        else:
+            np.save(os.path.join(directory, f'{i}.npy'), array, allow_pickle=False)
+    return dict(uids=store.uids, columns=columns, json_columns=json_columns, molecule_columns=store.molecule_columns,
+                dtypes=store.dtypes)
+
+
+def _json_scalar(value):
+    # NumPy scalars in object columns
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'Cannot write {type(value)} to the disk cache.')
+
+
+def _load_store(directory, description):
+    """
+    Loads ColumnarStore saved with _save_store, numeric columns are memory-mapped.
+    """
+    arrays = dict()
+    json_columns = set(description['json_columns'])
+    for i, column in enumerate(description['columns']):
+        if i in json_columns:
+            with open(os.path.join(directory, f'{i}.json')) as file:
+                values = json.load(file)
+            arrays[column] = np.empty(len(values), dtype=object)
+            arrays[column][:] = values
+        else:
+            arrays[column] = np.load(os.path.join(directory, f'{i}.npy'), mmap_mode='r', allow_pickle=False)
+    return ColumnarStore(description['uids'], arrays, np.load(os.path.join(directory, 'offsets.npy')),
+                         description['molecule_columns'], description['dtypes'])
@@ -1,85 +1,279 @@
 import re
+import sys
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
 
 import numpy as np
-import scyjava as sc
-import seaborn as sns
-from scyjava.convert._pandas import table_to_pandas
+import pandas as pd
+
+from marspy.convert.cache import TableCache
+from marspy.convert.records import TableRecord
+from marspy.instrument import stage
+
+
+def to_python(data):
+    """
+    Converts Java data structures to Python (scyjava). Python objects (e.g. returned by the stand-ins in
+    marspy.convert.records) are passed through unchanged.
+    """
+    if data is None or isinstance(data, (str, int, float, list, tuple, set, dict, pd.DataFrame)):
+        return data
+    # scyjava is only needed for Java objects
+    import scyjava as sc
+    return sc.to_python(data)
+
+
+def to_pandas(table):
+    """
+    Converts MarsTable to pandas DataFrame.
+    """
+    if isinstance(table, TableRecord):
+        return table.to_pandas()
+    from scyjava.convert._pandas import table_to_pandas
+    return table_to_pandas(table)
+
+
+# all molecule record information besides the tables, regions as list of (name, column, start, end)
+MoleculeSnapshot = namedtuple('MoleculeSnapshot', ['meta_uid', 'params', 'tags', 'regions', 'columns', 'n_rows'])
+
+
+def fetch_snapshot(archive, uid, tags=None):
+    """
+    Reads metadata UID, parameters, tags, regions, column headings and row count of a molecule record
+    with a single archive.get(uid) lookup (the table itself is not converted).
+    tags: tags of the molecule if already known (e.g. from scan_archive), not read again
+    """
+    with stage('snapshot', uid):
+        record = archive.get(uid)
+        return snapshot_from_record(record, record.getTable(), tags=tags)
+
+
+def snapshot_from_record(record, table, tags=None):
+    """
+    MoleculeSnapshot of a molecule record and its table.
+    tags: tags of the molecule if already known, not read again
+    """
+    regions = list()
+    for region_name in to_python(record.getRegionNames()):
+        _region = record.getRegion(region_name)
+        regions.append((region_name, _region.getColumn(), _region.getStart(), _region.getEnd()))
+    return MoleculeSnapshot(meta_uid=record.getMetadataUID(),
+                            params=dict(to_python(record.getParameters())),
+                            tags=list(to_python(record.getTags()) if tags is None else tags),
+                            regions=regions,
+                            columns=list(to_python(table.getColumnHeadingList())),
+                            n_rows=table.getRowCount())
 
 
 class Molecule:
+    __slots__ = ('uid', 'archive', 'cache', 'store', 'compact', 'meta_uid', 'params', 'tags', '_regions', 'columns',
+                 'n_rows', 'noidle_prefix', 'noidle_copy', 'segments_requested', 'segments_filter', '_seg_dfs')
 
-    def __init__(self, uid, archive):
+    def __init__(self, uid, archive, cache=None, snapshot=None, store=None, compact=False):
         self.uid = uid
         self.archive = archive
-        self.meta_uid = self.archive.get(self.uid).getMetadataUID()
-        self.params = dict(sc.to_python(self.archive.get(self.uid).getParameters()))
-        self.tags = list(sc.to_python(self.archive.get(self.uid).getTags()))
-        self.regions = list(sc.to_python(self.archive.get(self.uid).getRegionNames()))
-        # don't keep entire df in memory for future versions
-        self.df = table_to_pandas(self.archive.get(self.uid).getTable())
-        self.seg_dfs = None
+        # archive-level LRU cache holding the converted tables (loaded on first access)
+        self.cache = TableCache() if cache is None else cache
+        # archive-wide ColumnarStore (bulk extraction), df is a view on it if provided
+        self.store = store
+        # narrow dtypes of converted tables (see compact_frame)
+        self.compact = compact
+        if snapshot is None:
+            snapshot = fetch_snapshot(self.archive, self.uid)
+        self.meta_uid = snapshot.meta_uid
+        self.params = snapshot.params
+        self.tags = snapshot.tags
+        # (name, prefix, column, start, end) tuples, replaced by a view on the archive-wide structured array once
+        # packed by the archive (see region_array)
+        self._regions = [(name, '', column, start, end) for name, column, start, end in snapshot.regions]
+        # column headings and row count are available without converting the table
+        self.columns = snapshot.columns
+        self.n_rows = snapshot.n_rows
+        # prefix used to generate df_noidle (set by DnaMoleculeArchive.add_df_noidle)
+        self.noidle_prefix = None
+        # keep generated df_noidle in the cache (set by DnaMoleculeArchive.add_df_noidle)
+        self.noidle_copy = True
+        # SegmentsTables are only converted on first access of seg_dfs
+        self.segments_requested = False
+        # (types, prefixes) of requested SegmentsTables, None: all (set by DnaMoleculeArchive.add_segments_tables)
+        self.segments_filter = (None, None)
+        self._seg_dfs = None
+
+    @property
+    def df(self):
+        """
+        Molecule DataTable as pandas DataFrame (converted on first access, may be evicted from the cache).
+        """
+        if self.store is not None:
+            # views on the store cost no memory of their own, only columns cast to the molecule's dtype count
+            return self.cache.get((self.uid, 'df'), self._load_df, size=self.store.copied_nbytes(self.uid))
+        return self.cache.get((self.uid, 'df'), self._load_df)
+
+    def _load_df(self):
+        if self.store is not None:
+            # views on the archive-wide ColumnarStore
+            return self.store.frame(self.uid)
+        with stage('table_to_pandas', self.uid) as timer:
+            df = to_pandas(self.archive.get(self.uid).getTable())
+            if self.compact:
+                df = compact_frame(df)
+            timer.count_bytes(df)
+        return df
+
+    @property
+    def regions(self):
+        """
+        Region names.
+        """
+        return [region[0] for region in self._region_rows()]
+
+    def _region_rows(self):
+        if isinstance(self._regions, np.ndarray):
+            return self._regions.tolist()
+        return self._regions
+
+    @property
+    def df_noidle(self):
+        """
+        Copy of df with all rows removed falling in pause segments (see DnaMoleculeArchive.add_df_noidle).
+        Generated on first access, may be evicted from the cache and is regenerated if needed.
+        """
+        if self.noidle_prefix is None:
+            raise AttributeError(f'Molecule {self.uid} has no df_noidle. Run add_df_noidle first.')
+        if not self.noidle_copy:
+            return self._load_df_noidle()
+        return self.cache.get((self.uid, 'df_noidle'), self._load_df_noidle)
+
+    def _load_df_noidle(self):
+        with stage('df_noidle', self.uid) as timer:
+            df_noidle = self.df[self.noidle_mask]
+            df_noidle.reset_index(drop=True, inplace=True)
+            timer.count_bytes(df_noidle)
+        return df_noidle
+
+    @property
+    def noidle_mask(self):
+        """
+        Boolean array marking all rows of df outside of pause segments (rows kept in df_noidle).
+        """
+        if self.noidle_prefix is None:
+            raise AttributeError(f'Molecule {self.uid} has no noidle_mask. Run add_df_noidle first.')
+        return self.cache.get((self.uid, 'noidle_mask'), self._load_noidle_mask)
+
+    def _load_noidle_mask(self):
+        df = self.df
+        with stage('noidle_mask', self.uid):
+            mask = np.ones(len(df), dtype=bool)
+            for seg_df in filter(lambda sdf: sdf.type == 'rate' and sdf.prefix == self.noidle_prefix, self.seg_dfs):
+                pauses = seg_df.df[seg_df.df['pause_B']]
+                mask &= ~in_intervals(df[seg_df.prefix + seg_df.col_x].to_numpy(dtype=float),
+                                      pauses['X1'].to_numpy(dtype=float), pauses['X2'].to_numpy(dtype=float))
+        return mask
+
+    @property
+    def seg_dfs(self):
+        """
+        List of SegmentsTables attached by add_segments_tables (set up on first access).
+        The tables themselves are converted on first access of SegmentsTable.raw / df.
+        """
+        if self._seg_dfs is None and self.segments_requested:
+            with stage('segments_tables', self.uid):
+                self._seg_dfs = self._load_seg_dfs()
+        return self._seg_dfs
+
+    @seg_dfs.setter
+    def seg_dfs(self, seg_dfs):
+        self._seg_dfs = seg_dfs
+
+    def _load_seg_dfs(self):
+        # SegmentsTables are assigned to protein prefixes, which only DnaMolecules have
+        raise MarsPyException(f'Conflict in molecule {self.uid}!\nSegmentsTables are only supported for DnaMolecule.')
 
     def __str__(self):
         return f'Greetings from Molecule {self.uid}.'
 
     def __len__(self):
-        return len(self.df)
-
-    def __del__(self):
-        pass
-        print(f'Molecule {self.uid} deleted.')
+        return self.n_rows
 
 
 class SingleMolecule(Molecule):
+    __slots__ = ('protein',)
 
-    def __init__(self, uid, protein, archive):
-        Molecule.__init__(self, uid, archive)
+    def __init__(self, uid, protein, archive, cache=None, snapshot=None, store=None, compact=False):
+        Molecule.__init__(self, uid, archive, cache=cache, snapshot=snapshot, store=store, compact=compact)
         self.protein = protein
 
 
 class DnaMolecule(Molecule):
+    __slots__ = ('proteins', 'protein_prefixes', 'prefixes', 'ars1_encounters_vis', 'ars1_pass', 'ars1_block',
+                 'pass_times', 'pass_diff')
 
-    def __init__(self, uid, proteins, archive):
-        Molecule.__init__(self, uid, archive)
+    def __init__(self, uid, proteins, archive, cache=None, snapshot=None, store=None, compact=False):
+        if snapshot is None:
+            snapshot = fetch_snapshot(archive, uid)
+        Molecule.__init__(self, uid, archive, cache=cache, snapshot=snapshot, store=store, compact=compact)
 
         # DnaMolecule specific attributes
-        self.proteins = {protein: 0 for protein in proteins}
-
-        # grab keys from dict
-        for protein in self.proteins:
-            # protein specific prefixes with nomenclature protein_prefixes:
-            (exec(
-                f"self.{protein + '_prefixes'} = set(re.findall(f'{protein}_\d+_',' '.join(self.df.columns)))"))
-
-            # Store number of molecules based off of actual dataTable headers
-            self.proteins[protein] = len(set(re.findall(f'{protein}_\d+_', ' '.join(self.df.columns))))
+        columns = ' '.join(self.columns)
+        # protein specific prefixes (also accessible as molecule.{protein}_prefixes), read-only and shared by all
+        # molecules with the same prefixes
+        protein_prefixes = tuple((protein, shared(frozenset(re.findall(rf'{protein}_\d+_', columns))))
+                                 for protein in proteins)
+        self.protein_prefixes = shared(protein_prefixes)
+        # Store number of molecules based off of actual dataTable headers
+        self.proteins = {protein: len(prefixes) for protein, prefixes in self.protein_prefixes}
 
         # generate prefixes based union of protein_prefixes
-        self.prefixes = set()
-        for protein in self.proteins.keys():
-            for prefix in getattr(self, f'{protein}_prefixes'):
-                self.prefixes.add(prefix)
-
-        # region objects for DnaMolecules
-        self.regions = list()
-        # all region names
-        for region_name in sc.to_python(self.archive.get(self.uid).getRegionNames()):
-            _region = self.archive.get(self.uid).getRegion(region_name)
-            match_prefix = None
+        self.prefixes = shared(frozenset().union(*(prefixes for _, prefixes in self.protein_prefixes)))
+
+        # assign regions to prefixes
+        regions = list()
+        pattern = prefix_pattern(self.prefixes)
+        for region_name, region_column, region_start, region_end in snapshot.regions:
             # separate prefix from column name
-            for prefix in self.prefixes:
-                if re.match(prefix, _region.getColumn()):
-                    # correct prefix found
-                    match_prefix = prefix
-                    break
-
-            # append Region object to molecule regions
-            self.regions.append(Region(uid=self.uid,
-                                       name=region_name,
-                                       start=_region.getStart(),
-                                       end=_region.getEnd(),
-                                       prefix=match_prefix,
-                                       column=_region.getColumn().split(match_prefix)[-1]))
+            match = pattern.match(region_column)
+            match_prefix = match.group(1) if match else ''
+            regions.append((region_name, match_prefix, region_column.split(match_prefix)[-1] if match_prefix else
+                            region_column, region_start, region_end))
+        self._regions = regions
+
+    def __getattr__(self, name):
+        # protein specific prefixes, e.g. molecule.Cohesin_prefixes
+        if name.endswith('_prefixes') and name != 'protein_prefixes':
+            for protein, prefixes in self.protein_prefixes:
+                if protein == name[:-len('_prefixes')]:
+                    return prefixes
+        raise AttributeError(f'{type(self).__name__!r} object has no attribute {name!r}')
+
+    @property
+    def regions(self):
+        """
+        Region objects (built from the archive-wide region array).
+        """
+        return [Region(uid=self.uid, name=name, start=start, end=end, prefix=prefix or None, column=column)
+                for name, prefix, column, start, end in self._region_rows()]
+
+    def _load_seg_dfs(self):
+        """
+        SegmentsTables matching segments_filter, names are resolved without converting any table.
+        """
+        types, prefixes = self.segments_filter
+        pattern = prefix_pattern(self.prefixes)
+        seg_dfs = list()
+        # all segmentTableNames
+        for x, y, region in (to_python(self.archive.get(self.uid).getSegmentsTableNames())):
+            # internal control that all seg_dfs are valid: x and y need to belong to the same protein on molecule
+            match = pattern.match(x)
+            if match is None or not y.startswith(match.group(1)):
+                err_message = f"Conflict in molecule {self.uid}!\nSegmentTable {x} {y} {region} not assigned!"
+                raise MarsPyException(err_message)
+            prefix = match.group(1)
+            if prefixes is not None and prefix not in prefixes:
+                continue
+            if types is not None and segments_type(y[len(prefix):]) not in types:
+                continue
+            seg_dfs.append(SegmentsTable(molecule=self, prefix=prefix, col_x=x, col_y=y, region=region))
+        return seg_dfs
 
     def calc_length_dna(self):
         """
@@ -88,7 +282,28 @@ class DnaMolecule(Molecule):
         return np.sqrt((self.params['Dna_Bottom_X2'] - self.params['Dna_Top_X1']) ** 2 +
                        (self.params['Dna_Bottom_Y2'] - self.params['Dna_Top_Y1']) ** 2)
 
+    def barrier_position(self, prefix='MCM_1_', default=5557.5):
+        """
+        Position of a barrier (e.g. ARS1) on DNA: median Position_on_DNA of prefix if the protein was detected on the
+        molecule, otherwise default (bp).
+        """
+        if self.proteins.get(prefix.split('_')[0], 0) > 0 and prefix + 'Position_on_DNA' in self.columns:
+            return self.df[prefix + 'Position_on_DNA'].median()
+        return default
+
+    def calc_ars1_encounters(self, prefix='Cohesin_1_', barrier=None, barrier_prefix='MCM_1_', default_barrier=5557.5,
+                             ref_length=35.94, time_col='Time_(s)', noidle=True):
+        """
+        Calculates encounters of prefix with ARS1 (or any other barrier) and their outcome (pass or block).
+        See calc_encounters() for parameters. Results are stored in ars1_encounters_vis, ars1_pass, ars1_block,
+        pass_times and pass_diff and returned as pandas Series.
+        """
+        return calc_encounters([self], prefix=prefix, barrier=barrier, barrier_prefix=barrier_prefix,
+                               default_barrier=default_barrier, ref_length=ref_length, time_col=time_col,
+                               noidle=noidle).iloc[0]
+
     def plot(self):
+        import seaborn as sns
         for prefix in self.prefixes:
             try:
                 sns.lineplot(x=prefix + 'Time_(s)', y=prefix + 'Position_on_DNA', data=self.df)
@@ -100,32 +315,104 @@ class SegmentsTable:
     """
     SegmentsTable object holding the actual df, with additional information in attributes.
     Also contains specific methods for filtering, bleaching steps, pause detection.
+    The table read from the archive (raw) is converted on first access and kept in the archive's TableCache, it is
+    never modified. Pause detection results are stored separately per parameter tuple (LRU, at most max_results),
+    df is the result of the last detect_pauses call (raw before).
     """
+    __slots__ = ('uid', 'archive', 'cache', 'prefix', 'col_x', 'col_y', 'region', '_raw', 'results', 'params', 'type',
+                 'filtered')
+
+    # pause detection results kept per SegmentsTable
+    max_results = 8
 
     def __init__(self, molecule, prefix, col_x, col_y, region):
         # uid for debugging
         self.uid = molecule.uid
+        self.archive = molecule.archive
+        self.cache = molecule.cache
         # which prefix does it belong to
         self.prefix = prefix
         # remove prefix for x and y columns => general naming
         self.col_x = col_x.split(self.prefix)[-1]
         self.col_y = col_y.split(self.prefix)[-1]
         self.region = region
-        # actual SegmentsTable()
-        self.df = sc.to_python(molecule.archive.get(molecule.uid).getSegmentsTable(col_x, col_y, region))
+        # table set by assigning df (None: raw is converted from the archive on first access)
+        self._raw = None
+        # pause detection parameters (thresh, sigma_max, global_thresh, length, col): merged df, least recently
+        # used first
+        self.results = OrderedDict()
+        # parameters of the active result (None: df is raw)
+        self.params = None
         # type of SegmentTable (default None)
         self.type = None
         # keep track if seg_dfs were already filtered before data is interpreted
         self.filtered = False
         # assign type of SegmentTable (one needs to be True)
-        if self.col_y == 'Intensity':
-            self.type = 'bleaching'
-        elif self.col_y == 'Position_on_DNA':
-            self.type = 'rate'
-        else:
+        self.type = segments_type(self.col_y)
+        if self.type is None:
             err_message = f"Conflict in molecule {self.uid}!\nSegmentTable type could not be assigned!"
             raise MarsPyException(err_message)
 
+    @property
+    def key(self):
+        """
+        TableCache key of the raw table.
+        """
+        return self.uid, 'segments', self.prefix + self.col_x, self.prefix + self.col_y, self.region
+
+    @property
+    def raw(self):
+        """
+        SegmentsTable as read from the archive (converted on first access, may be evicted from the cache).
+        """
+        if self._raw is not None:
+            return self._raw
+        return self.cache.get(self.key, self._load_raw)
+
+    def _load_raw(self):
+        with stage('segments_table', self.uid) as timer:
+            _, _, x, y, region = self.key
+            raw = to_python(self.archive.get(self.uid).getSegmentsTable(x, y, region))
+            timer.count_bytes(raw)
+        return raw
+
+    @property
+    def df(self):
+        """
+        Result of the last pause detection (merged segments with pause column), raw table if none was run.
+        """
+        if self.params is None:
+            return self.raw
+        return self.results[self.params]
+
+    @df.setter
+    def df(self, df):
+        # replacing the table (e.g. after filtering) invalidates all pause detection results, the new table is kept
+        # on the SegmentsTable (not evicted)
+        self._raw = df
+        self.results.clear()
+        self.params = None
+
+    def set_result(self, params, df):
+        """
+        Stores pause detection result df for params and makes it the active one (evicts least recently used results).
+        """
+        self.results[params] = df
+        self.results.move_to_end(params)
+        self.params = params
+        while len(self.results) > self.max_results:
+            self.results.popitem(last=False)
+
+    def use_result(self, params):
+        """
+        Makes the cached result for params the active one. Returns False if no result is cached for params.
+        """
+        if params not in self.results:
+            return False
+        self.results.move_to_end(params)
+        self.params = params
+        return True
+
     def detect_pauses(self, thresh=200, sigma_max=30, global_thresh=True, length=1, col='B'):
         """
         Detection pauses in SegmentTable (only for type = 'rate')
@@ -135,61 +422,343 @@ class SegmentsTable:
         length: minimal pause duration (s)
         If global_thresh is False, a molecule-specific threshold is calculated with thresh^-1 * np.mean(col)
         col: column evaluated for pauses
+        Always evaluated on the raw table, results are cached per parameter tuple.
         """
         # only SegmentsTables with type 'rate'
         if self.type == 'rate':
-            self.df['pause_' + col] = False
-            cutoff = thresh
+            params = (thresh, sigma_max, global_thresh, length, col)
+            if self.use_result(params):
+                return
+            df = self.raw.copy()
+            df['pause_' + col] = flag_pauses(df, thresh=thresh, sigma_max=sigma_max, global_thresh=global_thresh,
+                                             length=length, col=col)
+            # if two subsequent segments are pauses merge them
+            self.set_result(params, merge_pauses(df, pause_col='pause_' + col))
 
-            # iterate once for each entry in seg_df
-            for i in range(len(self.df)):
-                if not global_thresh:
-                    # redefine cutoff
-                    cutoff = self.df[~self.df['pause_' + col]][col].mean() / thresh
 
-            for row in self.df.index:
-                self.df.loc[row, 'pause_' + col] = ((abs(self.df.loc[row, col]) < cutoff) and
-                                                    (self.df.loc[row, 'Sigma_'+col] < sigma_max) and
-                                                    (self.df.loc[row, 'X2'] - self.df.loc[row, 'X1'] > length))
+# y column (without prefix): SegmentsTable type
+SEGMENTS_TYPES = {'Intensity': 'bleaching', 'Position_on_DNA': 'rate'}
 
-            # if two subsequent segments are pauses merge them
-            remove_rows = set()
-            for i in range(1, len(self.df)):
-                # both pauses
-                # additional requirements: time values match and y values within 1 kb
-                if (self.df.loc[i - 1, 'pause_B'] and self.df.loc[i, 'pause_B'] and
-                        self.df.loc[i - 1, 'X2'] == self.df.loc[i, 'X1'] and
-                        abs(self.df.loc[i - 1, 'Y2'] - self.df.loc[i, 'Y1'] < 1000)):
-                    # recalculate values (x2 and y2 values in row i stay the same)
-                    x1 = self.df.loc[i - 1, 'X1']
-                    y1 = self.df.loc[i - 1, 'Y1']
-                    a = np.average(self.df[i - 1:i + 1]['A'],
-                                   weights=self.df[i - 1:i + 1]['X2'] - self.df[i - 1:i + 1]['X1'])
-                    sigma_a = np.average(self.df[i - 1:i + 1]['Sigma_A'],
-                                         weights=self.df[i - 1:i + 1]['X2'] - self.df[i - 1:i + 1]['X1'])
-                    b = np.average(self.df[i - 1:i + 1]['B'],
-                                   weights=self.df[i - 1:i + 1]['X2'] - self.df[i - 1:i + 1]['X1'])
-                    sigma_b = np.average(self.df[i - 1:i + 1]['Sigma_B'],
-                                         weights=self.df[i - 1:i + 1]['X2'] - self.df[i - 1:i + 1]['X1'])
-
-                    # add row i-1 for removal and reassign calculated values for row i
-                    remove_rows.add(i - 1)
-                    self.df.loc[i, 'X1'] = x1
-                    self.df.loc[i, 'Y1'] = y1
-                    self.df.loc[i, 'A'] = a
-                    self.df.loc[i, 'Sigma_A'] = sigma_a
-                    self.df.loc[i, 'B'] = b
-                    self.df.loc[i, 'Sigma_B'] = sigma_b
-
-            # remove all rows & update indices
-            self.df.drop(list(remove_rows), axis=0, inplace=True)
-            self.df.reset_index(drop=True, inplace=True)
+
+def segments_type(col_y):
+    """
+    Type of a SegmentsTable from its y column (without prefix): 'bleaching', 'rate' or None.
+    """
+    return SEGMENTS_TYPES.get(col_y)
+
+
+@lru_cache(maxsize=None)
+def prefix_pattern(prefixes):
+    """
+    Compiled regex matching any of prefixes at the start of a column name (longest prefix first), group 1 is the
+    prefix. Compiled once per (shared) frozenset of prefixes.
+    """
+    if not prefixes:
+        # never matches
+        return re.compile(r'(?!)')
+    return re.compile('(' + '|'.join(map(re.escape, sorted(prefixes, key=len, reverse=True))) + ')')
+
+
+def in_intervals(values, starts, ends):
+    """
+    Vectorized interval lookup: returns boolean array marking all values with start <= value <= end for any of the
+    provided (possibly overlapping) intervals. Runs in O((values + intervals) * log(intervals)).
+    """
+    valid = ~(np.isnan(starts) | np.isnan(ends))
+    starts, ends = starts[valid], ends[valid]
+    if len(starts) == 0:
+        return np.zeros(len(values), dtype=bool)
+    # sort intervals by start, running maximum of ends covers overlapping intervals
+    order = np.argsort(starts, kind='stable')
+    starts = starts[order]
+    ends = np.maximum.accumulate(ends[order])
+    # last interval starting before (or at) value
+    index = np.searchsorted(starts, values, side='right') - 1
+    return (index >= 0) & (values <= ends[np.maximum(index, 0)])
+
+
+def flag_pauses(df, thresh=200, sigma_max=30, global_thresh=True, length=1, col='B', groups=None):
+    """
+    Vectorized pause flagging of (concatenated) rate SegmentsTables, see SegmentsTable.detect_pauses().
+    groups: optional array assigning each row to its SegmentsTable (molecule-specific thresholds are calculated
+    per group if global_thresh is False)
+    Returns boolean array (True: segment is a pause).
+    """
+    if global_thresh:
+        cutoff = thresh
+    elif groups is None:
+        cutoff = df[col].mean() / thresh
+    else:
+        cutoff = (df[col].groupby(groups).transform('mean') / thresh).to_numpy()
+
+    return ((np.abs(df[col].to_numpy(dtype=float)) < cutoff) &
+            (df['Sigma_' + col].to_numpy(dtype=float) < sigma_max) &
+            (df['X2'].to_numpy(dtype=float) - df['X1'].to_numpy(dtype=float) > length))
+
+
+def merge_pauses(df, pause_col='pause_B', groups=None):
+    """
+    Merges runs of subsequent pause segments into one segment (vectorized via run-length grouping).
+    Two segments are merged if both are pauses, time values match and y values are within 1 kb.
+    The merged segment keeps X2 and Y2 of the last segment, X1 and Y1 of the first segment and duration-weighted
+    averages of A, Sigma_A, B and Sigma_B.
+    groups: optional array assigning each row to its SegmentsTable (segments of different groups are never merged)
+    Returns new DataFrame with reset index.
+    """
+    pause = df[pause_col].to_numpy(dtype=bool)
+    x1 = df['X1'].to_numpy(dtype=float)
+    x2 = df['X2'].to_numpy(dtype=float)
+
+    # link[i]: segment i is merged with segment i-1
+    link = np.zeros(len(df), dtype=bool)
+    # y values compared as signed difference (matches the row-wise implementation)
+    link[1:] = (pause[:-1] & pause[1:] & (x2[:-1] == x1[1:]) &
+                (df['Y2'].to_numpy(dtype=float)[:-1] - df['Y1'].to_numpy(dtype=float)[1:] < 1000))
+    if groups is not None:
+        groups = np.asarray(groups)
+        link[1:] &= groups[1:] == groups[:-1]
+    if not link.any():
+        return df.reset_index(drop=True)
+
+    # run-length grouping: each run of linked segments shares one id
+    run = np.cumsum(~link) - 1
+    run_first = np.flatnonzero(~link)
+    run_size = np.bincount(run)
+    # last segment of each run is kept
+    keep = np.append(~link[1:], True)
+    merged = keep & (run_size[run] > 1)
+    merged_runs = run[merged]
+
+    df = df.copy()
+    weights = np.where(run_size[run] > 1, x2 - x1, 0)
+    total = np.bincount(run, weights=weights)[merged_runs]
+    for column in ['A', 'Sigma_A', 'B', 'Sigma_B']:
+        values = df[column].to_numpy(dtype=float)
+        weighted = np.bincount(run, weights=np.where(weights != 0, values * weights, 0))[merged_runs]
+        df.loc[merged, column] = weighted / total
+    for column in ['X1', 'Y1']:
+        df.loc[merged, column] = df[column].to_numpy()[run_first[merged_runs]]
+
+    # remove all merged rows & update indices
+    df = df[keep]
+    df.reset_index(drop=True, inplace=True)
+    return df
+
+
+def sweep_pauses(df, thresholds, sigma_max=30, global_thresh=True, length=1, col='B', groups=None):
+    """
+    Vectorized pause detection for a grid of parameters on (concatenated) raw rate SegmentsTables, all settings are
+    evaluated in one pass without merging or copying tables (see flag_pauses and merge_pauses).
+    thresholds, sigma_max, length: scalars or sequences, every combination is evaluated
+    groups: optional array assigning each row to its SegmentsTable (see flag_pauses)
+    Returns DataFrame with one row per setting (thresh, sigma_max, length): pauses (after merging), pause_segments
+    (before merging), idle_time, total_time and fraction_idle (idle_time / total_time)
+    """
+    thresh, sigma, min_length = (grid.ravel() for grid in np.meshgrid(np.atleast_1d(thresholds).astype(float),
+                                                                      np.atleast_1d(sigma_max).astype(float),
+                                                                      np.atleast_1d(length).astype(float),
+                                                                      indexing='ij'))
+    x1 = df['X1'].to_numpy(dtype=float)
+    x2 = df['X2'].to_numpy(dtype=float)
+    values = df[col].to_numpy(dtype=float)
+    if global_thresh:
+        cutoff = thresh[:, None]
+    elif groups is None:
+        cutoff = np.nanmean(values) / thresh[:, None]
+    else:
+        cutoff = df[col].groupby(groups).transform('mean').to_numpy()[None, :] / thresh[:, None]
+
+    duration = x2 - x1
+    # (settings, rows)
+    pause = ((np.abs(values) < cutoff) & (df['Sigma_' + col].to_numpy(dtype=float) < sigma[:, None]) &
+             (duration > min_length[:, None]))
+    # subsequent pause segments which merge_pauses would join
+    contiguous = (x2[:-1] == x1[1:]) & (df['Y2'].to_numpy(dtype=float)[:-1] - df['Y1'].to_numpy(dtype=float)[1:] < 1000)
+    if groups is not None:
+        groups = np.asarray(groups)
+        contiguous &= groups[1:] == groups[:-1]
+    links = (pause[:, :-1] & pause[:, 1:] & contiguous).sum(axis=1)
+
+    duration = np.where(np.isnan(duration), 0, duration)
+    idle_time = pause @ duration
+    total_time = duration.sum()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction_idle = idle_time / total_time
+    return pd.DataFrame(dict(thresh=thresh, sigma_max=sigma, length=min_length,
+                             pauses=pause.sum(axis=1) - links, pause_segments=pause.sum(axis=1),
+                             idle_time=idle_time, total_time=total_time, fraction_idle=fraction_idle))
+
+
+def bleaching_steps(df, groups, n_groups, col='A', min_step=0.):
+    """
+    Vectorized photobleaching step detection on (concatenated) bleaching SegmentsTables.
+    A step is a drop of more than min_step between the levels (col) of two subsequent segments of a table.
+    groups: array assigning each row to its SegmentsTable (0..n_groups-1, rows of a table consecutive and sorted by
+    time)
+    Returns steps (n_groups), step sizes (list of arrays), initial and final intensity (level of the first / last
+    segment) and lifetime (time from the start of the first segment to the last step, NaN without step)
+    """
+    groups = np.asarray(groups)
+    level = df[col].to_numpy(dtype=float)
+    x1 = df['X1'].to_numpy(dtype=float)
+    drop = level[:-1] - level[1:]
+    step = (groups[1:] == groups[:-1]) & (drop > min_step)
+
+    steps = np.bincount(groups[:-1][step], minlength=n_groups)
+    step_sizes = np.split(drop[step], np.cumsum(steps)[:-1])
+    first = np.searchsorted(groups, np.arange(n_groups))
+    last = np.searchsorted(groups, np.arange(n_groups), side='right') - 1
+    filled = first <= last
+    initial, final, start, last_step = (np.full(n_groups, np.nan) for _ in range(4))
+    initial[filled] = level[first[filled]]
+    final[filled] = level[last[filled]]
+    start[filled] = x1[first[filled]]
+    # time of the last step: start of the segment following it
+    step_rows = np.flatnonzero(step) + 1
+    np.fmax.at(last_step, groups[step_rows], x1[step_rows])
+    lifetime = last_step - start
+    return steps, step_sizes, initial, final, lifetime
+
+
+def detect_crossings(position, barrier, encounter_thresh, pass_thresh, groups=None):
+    """
+    Vectorized barrier crossing detection on consecutive position pairs (i, i + 1).
+    An encounter is a pair starting closer than encounter_thresh to the barrier or passing it. A pair passes the
+    barrier if the second position lies more than pass_thresh beyond the barrier.
+    barrier, encounter_thresh, pass_thresh: scalars or arrays with one value per row
+    groups: optional array assigning each row to its molecule (pairs are never formed across molecules)
+    Returns boolean arrays encounter and passed (evaluated for each row i, False for the last row of each molecule).
+    """
+    position = np.asarray(position, dtype=float)
+    barrier, encounter_thresh, pass_thresh = (np.broadcast_to(np.asarray(value, dtype=float), position.shape)
+                                              for value in (barrier, encounter_thresh, pass_thresh))
+    current, following = position[:-1], position[1:]
+    b, thresh = barrier[:-1], pass_thresh[:-1]
+    passed = np.zeros(len(position), dtype=bool)
+    passed[:-1] = (((current < b) & (b < following - thresh)) | ((current > b) & (b > following + thresh)))
+    encounter = np.zeros(len(position), dtype=bool)
+    encounter[:-1] = np.abs(current - b) < encounter_thresh[:-1]
+    if groups is not None:
+        groups = np.asarray(groups)
+        # last row of each molecule has no successor
+        last = np.append(groups[1:] != groups[:-1], True)
+        passed &= ~last
+        encounter &= ~last
+    else:
+        encounter[-1:] = False
+    return encounter | passed, passed
+
+
+def calc_encounters(molecules, prefix='Cohesin_1_', barrier=None, barrier_prefix='MCM_1_', default_barrier=5557.5,
+                    ref_length=35.94, time_col='Time_(s)', noidle=True):
+    """
+    Encounters of prefix with a barrier on DNA (default: ARS1) and their outcome for all passed DnaMolecules in one
+    concatenated pass (see detect_crossings()).
+    Thresholds are scaled by DNA length: ref_length / length * 1500 (encounter) and ref_length / length * 500 (pass).
+    barrier: fixed barrier position (bp), None: median position of barrier_prefix (default_barrier if the protein
+    was not detected on the molecule)
+    ref_length: mean DNA length (px)
+    noidle: Set to False to use df instead of df_noidle (see DnaMoleculeArchive.add_df_noidle)
+    Results are also stored in the molecules (ars1_encounters_vis, ars1_pass, ars1_block, pass_times, pass_diff).
+    Returns DataFrame (index: uid) with encounters, passes, blocks, pass_times and pass_diff
+    """
+    molecules = list(molecules)
+    frames = [molecule.df_noidle if noidle else molecule.df for molecule in molecules]
+    lengths = np.array([len(df) for df in frames])
+    groups = np.repeat(np.arange(len(molecules)), lengths)
+
+    scale = np.array([ref_length / molecule.calc_length_dna() for molecule in molecules])
+    barriers = np.array([molecule.barrier_position(prefix=barrier_prefix, default=default_barrier)
+                         if barrier is None else barrier for molecule in molecules], dtype=float)
+
+    def column(name):
+        return np.concatenate([df[name].to_numpy(dtype=float) if name in df.columns else np.full(len(df), np.nan)
+                               for df in frames] + [np.empty(0)])
+
+    encounter, passed = detect_crossings(column(prefix + 'Position_on_DNA'), barriers[groups],
+                                         (scale * 1500)[groups], (scale * 500)[groups], groups=groups)
+    encounters = np.bincount(groups[encounter], minlength=len(molecules))
+    passes = np.bincount(groups[passed], minlength=len(molecules))
+
+    # pass time: time of the row following the crossing
+    time = column(prefix + time_col)
+    following = np.flatnonzero(passed) + 1
+    pass_times = np.split(time[following], np.cumsum(passes)[:-1])[:len(molecules)]
+
+    for molecule, n_encounters, n_passes, times in zip(molecules, encounters, passes, pass_times):
+        molecule.ars1_encounters_vis = int(n_encounters)
+        molecule.ars1_pass = int(n_passes)
+        molecule.ars1_block = int(n_encounters - n_passes)
+        molecule.pass_times = list(times)
+        molecule.pass_diff = np.diff(times, n=1)
+
+    return pd.DataFrame({'encounters': encounters,
+                         'passes': passes,
+                         'blocks': encounters - passes,
+                         'pass_times': [list(times) for times in pass_times],
+                         'pass_diff': [np.diff(times, n=1) for times in pass_times]},
+                        index=pd.Index([molecule.uid for molecule in molecules], name='uid'))
+
+
+# dtype of region arrays, strings are interned and only stored as references
+REGION_DTYPE = np.dtype([('name', object), ('prefix', object), ('column', object), ('start', np.float64),
+                         ('end', np.float64)])
+
+
+def region_array(regions):
+    """
+    Structured array of regions: list of (name, prefix, column, start, end) tuples (prefix '' if not assigned).
+    """
+    return np.array([(sys.intern(name), sys.intern(prefix), sys.intern(column), start, end)
+                     for name, prefix, column, start, end in regions], dtype=REGION_DTYPE)
+
+
+# immutable values (e.g. prefix frozensets) shared by all molecules
+_shared = dict()
+
+
+def shared(value):
+    """
+    Returns an equal, already existing instance of value (hashable) if there is one.
+    """
+    return _shared.setdefault(value, value)
+
+
+def compact_array(array):
+    """
+    Narrows dtype of array where lossless: float64 to float32, int64 to int32 and strings with many repeated values
+    to pandas Categorical.
+    """
+    if isinstance(array, pd.Categorical):
+        return array
+    array = np.asarray(array)
+    if array.dtype == np.float64:
+        narrow = array.astype(np.float32)
+        if np.array_equal(narrow.astype(np.float64), array, equal_nan=True):
+            return narrow
+    elif array.dtype == np.int64:
+        if len(array) == 0 or (array.min() >= np.iinfo(np.int32).min and array.max() <= np.iinfo(np.int32).max):
+            return array.astype(np.int32)
+    elif array.dtype.kind == 'O' and len(array):
+        categorical = pd.Categorical(array)
+        if len(categorical.categories) <= len(array) // 2:
+            return categorical
+    return array
+
+
+def compact_frame(df):
+    """
+    DataFrame with narrowed dtypes (see compact_array). Values are unchanged but arithmetic on float32 columns
+    is done in single precision.
+    """
+    return pd.DataFrame({column: compact_array(df[column].to_numpy()) for column in df.columns}, index=df.index)
 
 
 class Region:
     """
     Region object holding following attributes: name, start, end and molecule column.
     """
+    __slots__ = ('uid', 'name', 'start', 'end', 'prefix', 'column')
 
     def __init__(self, uid, name, start, end, prefix, column):
         # uid for debugging
@@ -209,5 +778,5 @@ class MarsPyException(Exception):
 
 
 class MarsPyWarning(UserWarning):
-    def __init__(self):
-        UserWarning.__init__(self)
+    def __init__(self, *args):
+        UserWarning.__init__(self, *args)
@@ -0,0 +1,179 @@
+import multiprocessing
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+def thread_map(fn, items, workers=1):
+    """
+    Applies fn to all items using a pool of threads attached to the JVM. Results keep the order of items.
+    Each pool thread processes chunks of items and detaches from the JVM when a chunk is done.
+    workers: number of threads (workers <= 1 runs serially in the calling thread)
+    """
+    items = list(items)
+    if workers is None or workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+
+    # a few chunks per thread to balance load
+    n_chunks = min(len(items), 4 * workers)
+    chunks = [items[i::n_chunks] for i in range(n_chunks)]
+
+    def run_chunk(chunk):
+        try:
+            return [fn(item) for item in chunk]
+        finally:
+            detach_jvm_thread()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        chunk_results = list(executor.map(run_chunk, chunks))
+
+    # restore order of items (chunks are interleaved)
+    results = [None] * len(items)
+    for i, chunk_result in enumerate(chunk_results):
+        results[i::n_chunks] = chunk_result
+    return results
+
+
+def detach_jvm_thread():
+    """
+    Detaches current thread from the JVM (threads are attached automatically on their first Java call).
+    """
+    try:
+        import jnius
+    except ImportError:
+        return
+    jnius.detach()
+
+
+class MoleculePayload:
+    """
+    Compact, picklable copy of a molecule shipped to worker processes (see process_map).
+    table: dict column name: NumPy array (molecule.df or df_noidle)
+    segments: dict (prefix, col_x, col_y, region): dict column name: NumPy array of SegmentsTables
+    """
+    __slots__ = ('uid', 'params', 'tags', 'prefixes', 'table', 'segments')
+
+    def __init__(self, uid, params, tags, prefixes, table, segments):
+        self.uid = uid
+        self.params = params
+        self.tags = tags
+        self.prefixes = prefixes
+        self.table = table
+        self.segments = segments
+
+    @classmethod
+    def from_molecule(cls, molecule, noidle=False, segments=False):
+        """
+        noidle: ship df_noidle instead of df
+        segments: ship SegmentsTables (seg_dfs)
+        """
+        df = molecule.df_noidle if noidle else molecule.df
+        seg_dfs = dict()
+        if segments and molecule.seg_dfs:
+            seg_dfs = {(seg_df.prefix, seg_df.col_x, seg_df.col_y, seg_df.region): _arrays(seg_df.df)
+                       for seg_df in molecule.seg_dfs}
+        return cls(molecule.uid, dict(molecule.params), list(molecule.tags),
+                   sorted(getattr(molecule, 'prefixes', ())), _arrays(df), seg_dfs)
+
+    @property
+    def df(self):
+        return pd.DataFrame(self.table, copy=False)
+
+    def segments_df(self, key):
+        return pd.DataFrame(self.segments[key], copy=False)
+
+
+class MoleculeFailure:
+    """
+    Result placeholder for a molecule fn raised an exception for (see process_map).
+    """
+    __slots__ = ('uid', 'error', 'traceback')
+
+    def __init__(self, uid, error, traceback):
+        self.uid = uid
+        self.error = error
+        self.traceback = traceback
+
+    def __repr__(self):
+        return f'MoleculeFailure({self.uid!r}, {self.error!r})'
+
+
+def process_map(fn, payloads, workers=1, chunksize=16, reducer=None):
+    """
+    Applies fn(payload) to all payloads in a pool of worker processes. Results keep the order of payloads.
+    Exceptions are caught per payload and returned as MoleculeFailure (with uid) in place of the result instead of
+    aborting the run.
+    payloads: iterable of MoleculePayloads (consumed lazily, at most 2 chunks per worker are in flight)
+    fn / reducer: need to be picklable (module-level functions)
+    workers: number of processes (workers <= 1 runs serially in the calling process)
+    chunksize: payloads per task
+    reducer: if passed, results of each chunk are reduced in the worker with reducer(a, b) and the list of partial
+    results per chunk is returned together with all failures
+    Returns list of results (partial results if reducer is passed) and list of MoleculeFailures
+    """
+    chunks = _chunks(payloads, chunksize)
+    if workers is None or workers <= 1:
+        outputs = (_run_chunk(fn, chunk, reducer) for chunk in chunks)
+        return _collect(outputs)
+
+    # spawn: never fork a process holding a JVM
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        pending = deque()
+        outputs = list()
+        for chunk in chunks:
+            pending.append(executor.submit(_run_chunk, fn, chunk, reducer))
+            if len(pending) >= 2 * workers:
+                outputs.append(pending.popleft().result())
+        outputs.extend(future.result() for future in pending)
+    return _collect(outputs)
+
+
+def _arrays(df):
+    return {column: np.asarray(df[column].to_numpy()) for column in df.columns}
+
+
+def _chunks(items, chunksize):
+    chunk = list()
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunksize:
+            yield chunk
+            chunk = list()
+    if chunk:
+        yield chunk
+
+
+def _run_chunk(fn, chunk, reducer=None):
+    """
+    Runs fn on all payloads of a chunk (in worker process). Returns list of results (or reduced partial result) and
+    list of MoleculeFailures.
+    """
+    results, failures = list(), list()
+    for payload in chunk:
+        try:
+            results.append(fn(payload))
+        except Exception as e:
+            failure = MoleculeFailure(payload.uid, f'{type(e).__name__}: {e}', traceback.format_exc())
+            results.append(failure)
+            failures.append(failure)
+    if reducer is None:
+        return results, failures
+
+    partial = [result for result in results if not isinstance(result, MoleculeFailure)]
+    if not partial:
+        return [], failures
+    value = partial[0]
+    for result in partial[1:]:
+        value = reducer(value, result)
+    return [value], failures
+
+
+def _collect(outputs):
+    results, failures = list(), list()
+    for chunk_results, chunk_failures in outputs:
+        results.extend(chunk_results)
+        failures.extend(chunk_failures)
+    return results, failures
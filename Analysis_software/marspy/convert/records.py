@@ -0,0 +1,203 @@
+"""
+Pure Python stand-ins for the MARS archive API used by marspy (archive_link).
+The classes mirror the Java methods called in marspy.convert (same names and signatures) but hold and return
+Python objects, which are passed through by the conversion helpers in marspy.convert.molecule.
+"""
+import time
+
+
+class _Record:
+    """
+    Base class providing a simulated round-trip latency (s) for every API call.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def _roundtrip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class TableRecord(_Record):
+    """
+    Stand-in for a MarsTable holding a pandas DataFrame.
+    copy: Set to False to return df itself from to_pandas (e.g. memory-mapped tables of the disk cache)
+    """
+
+    def __init__(self, df, latency=0.0, copy=True):
+        _Record.__init__(self, latency)
+        self.df = df
+        self.copy = copy
+
+    def getColumnHeadingList(self):
+        self._roundtrip()
+        return list(self.df.columns)
+
+    def getRowCount(self):
+        self._roundtrip()
+        return len(self.df)
+
+    def to_pandas(self):
+        self._roundtrip()
+        return self.df.copy() if self.copy else self.df
+
+
+class RegionRecord(_Record):
+    """
+    Stand-in for a MARS region of interest.
+    """
+
+    def __init__(self, column, start, end, latency=0.0):
+        _Record.__init__(self, latency)
+        self.column = column
+        self.start = start
+        self.end = end
+
+    def getColumn(self):
+        self._roundtrip()
+        return self.column
+
+    def getStart(self):
+        self._roundtrip()
+        return self.start
+
+    def getEnd(self):
+        self._roundtrip()
+        return self.end
+
+
+class MetadataRecord(_Record):
+    """
+    Stand-in for a MarsMetadata record with numeric and string parameters.
+    """
+
+    def __init__(self, uid, parameters=None, string_parameters=None, latency=0.0):
+        _Record.__init__(self, latency)
+        self.uid = uid
+        self.parameters = dict() if parameters is None else parameters
+        self.string_parameters = dict() if string_parameters is None else string_parameters
+
+    def getParameters(self):
+        self._roundtrip()
+        return dict(self.parameters)
+
+    def getStringParameter(self, name):
+        self._roundtrip()
+        # MARS returns an empty string for parameters not set
+        return self.string_parameters.get(name, '')
+
+
+class MoleculeRecord(_Record):
+    """
+    Stand-in for a MARS Molecule / DnaMolecule record.
+    segments_tables: dict with (x column, y column, region name) as keys and segments DataFrames as values
+    regions: dict with region names as keys and RegionRecords as values
+    copy: Set to False to return tables without copying them
+    """
+
+    def __init__(self, uid, metadata_uid, table, parameters=None, tags=None, regions=None, segments_tables=None,
+                 latency=0.0, copy=True):
+        _Record.__init__(self, latency)
+        self.uid = uid
+        self.metadata_uid = metadata_uid
+        self.table = TableRecord(table, latency=latency, copy=copy)
+        self.copy = copy
+        self.parameters = dict() if parameters is None else parameters
+        self.tags = list() if tags is None else tags
+        self.regions = dict() if regions is None else regions
+        self.segments_tables = dict() if segments_tables is None else segments_tables
+
+    def getMetadataUID(self):
+        self._roundtrip()
+        return self.metadata_uid
+
+    def getParameters(self):
+        self._roundtrip()
+        return dict(self.parameters)
+
+    def getTags(self):
+        self._roundtrip()
+        return list(self.tags)
+
+    def hasTag(self, tag):
+        self._roundtrip()
+        return tag in self.tags
+
+    def getRegionNames(self):
+        self._roundtrip()
+        return list(self.regions)
+
+    def getRegion(self, name):
+        self._roundtrip()
+        return self.regions[name]
+
+    def getTable(self):
+        self._roundtrip()
+        return self.table
+
+    def getSegmentsTableNames(self):
+        self._roundtrip()
+        return list(self.segments_tables)
+
+    def getSegmentsTable(self, x_column, y_column, region):
+        self._roundtrip()
+        df = self.segments_tables[(x_column, y_column, region)]
+        return df.copy() if self.copy else df
+
+
+class PropertiesRecord(_Record):
+    """
+    Stand-in for MoleculeArchiveProperties.
+    """
+
+    def __init__(self, column_set, latency=0.0):
+        _Record.__init__(self, latency)
+        self.column_set = column_set
+
+    def getColumnSet(self):
+        self._roundtrip()
+        return set(self.column_set)
+
+
+class ArchiveRecord(_Record):
+    """
+    Stand-in for a MARS MoleculeArchive (archive_link).
+    molecules / metadata: MoleculeRecords / MetadataRecords in archive order
+    column_set: DataTable columns of all molecules (collected from the molecule tables if None)
+    """
+
+    def __init__(self, molecules, metadata, column_set=None, latency=0.0):
+        _Record.__init__(self, latency)
+        self.molecules = {molecule.uid: molecule for molecule in molecules}
+        self.metadata = {record.uid: record for record in metadata}
+        self.column_set = column_set
+
+    @property
+    def moleculeUIDs(self):
+        return self.getMoleculeUIDs()
+
+    def getMoleculeUIDs(self):
+        self._roundtrip()
+        return list(self.molecules)
+
+    def getMetadataUIDs(self):
+        self._roundtrip()
+        return list(self.metadata)
+
+    def get(self, uid):
+        self._roundtrip()
+        return self.molecules[uid]
+
+    def getMetadata(self, uid):
+        self._roundtrip()
+        return self.metadata[uid]
+
+    def properties(self):
+        self._roundtrip()
+        column_set = self.column_set
+        if column_set is None:
+            column_set = set()
+            for molecule in self.molecules.values():
+                column_set.update(molecule.table.df.columns)
+        return PropertiesRecord(column_set, latency=self.latency)
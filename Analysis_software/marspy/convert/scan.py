@@ -0,0 +1,75 @@
+import warnings
+from collections import namedtuple
+
+from marspy.convert.molecule import MarsPyWarning, to_python
+from marspy.convert.parallel import thread_map
+
+# experimental condition stored as metadata string parameter
+# name: string parameter (and archive attribute), default: value if not set, uniform: all metadata records of an
+# archive need to agree, description: used in messages
+ConditionField = namedtuple('ConditionField', ['name', 'default', 'uniform', 'description'])
+
+CONDITION_FIELDS = (ConditionField('nucleotide', 'n/a', True, 'nucleotide'),
+                    ConditionField('nacl', 'n/a', True, 'NaCl concentration'),
+                    ConditionField('mcm', 'n/a', True, 'MCM variant'))
+
+
+class ArchiveScan(namedtuple('ArchiveScan', ['metadata_uids', 'metadata_params', 'string_params', 'molecule_uids',
+                                             'tags', 'conditions'])):
+    """
+    Result of scan_archive.
+    metadata_params / string_params: dict metadata uid: dict of (string) parameters
+    tags: dict molecule uid: list of tags (molecule_uids in archive order)
+    conditions: dict condition field name: value
+    """
+    __slots__ = ()
+
+    def uids_with_tag(self, tag):
+        """
+        Molecule UIDs carrying tag (in archive order).
+        """
+        return [uid for uid in self.molecule_uids if tag in self.tags[uid]]
+
+    def count_tag(self, tag):
+        return sum(tag in tags for tags in self.tags.values())
+
+    def sum_metadata_param(self, name):
+        return sum(params[name] for params in self.metadata_params.values())
+
+
+def scan_archive(archive_link, fields=CONDITION_FIELDS, workers=1):
+    """
+    Reads all metadata parameters and all molecule tags of an archive in a single pass (one lookup per record) and
+    resolves the condition fields.
+    workers: number of threads used to read molecule tags
+    Returns ArchiveScan
+    """
+    metadata_uids = tuple(to_python(archive_link.getMetadataUIDs()))
+    metadata_params, string_params = dict(), dict()
+    for metadata_uid in metadata_uids:
+        record = archive_link.getMetadata(metadata_uid)
+        metadata_params[metadata_uid] = dict(to_python(record.getParameters()))
+        string_params[metadata_uid] = {field.name: record.getStringParameter(field.name) for field in fields}
+
+    molecule_uids = list(to_python(archive_link.getMoleculeUIDs()))
+    tags = dict(zip(molecule_uids, thread_map(lambda uid: list(to_python(archive_link.get(uid).getTags())),
+                                              molecule_uids, workers=workers)))
+
+    conditions = {field.name: resolve_condition(field, [string_params[uid][field.name] for uid in metadata_uids])
+                  for field in fields}
+    return ArchiveScan(metadata_uids, metadata_params, string_params, molecule_uids, tags, conditions)
+
+
+def resolve_condition(field, values):
+    """
+    Value of a condition field from the values of all metadata records.
+    Raises MarsPyWarning if field is uniform but metadata records disagree, warns if the field is not set.
+    """
+    # check if all metadata parameters match & raise warning if conditions in one archive are not identical
+    if field.uniform and len(set(values)) > 1:
+        raise MarsPyWarning(f'{field.description} differs between metadata records: {sorted(set(values))}')
+    # if StringParameter is not set, getStringParameter returns empty string ''
+    if not values or len(values[0]) == 0:
+        warnings.warn(f'{field.description} not found. Setting default to {field.default}', MarsPyWarning)
+        return field.default
+    return values[0]
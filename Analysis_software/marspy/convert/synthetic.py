@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from marspy.convert.records import ArchiveRecord, MetadataRecord, MoleculeRecord, RegionRecord
+
+
+def synthetic_archive(n_molecules=100, n_frames=500, proteins=('Cohesin', 'MCM'), pause_density=0.2,
+                      n_metadata=1, accept_tag='accept', reject_fraction=0.1, conditions=None, seed=42, latency=0.0):
+    """
+    Generates an in-process stand-in for a MARS DnaMoleculeArchive (archive_link) with random DNA flow stretching
+    trajectories (see marspy.convert.records).
+    :param n_molecules: number of molecule records
+    :param n_frames: frames per molecule
+    :param proteins: protein names, the first protein is present on every molecule, others on every second molecule
+    :param pause_density: fraction of rate segments which are pauses
+    :param n_metadata: number of metadata records (datasets)
+    :param accept_tag: tag of accepted molecules
+    :param reject_fraction: fraction of molecules tagged with reject_dna (not accepted)
+    :param conditions: string parameters set on all metadata records (default nucleotide, nacl and mcm)
+    :param seed: seed for np.random.Generator
+    :param latency: simulated round-trip latency (s) for every API call
+    :return: ArchiveRecord
+    """
+    rng = np.random.default_rng(seed)
+    if conditions is None:
+        conditions = dict(nucleotide='ATP', nacl='150 mM', mcm='wt')
+    metadata_uids = [f'metadata_{i}' for i in range(n_metadata)]
+
+    molecules = []
+    for i in range(n_molecules):
+        uid = f'molecule_{i:06d}'
+        # first protein on all molecules, all others on every second molecule
+        present = [protein for j, protein in enumerate(proteins) if j == 0 or i % 2 == 0]
+        columns = dict()
+        segments_tables = dict()
+        for protein in present:
+            prefix = protein + '_1_'
+            columns.update(_trajectory(rng, prefix, n_frames))
+            segments_tables.update(_segments_tables(rng, prefix, columns, pause_density))
+
+        dna_length = rng.normal(36, 2)
+        parameters = dict(Dna_Top_X1=100.0, Dna_Top_Y1=50.0, Dna_Bottom_X2=100.0 + dna_length, Dna_Bottom_Y2=50.0)
+        for protein in proteins:
+            parameters['Number_' + protein] = float(protein in present)
+            parameters[protein + '_bleaching_steps'] = float(
+                len(segments_tables.get((protein + '_1_Time_(s)', protein + '_1_Intensity', ''), [])) - 1)
+
+        tags = ['reject_dna'] if rng.random() < reject_fraction else [accept_tag]
+        regions = {'bleaching': RegionRecord(proteins[0] + '_1_Time_(s)', 0.0, n_frames / 10, latency=latency)}
+        molecules.append(MoleculeRecord(uid=uid, metadata_uid=metadata_uids[i % n_metadata],
+                                        table=pd.DataFrame(columns), parameters=parameters, tags=tags,
+                                        regions=regions, segments_tables=segments_tables, latency=latency))
+
+    metadata = [MetadataRecord(metadata_uid,
+                               parameters=dict(DnaMoleculeCount=float(sum(molecule.metadata_uid == metadata_uid
+                                                                          for molecule in molecules))),
+                               string_parameters=dict(conditions), latency=latency)
+                for metadata_uid in metadata_uids]
+
+    return ArchiveRecord(molecules, metadata, latency=latency)
+
+
+def _trajectory(rng, prefix, n_frames):
+    """
+    Random walk on DNA (bp) with missing frames and decaying intensity.
+    """
+    frames = np.arange(n_frames, dtype=float)
+    # missing frames
+    tracked = rng.random(n_frames) > 0.05
+    position = 5000 + np.cumsum(rng.normal(0, 150, n_frames))
+    intensity = 1000 * (frames < rng.integers(n_frames // 2, n_frames + 1)) + rng.normal(0, 20, n_frames)
+    return {prefix + 'T': np.where(tracked, frames, np.nan),
+            prefix + 'Time_(s)': np.where(tracked, frames, np.nan),
+            prefix + 'Position_on_DNA': np.where(tracked, position, np.nan),
+            prefix + 'Intensity': np.where(tracked, intensity, np.nan)}
+
+
+def _segments_tables(rng, prefix, columns, pause_density):
+    """
+    Rate (Position_on_DNA) and bleaching (Intensity) SegmentsTables for one protein.
+    """
+    time = columns[prefix + 'Time_(s)']
+    end = np.nanmax(time)
+    n_segments = max(1, int(end // 25))
+    bounds = np.unique(np.concatenate([[0.0, end], rng.uniform(0, end, n_segments - 1).round()]))
+    x1, x2 = bounds[:-1], bounds[1:]
+    pause = rng.random(len(x1)) < pause_density
+    rate = np.where(pause, rng.normal(0, 1, len(x1)), rng.normal(0, 300, len(x1)))
+    y1 = 5000 + rng.normal(0, 500, len(x1))
+    rate_df = pd.DataFrame(dict(X1=x1, Y1=y1, X2=x2, Y2=y1 + rate * (x2 - x1),
+                                A=y1, Sigma_A=rng.uniform(1, 20, len(x1)),
+                                B=rate, Sigma_B=rng.uniform(1, 20, len(x1))))
+
+    # bleaching: 1 - 3 steps down to background
+    n_steps = rng.integers(1, 4)
+    steps = np.sort(rng.uniform(0, end, n_steps))
+    x1 = np.concatenate([[0.0], steps])
+    x2 = np.concatenate([steps, [end]])
+    level = np.concatenate([np.sort(rng.uniform(300, 1000, n_steps))[::-1], [0.0]])
+    bleaching_df = pd.DataFrame(dict(X1=x1, Y1=level, X2=x2, Y2=level, A=level, Sigma_A=np.zeros(len(x1)),
+                                     B=np.zeros(len(x1)), Sigma_B=np.zeros(len(x1))))
+
+    return {(prefix + 'Time_(s)', prefix + 'Position_on_DNA', ''): rate_df,
+            (prefix + 'Time_(s)', prefix + 'Intensity', ''): bleaching_df}
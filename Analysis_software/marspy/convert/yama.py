@@ -0,0 +1,655 @@
+"""
+JVM-free reader for MARS .yama archives.
+
+A .yama file holds one JSON object (plain text or Smile binary JSON, optionally gzip compressed) with the fields
+properties, metadata and molecules. Records are parsed straight into NumPy/pandas, molecule records are streamed one by
+one. read_yama returns an ArchiveRecord (see marspy.convert.records) which can be passed as archive_link to
+DnaMoleculeArchive / SingleMoleculeArchive.
+Field names are matched case-insensitively and common aliases are accepted (see FIELDS).
+"""
+import gzip
+import io
+import json
+import struct
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from marspy.convert.molecule import MarsPyException
+from marspy.convert.records import ArchiveRecord, MetadataRecord, MoleculeRecord, RegionRecord
+
+# accepted field names (lower case) of MARS records
+FIELDS = dict(uid=('uid',),
+              metadata_uid=('metadatauid', 'imagemetadatauid'),
+              tags=('tags',),
+              parameters=('parameters',),
+              string_parameters=('stringparameters',),
+              table=('table', 'datatable'),
+              segments_tables=('segmenttables', 'segmentstables'),
+              regions=('regionsofinterest', 'regions'),
+              metadata=('metadata', 'imagemetadata'),
+              molecules=('molecules',),
+              columns=('columns',),
+              header=('header', 'name'),
+              type=('type',),
+              values=('values',),
+              x_column=('xcolumnname', 'xcolumn'),
+              y_column=('ycolumnname', 'ycolumn'),
+              region_name=('regionname', 'region'),
+              name=('name',),
+              column=('column', 'columnname'),
+              start=('start',),
+              end=('end',))
+
+# MarsTable column types (lower case)
+COLUMN_TYPES = dict(double=('double', 'float'), integer=('integer', 'int', 'long'), string=('string', 'generic'))
+
+SMILE_HEADER = b':)\n'
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def open_yama(filepath):
+    """
+    Opens .yama file and detects encoding. Returns binary file object and encoding ('json' or 'smile').
+    """
+    file = open(filepath, 'rb')
+    if file.peek(2)[:2] == GZIP_MAGIC:
+        file = io.BufferedReader(gzip.GzipFile(fileobj=file))
+    encoding = 'smile' if file.peek(3)[:3] == SMILE_HEADER else 'json'
+    return file, encoding
+
+
+def iter_yama(filepath, chunk_size=2 ** 20):
+    """
+    Streams the top-level fields of a .yama file as (field name, value) pairs.
+    Molecule records are not collected but yielded one by one as ('molecule', record).
+    """
+    file, encoding = open_yama(filepath)
+    with file:
+        if encoding == 'smile':
+            yield from SmileDecoder(file, chunk_size=chunk_size).iter_archive()
+        else:
+            yield from _JsonStream(io.TextIOWrapper(file, encoding='utf-8'), chunk_size=chunk_size).iter_archive()
+
+
+def iter_molecules(filepath):
+    """
+    Streams molecule records of a .yama file as MoleculeRecords.
+    """
+    for key, value in iter_yama(filepath):
+        if key == 'molecule':
+            yield molecule_record(value)
+
+
+def read_yama(filepath, accept_tag=None):
+    """
+    Reads .yama file without JVM. Returns ArchiveRecord (same API as the archive_link of MARS archives).
+    accept_tag: if set, tables and SegmentsTables are only kept for molecules with this tag (all other molecules only
+    keep parameters, tags and column headings)
+    """
+    molecules, metadata = list(), list()
+    column_set = set()
+    for key, value in iter_yama(filepath):
+        if key == 'molecule':
+            record = molecule_record(value)
+            column_set.update(record.table.df.columns)
+            if accept_tag is not None and accept_tag not in record.tags:
+                record.table.df = record.table.df.iloc[:0]
+                record.segments_tables = dict()
+            molecules.append(record)
+        elif key.lower() in FIELDS['metadata']:
+            metadata.extend(metadata_record(raw) for raw in value)
+    return ArchiveRecord(molecules, metadata, column_set=column_set)
+
+
+def _field(raw, name, default=None):
+    """
+    Case-insensitive lookup of field name (see FIELDS) in a parsed record.
+    """
+    for key, value in raw.items():
+        if key.lower() in FIELDS[name]:
+            return value
+    return default
+
+
+def table_to_frame(raw):
+    """
+    Converts MarsTable JSON to DataFrame. Accepted layouts: {"Columns": [{"Header", "Type", "Values"}]} (as written by
+    MARS), a bare list of columns with header and values, or a dict header: values.
+    Columns of type double (or without type and with only numeric values) are read as float64 (null and "NaN" as NaN),
+    integer columns keep int64 if all values are integers, all other columns are kept as object columns.
+    Raises MarsPyException for any other layout.
+    """
+    if raw is None:
+        return pd.DataFrame()
+    if isinstance(raw, dict) and _field(raw, 'columns') is not None:
+        raw = _field(raw, 'columns')
+        if not isinstance(raw, list):
+            raise MarsPyException(f'Unknown MarsTable layout: Columns is {type(raw).__name__}, expected array.')
+    if isinstance(raw, dict) and all(isinstance(values, list) and not any(isinstance(value, (dict, list))
+                                                                          for value in values)
+                                     for values in raw.values()):
+        columns = ((header, None, values) for header, values in raw.items())
+    elif isinstance(raw, list) and all(isinstance(column, dict) and _field(column, 'header') is not None and
+                                       isinstance(_field(column, 'values', []), list) for column in raw):
+        columns = ((_field(column, 'header'), _field(column, 'type'), _field(column, 'values', [])) for column in raw)
+    else:
+        raise MarsPyException(f'Unknown MarsTable layout {_layout(raw)}.')
+
+    data = dict()
+    for header, column_type, values in columns:
+        data[header] = _column(header, column_type, values)
+    return pd.DataFrame(data)
+
+
+def _column(header, column_type, values):
+    column_type = None if column_type is None else str(column_type).lower()
+    if column_type in COLUMN_TYPES['string']:
+        return np.array(values, dtype=object)
+    if column_type not in COLUMN_TYPES['double'] and values and all(
+            isinstance(value, int) and not isinstance(value, bool) for value in values):
+        return np.array(values, dtype=np.int64)
+    try:
+        return np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64)
+    except (TypeError, ValueError):
+        if column_type is not None:
+            raise MarsPyException(f'Column {header} of type {column_type} holds non-numeric values.')
+        # non-numeric (string) column
+        return np.array(values, dtype=object)
+
+
+def _layout(raw):
+    if isinstance(raw, dict):
+        return f'(object with fields {list(raw)[:5]})'
+    if isinstance(raw, list):
+        return f'(array of {sorted({type(column).__name__ for column in raw})})'
+    return f'({type(raw).__name__})'
+
+
+def molecule_record(raw):
+    """
+    Converts parsed molecule JSON to MoleculeRecord.
+    """
+    # string parameters of molecules are not used by marspy
+    parameters, _ = _split_parameters(raw)
+
+    raw_regions = _field(raw, 'regions', [])
+    if isinstance(raw_regions, dict):
+        raw_regions = [dict(region, name=name) for name, region in raw_regions.items()]
+    regions = {_field(region, 'name'): RegionRecord(_field(region, 'column'), _field(region, 'start'),
+                                                     _field(region, 'end'))
+               for region in raw_regions}
+
+    segments_tables = {(_field(segments, 'x_column'), _field(segments, 'y_column'),
+                        _field(segments, 'region_name', '')): table_to_frame(_field(segments, 'table'))
+                       for segments in _field(raw, 'segments_tables', [])}
+
+    return MoleculeRecord(uid=_field(raw, 'uid'), metadata_uid=_field(raw, 'metadata_uid'),
+                          table=table_to_frame(_field(raw, 'table')), parameters=parameters,
+                          tags=list(_field(raw, 'tags', [])), regions=regions, segments_tables=segments_tables)
+
+
+def metadata_record(raw):
+    """
+    Converts parsed metadata JSON to MetadataRecord.
+    """
+    parameters, string_parameters = _split_parameters(raw)
+    return MetadataRecord(_field(raw, 'uid'), parameters=parameters, string_parameters=string_parameters)
+
+
+def _split_parameters(raw):
+    """
+    Numeric and string parameters of a record (string values may also be stored among parameters).
+    """
+    parameters, string_parameters = dict(), dict(_field(raw, 'string_parameters', {}))
+    for name, value in _field(raw, 'parameters', {}).items():
+        if isinstance(value, str):
+            string_parameters[name] = value
+        else:
+            parameters[name] = np.nan if value is None else value
+    return parameters, string_parameters
+
+
+class _JsonStream:
+    """
+    Incremental JSON reader, values are decoded with json.JSONDecoder.raw_decode on a growing text buffer.
+    """
+
+    def __init__(self, file, chunk_size=2 ** 20):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size=None):
+        chunk = self.file.read(self.chunk_size if size is None else size)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Next non-whitespace character ('' at end of file).
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if char == '' or char not in chars:
+            raise ValueError(f'Invalid .yama file: expected {chars!r}, found {char!r}.')
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # incomplete value: grow buffer (at least doubling to keep re-parsing linear)
+                if not self._fill(max(self.chunk_size, len(self.buffer))):
+                    raise
+                continue
+            # numbers / literals ending at the end of the buffer might continue in the next chunk
+            if end == len(self.buffer) and not isinstance(value, (dict, list, str)) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def iter_archive(self):
+        self.expect('{')
+        if self.peek() == '}':
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            if key.lower() in FIELDS['molecules'] and self.peek() == '[':
+                self.expect('[')
+                if self.peek() == ']':
+                    self.pos += 1
+                else:
+                    while True:
+                        yield 'molecule', self.value()
+                        if self.expect(',]') == ']':
+                            break
+            else:
+                yield key, self.value()
+            if self.expect(',}') == '}':
+                return
+
+
+class SmileDecoder:
+    """
+    Decoder for Smile binary JSON (format specification 1.0 as written by Jackson) reading from a binary stream.
+    """
+    # shared name / string value tables are reset once they hold 1024 entries
+    MAX_SHARED = 1024
+
+    def __init__(self, file, chunk_size=2 ** 20):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = b''
+        self.pos = 0
+        self.shared_names = list()
+        self.shared_values = list()
+        header = self._read(4)
+        if header[:3] != SMILE_HEADER:
+            raise ValueError('Invalid Smile header.')
+        self.names_enabled = bool(header[3] & 0x01)
+        self.values_enabled = bool(header[3] & 0x02)
+
+    def _read(self, n):
+        if self.pos + n > len(self.buffer):
+            self.buffer = self.buffer[self.pos:] + self.file.read(max(self.chunk_size, n))
+            self.pos = 0
+            if n > len(self.buffer):
+                raise ValueError('Unexpected end of Smile data.')
+        data = self.buffer[self.pos:self.pos + n]
+        self.pos += n
+        return data
+
+    def _byte(self):
+        if self.pos >= len(self.buffer):
+            self._read(1)
+            self.pos -= 1
+        byte = self.buffer[self.pos]
+        self.pos += 1
+        return byte
+
+    def _peek(self):
+        byte = self._byte()
+        self.pos -= 1
+        return byte
+
+    def _read_until_end_marker(self):
+        data = bytearray()
+        while True:
+            byte = self._byte()
+            if byte == 0xFC:
+                return bytes(data)
+            data.append(byte)
+
+    def _vint(self):
+        # 7 bits per byte, last byte (high bit set) holds 6 bits
+        value = 0
+        while True:
+            byte = self._byte()
+            if byte & 0x80:
+                return (value << 6) | (byte & 0x3F)
+            value = (value << 7) | byte
+
+    @staticmethod
+    def _zigzag(value):
+        return (value >> 1) ^ -(value & 1)
+
+    def _bits(self, n_bytes, n_bits):
+        value = 0
+        for byte in self._read(n_bytes):
+            value = (value << 7) | byte
+        return value & ((1 << n_bits) - 1)
+
+    def _binary_7bit(self, length):
+        """
+        Decodes length raw bytes stored as 7-bit groups.
+        """
+        data = bytearray()
+        # 7 raw bytes per 8 encoded bytes
+        for _ in range(length // 7):
+            value = self._bits(8, 56)
+            data.extend(value.to_bytes(7, 'big'))
+        remaining = length % 7
+        if remaining:
+            value = self._byte()
+            for i in range(1, remaining):
+                value = (value << 7) | self._byte()
+                data.append((value >> (7 - i)) & 0xFF)
+            value <<= remaining
+            data.append((value + self._byte()) & 0xFF)
+        return bytes(data)
+
+    def _add_shared(self, table, text):
+        if len(table) >= self.MAX_SHARED:
+            table.clear()
+        table.append(text)
+
+    def _string(self, data, shared):
+        text = data.decode('utf-8')
+        if shared and self.values_enabled:
+            self._add_shared(self.shared_values, text)
+        return text
+
+    def value(self, token=None):
+        token = self._byte() if token is None else token
+        if token == 0x00:
+            raise ValueError('Invalid Smile value token 0x00 (reserved).')
+        if token < 0x20:
+            # short shared value reference, 0x01 refers to the first shared value
+            return self.shared_values[token - 1]
+        if token < 0x40:
+            if token == 0x20:
+                return ''
+            if token == 0x21:
+                return None
+            if token == 0x22:
+                return False
+            if token == 0x23:
+                return True
+            if token in (0x24, 0x25):
+                return self._zigzag(self._vint())
+            if token == 0x26:
+                return int.from_bytes(self._binary_7bit(self._vint()), 'big', signed=True)
+            if token == 0x28:
+                return struct.unpack('>f', self._bits(5, 32).to_bytes(4, 'big'))[0]
+            if token == 0x29:
+                return struct.unpack('>d', self._bits(10, 64).to_bytes(8, 'big'))[0]
+            if token == 0x2A:
+                scale = self._zigzag(self._vint())
+                unscaled = int.from_bytes(self._binary_7bit(self._vint()), 'big', signed=True)
+                return float(Decimal(unscaled).scaleb(-scale))
+        elif token < 0x60:
+            return self._string(self._read((token & 0x1F) + 1), shared=True)
+        elif token < 0x80:
+            return self._string(self._read((token & 0x1F) + 33), shared=True)
+        elif token < 0xA0:
+            return self._string(self._read((token & 0x1F) + 2), shared=True)
+        elif token < 0xC0:
+            return self._string(self._read((token & 0x1F) + 34), shared=True)
+        elif token < 0xE0:
+            return self._zigzag(token & 0x1F)
+        elif token in (0xE0, 0xE4):
+            return self._string(self._read_until_end_marker(), shared=False)
+        elif token == 0xE8:
+            return self._binary_7bit(self._vint())
+        elif 0xEC <= token <= 0xEF:
+            return self.shared_values[((token & 0x03) << 8) | self._byte()]
+        elif token == 0xF8:
+            return self._array()
+        elif token == 0xFA:
+            return self._object()
+        elif token == 0xFD:
+            return self._read(self._vint())
+        raise ValueError(f'Invalid Smile value token 0x{token:02X}.')
+
+    def key(self):
+        """
+        Next field name of the current object (None at end of object).
+        """
+        token = self._byte()
+        if token == 0xFB:
+            return None
+        if token == 0x20:
+            return ''
+        if 0x30 <= token <= 0x33:
+            return self.shared_names[((token & 0x03) << 8) | self._byte()]
+        if 0x40 <= token < 0x80:
+            return self.shared_names[token & 0x3F]
+        if token == 0x34:
+            name = self._read_until_end_marker().decode('utf-8')
+        elif 0x80 <= token < 0xC0:
+            name = self._read((token & 0x3F) + 1).decode('utf-8')
+        elif 0xC0 <= token < 0xF8:
+            name = self._read((token & 0x3F) + 2).decode('utf-8')
+        else:
+            raise ValueError(f'Invalid Smile key token 0x{token:02X}.')
+        if self.names_enabled:
+            self._add_shared(self.shared_names, name)
+        return name
+
+    def _array(self):
+        values = list()
+        while True:
+            token = self._byte()
+            if token == 0xF9:
+                return values
+            values.append(self.value(token))
+
+    def _object(self):
+        values = dict()
+        while True:
+            key = self.key()
+            if key is None:
+                return values
+            values[key] = self.value()
+
+    def iter_archive(self):
+        if self._byte() != 0xFA:
+            raise ValueError('Invalid .yama file: archive is not a Smile object.')
+        while True:
+            key = self.key()
+            if key is None:
+                return
+            if key.lower() in FIELDS['molecules'] and self._peek() == 0xF8:
+                self._byte()
+                while True:
+                    token = self._byte()
+                    if token == 0xF9:
+                        break
+                    yield 'molecule', self.value(token)
+            else:
+                yield key, self.value()
+
+
+def write_yama(archive_record, filepath, encoding='json', shared=True):
+    """
+    Writes an ArchiveRecord (e.g. generated by marspy.convert.synthetic) as .yama file.
+    Used to generate fixture files for read_yama.
+    encoding: 'json' or 'smile'
+    shared: enable shared names / string values (Smile only)
+    """
+    archive = dict(properties=dict(numberOfMolecules=len(archive_record.molecules)),
+                   metadata=[dict(UID=record.uid, Parameters=record.parameters,
+                                  StringParameters=record.string_parameters)
+                             for record in archive_record.metadata.values()],
+                   molecules=[_molecule_json(record) for record in archive_record.molecules.values()])
+    if encoding == 'smile':
+        with open(filepath, 'wb') as file:
+            file.write(SmileEncoder(shared=shared).encode(archive))
+    else:
+        with open(filepath, 'w') as file:
+            json.dump(archive, file)
+
+
+def _table_json(df):
+    return [dict(header=column, values=[None if isinstance(value, float) and np.isnan(value) else value
+                                        for value in df[column].tolist()])
+            for column in df.columns]
+
+
+def _molecule_json(record):
+    return dict(UID=record.uid, MetadataUID=record.metadata_uid, Tags=list(record.tags),
+                Parameters=record.parameters,
+                Table=_table_json(record.table.df),
+                SegmentTables=[dict(xColumnName=x, yColumnName=y, regionName=region, table=_table_json(df))
+                               for (x, y, region), df in record.segments_tables.items()],
+                RegionsOfInterest=[dict(name=name, column=region.column, start=region.start, end=region.end)
+                                   for name, region in record.regions.items()])
+
+
+class SmileEncoder:
+    """
+    Minimal Smile encoder (counterpart of SmileDecoder) used to write fixture files.
+    """
+
+    def __init__(self, shared=True):
+        self.shared = shared
+        self.shared_names = dict()
+        self.shared_values = dict()
+
+    def encode(self, value):
+        out = bytearray(SMILE_HEADER)
+        out.append(0x03 if self.shared else 0x00)
+        self._value(value, out)
+        return bytes(out)
+
+    @staticmethod
+    def _vint(value, out):
+        groups = [value & 0x3F]
+        value >>= 6
+        while value:
+            groups.append(value & 0x7F)
+            value >>= 7
+        out.extend(reversed(groups[1:]))
+        out.append(0x80 | groups[0])
+
+    @staticmethod
+    def _bits(value, n_bytes, out):
+        out.extend((value >> (7 * (n_bytes - 1 - i))) & 0x7F for i in range(n_bytes))
+
+    @staticmethod
+    def _add_shared(table, text):
+        if len(table) >= SmileDecoder.MAX_SHARED:
+            table.clear()
+        table[text] = len(table)
+
+    def _value(self, value, out):
+        if value is None:
+            out.append(0x21)
+        elif value is True or value is False:
+            out.append(0x23 if value else 0x22)
+        elif isinstance(value, (int, np.integer)) and -2 ** 63 <= value < 2 ** 63:
+            value = int(value)
+            zigzag = (value << 1) ^ (value >> 63)
+            if -16 <= value <= 15:
+                out.append(0xC0 | zigzag)
+            else:
+                out.append(0x24 if -2 ** 31 <= value < 2 ** 31 else 0x25)
+                self._vint(zigzag, out)
+        elif isinstance(value, (float, np.floating)):
+            out.append(0x29)
+            self._bits(struct.unpack('>Q', struct.pack('>d', value))[0], 10, out)
+        elif isinstance(value, str):
+            self._text(value, out)
+        elif isinstance(value, dict):
+            out.append(0xFA)
+            for key, item in value.items():
+                self._key(str(key), out)
+                self._value(item, out)
+            out.append(0xFB)
+        elif isinstance(value, (list, tuple)):
+            out.append(0xF8)
+            for item in value:
+                self._value(item, out)
+            out.append(0xF9)
+        else:
+            raise TypeError(f'Cannot encode {type(value)} as Smile.')
+
+    def _text(self, text, out):
+        if text == '':
+            out.append(0x20)
+            return
+        if self.shared and text in self.shared_values:
+            index = self.shared_values[text]
+            if index <= 30:
+                out.append(index + 1)
+            else:
+                out.extend((0xEC | (index >> 8), index & 0xFF))
+            return
+        data = text.encode('utf-8')
+        ascii_text = len(data) == len(text)
+        if ascii_text and len(data) <= 64:
+            out.append((0x40 | (len(data) - 1)) if len(data) <= 32 else (0x60 | (len(data) - 33)))
+        elif not ascii_text and 2 <= len(data) <= 65:
+            out.append((0x80 | (len(data) - 2)) if len(data) <= 33 else (0xA0 | (len(data) - 34)))
+        else:
+            out.append(0xE0 if ascii_text else 0xE4)
+            out.extend(data)
+            out.append(0xFC)
+            return
+        out.extend(data)
+        if self.shared:
+            self._add_shared(self.shared_values, text)
+
+    def _key(self, name, out):
+        if name == '':
+            out.append(0x20)
+            return
+        if self.shared and name in self.shared_names:
+            index = self.shared_names[name]
+            if index < 64:
+                out.append(0x40 | index)
+            else:
+                out.extend((0x30 | (index >> 8), index & 0xFF))
+            return
+        data = name.encode('utf-8')
+        if len(data) == len(name) and len(data) <= 64:
+            out.append(0x80 | (len(data) - 1))
+            out.extend(data)
+        elif len(data) != len(name) and 2 <= len(data) <= 57:
+            out.append(0xC0 | (len(data) - 2))
+            out.extend(data)
+        else:
+            out.append(0x34)
+            out.extend(data)
+            out.append(0xFC)
+        if self.shared:
+            self._add_shared(self.shared_names, name)
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+
+def msd_curve(position, frame, time, groups=None, taus=(1,), start=-np.inf, end=np.inf, n_groups=None):
+    """
+    Vectorized mean square displacement for several lags.
+    Pairs (i, i + tau) are only used if both rows belong to the same group (molecule), are tau frames apart (T)
+    and have non-NaN positions. Arrays of several molecules are processed in one pass.
+    :param position: positions (e.g. Position_on_DNA)
+    :param frame: frame numbers (T)
+    :param time: times (e.g. Time_(s))
+    :param groups: group index (0..n_groups-1) of each row, rows of a group have to be consecutive (default: one group)
+    :param taus: lags in frames
+    :param start: only use pairs with time[i] >= start (default -inf)
+    :param end: only use pairs with time[i + tau] <= end (default inf)
+    :param n_groups: number of groups (default: groups.max() + 1)
+    :return: msd, dtime, n_pairs - arrays of shape (n_groups, n_taus)
+    """
+    position = np.asarray(position, dtype=float)
+    frame = np.asarray(frame, dtype=float)
+    time = np.asarray(time, dtype=float)
+    groups = np.zeros(len(position), dtype=np.int64) if groups is None else np.asarray(groups)
+    taus = np.atleast_1d(taus)
+    if n_groups is None:
+        n_groups = int(groups.max()) + 1 if len(groups) else 0
+
+    squares = np.zeros((n_groups, len(taus)))
+    dtimes = np.zeros((n_groups, len(taus)))
+    n_pairs = np.zeros((n_groups, len(taus)), dtype=np.int64)
+    for j, tau in enumerate(taus):
+        if tau >= len(position):
+            continue
+        displacement = position[tau:] - position[:-tau]
+        dtime = time[tau:] - time[:-tau]
+        # NaN positions or frames fail the comparisons as well
+        valid = ((groups[tau:] == groups[:-tau]) & (frame[tau:] - frame[:-tau] == tau) & ~np.isnan(displacement) &
+                 (time[:-tau] >= start) & (time[tau:] <= end))
+        group = groups[:-tau][valid]
+        n_pairs[:, j] = np.bincount(group, minlength=n_groups)
+        squares[:, j] = np.bincount(group, weights=displacement[valid] ** 2, minlength=n_groups)
+        dtimes[:, j] = np.bincount(group, weights=dtime[valid], minlength=n_groups)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return squares / n_pairs, dtimes / n_pairs, n_pairs
+
+
+def fit_diffusion(msd, dtime):
+    """
+    Diffusion coefficients from least squares fit of msd = 2 * D * dtime (through origin) over all lags.
+    :param msd: array of shape (n_groups, n_taus)
+    :param dtime: array of shape (n_groups, n_taus)
+    :return: array of diffusion coefficients (n_groups)
+    """
+    msd, dtime = np.atleast_2d(msd), np.atleast_2d(dtime)
+    valid = ~(np.isnan(msd) | np.isnan(dtime))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (np.where(valid, msd * dtime, 0).sum(axis=1) /
+                (2 * np.where(valid, dtime ** 2, 0).sum(axis=1)))
+
+
+def calc_msd(df, prefix, msd_col='Position_on_DNA', time_col='Time_(s)', tau=1, start=np.nan, end=np.nan):
+    """
+    Calculates mean square displacement of a single molecule.
+    Pairs with missing frames in interval or NaN values are removed.
+    df: DataFrame of molecule (e.g. molecule.df_noidle)
+    prefix: protein prefix
+    msd_col: column in df to calculate msd (without protein prefix)
+    time_col: time column in df (without protein prefix)
+    tau: lag (frames) used to calculate msd
+    start / end: time range (default: whole trajectory)
+    Returns msd, dtime (mean time difference underlying msd calculation)
+    """
+    msd, dtime, _ = msd_curve(df[prefix + msd_col], df[prefix + 'T'], df[prefix + time_col], taus=tau,
+                              start=-np.inf if np.isnan(start) else start, end=np.inf if np.isnan(end) else end)
+    return msd[0, 0], dtime[0, 0]
+
+
+def archive_msd(archives, taus=range(1, 11), msd_col='Position_on_DNA', time_col='Time_(s)', noidle=True,
+                scale=1e-3):
+    """
+    MSD curves and diffusion coefficients of all molecules and prefixes of the passed archives.
+    Molecule tables are concatenated per archive and prefix and processed in one pass per lag.
+    archives: archive or iterable of archives
+    taus: lags in frames
+    noidle: use df_noidle of molecules where available (see DnaMoleculeArchive.add_df_noidle)
+    scale: factor applied to positions (default 1e-3: bp to kbp, i.e. msd in kbp^2 and d_coeff in kbp^2/s)
+    Returns tidy DataFrame with columns uid, prefix, tau, msd, dtime, n_pairs and d_coeff (fitted over all lags)
+    """
+    if not isinstance(archives, (list, tuple, set)):
+        archives = [archives]
+    taus = np.atleast_1d(list(taus))
+
+    results = list()
+    for archive in archives:
+        for prefix in sorted(set.union(set(), *(set(getattr(molecule, 'prefixes', {''}))
+                                                 for molecule in archive.molecules))):
+            molecules = [molecule for molecule in archive.molecules if prefix in getattr(molecule, 'prefixes', {''})]
+            frames = [_msd_frame(molecule, noidle) for molecule in molecules]
+            lengths = np.array([len(df) for df in frames])
+            columns = [prefix + msd_col, prefix + 'T', prefix + time_col]
+            position, frame, time = (np.concatenate([df[column].to_numpy(dtype=float) for df in frames])
+                                     for column in columns)
+            msd, dtime, n_pairs = msd_curve(position * scale, frame, time,
+                                            groups=np.repeat(np.arange(len(molecules)), lengths), taus=taus,
+                                            n_groups=len(molecules))
+            d_coeff = fit_diffusion(msd, dtime)
+
+            results.append(pd.DataFrame({'uid': np.repeat([molecule.uid for molecule in molecules], len(taus)),
+                                         'prefix': prefix,
+                                         'tau': np.tile(taus, len(molecules)),
+                                         'msd': msd.ravel(),
+                                         'dtime': dtime.ravel(),
+                                         'n_pairs': n_pairs.ravel(),
+                                         'd_coeff': np.repeat(d_coeff, len(taus))}))
+
+    if not results:
+        return pd.DataFrame(columns=['uid', 'prefix', 'tau', 'msd', 'dtime', 'n_pairs', 'd_coeff'])
+    return pd.concat(results, ignore_index=True)
+
+
+def _msd_frame(molecule, noidle):
+    if noidle and getattr(molecule, 'noidle_prefix', None) is not None:
+        return molecule.df_noidle
+    return molecule.df
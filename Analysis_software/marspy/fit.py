@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+from marspy.stats import MAX_BYTES
+
+# parameter of each model as multiple of the exponential mean lifetime tau
+MODELS = {'exponential': 1., 'half_life': np.log(2)}
+
+
+def cdf(x, parameter, model='half_life'):
+    """
+    Cumulative distribution of the models
+    'exponential': 1 - exp(-x / tau), 'half_life': 1 - 0.5 ** (x / t) (same as func in the thesis notebook)
+    """
+    x = np.asarray(x, dtype=float)
+    if model == 'exponential':
+        return 1 - np.exp(-x / parameter)
+    if model == 'half_life':
+        return 1 - 0.5 ** (x / parameter)
+    raise ValueError(f'Unknown model {model}. Use exponential or half_life.')
+
+
+def fit_durations(durations, model='half_life', x_min=0., censored=None):
+    """
+    Maximum likelihood fit (closed form) of exponentially distributed durations.
+    Durations below x_min are left out, the fit accounts for this truncation (memoryless: tau = mean(x - x_min)).
+    :param durations: array of durations (e.g. pause durations or lifetimes)
+    :param model: 'half_life' (default, t of 1 - 0.5 ** (x / t)) or 'exponential' (tau of 1 - exp(-x / tau))
+    :param x_min: shortest duration that can be detected (default 0)
+    :param censored: optional boolean array, True for durations which did not end within the observation (e.g.
+    molecule still bound at the end of the movie)
+    :return: fitted parameter
+    """
+    durations, events = _prepare(durations, x_min, censored)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return MODELS[_check(model)] * (durations - x_min).sum() / events.sum()
+
+
+def bootstrap_durations(durations, groups=None, model='half_life', x_min=0., censored=None, n_boot=10000, ci=95,
+                        seed=None, max_bytes=MAX_BYTES):
+    """
+    Fits all groups (e.g. conditions) and bootstrap replicates at once: resampling indices of all groups are drawn
+    as one (n_boot, n) matrix (in chunks of max_bytes) and summed per group.
+    :param durations: array of durations
+    :param groups: group label of each duration (default: one group)
+    :param model, x_min, censored: see fit_durations
+    :param n_boot: number of bootstrap replicates (default 10000)
+    :param ci: confidence interval (percentile, default 95)
+    :param seed: seed or np.random.Generator (default None)
+    :param max_bytes: memory cap for index and sample matrices of one chunk (default 64 MiB)
+    :return: DataFrame (index: group) with n, events, parameter, ci_lower, ci_upper and replicates (array)
+    """
+    factor = MODELS[_check(model)]
+    durations = np.asarray(durations, dtype=float)
+    groups = np.zeros(len(durations), dtype=np.int64) if groups is None else np.asarray(groups)
+    censored = np.zeros(len(durations), dtype=bool) if censored is None else np.asarray(censored, dtype=bool)
+    valid = ~np.isnan(durations) & (durations >= x_min) & ~pd.isna(groups)
+    labels, codes = np.unique(groups[valid], return_inverse=True)
+    # rows sorted by group, offsets of the groups
+    order = np.argsort(codes, kind='stable')
+    excess = (durations[valid] - x_min)[order]
+    events = (~censored[valid])[order].astype(float)
+    sizes = np.bincount(codes, minlength=len(labels))
+    offsets = np.cumsum(sizes) - sizes
+    n = len(excess)
+    if n == 0:
+        # e.g. no pauses detected
+        return pd.DataFrame(dict(n=np.zeros(0, dtype=np.int64), events=np.zeros(0, dtype=np.int64),
+                                 parameter=np.zeros(0), ci_lower=np.zeros(0), ci_upper=np.zeros(0),
+                                 replicates=np.zeros(0, dtype=object)), index=pd.Index(labels, name='group'))
+
+    rng = np.random.default_rng(seed)
+    chunk = max(1, int(max_bytes // (n * (8 + 2 * 8))))
+    replicates = list()
+    for start in range(0, n_boot, chunk):
+        size = min(chunk, n_boot - start)
+        # resample within each group: random position in [0, size of group) + offset of group
+        indices = (rng.random((size, n)) * np.repeat(sizes, sizes)).astype(np.int64) + np.repeat(offsets, sizes)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            replicates.append(factor * np.add.reduceat(excess[indices], offsets, axis=1) /
+                              np.add.reduceat(events[indices], offsets, axis=1))
+    replicates = np.concatenate(replicates) if replicates else np.empty((0, len(labels)))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        parameter = factor * np.add.reduceat(excess, offsets) / np.add.reduceat(events, offsets)
+    lower, upper = np.full(len(labels), np.nan), np.full(len(labels), np.nan)
+    if n_boot:
+        lower, upper = np.nanpercentile(replicates, [50 - ci / 2, 50 + ci / 2], axis=0)
+    return pd.DataFrame(dict(n=sizes, events=np.add.reduceat(events, offsets).astype(np.int64),
+                             parameter=parameter, ci_lower=lower, ci_upper=upper,
+                             replicates=list(replicates.T)), index=pd.Index(labels, name='group'))
+
+
+def fit_table(df, value, by=None, model='half_life', x_min=0., censored=None, n_boot=10000, ci=95, seed=None):
+    """
+    Fits the duration column value of a table (e.g. pause_durations or the lifetimes of summarize_molecules) per
+    condition, see bootstrap_durations.
+    :param df: pandas DataFrame
+    :param value: column with durations, e.g. 'pause_duration' or ('Cohesin_1_', 'timespan_(s)')
+    :param by: column or list of columns with conditions (default: all rows in one group)
+    :param censored: optional column marking censored durations
+    :return: DataFrame (index: conditions) with n, events, parameter, ci_lower, ci_upper and replicates
+    """
+    if by is None:
+        groups = None
+    elif isinstance(by, list):
+        groups = pd.MultiIndex.from_frame(df[by].astype(object)).to_flat_index().to_numpy()
+    else:
+        groups = df[by].to_numpy()
+    result = bootstrap_durations(df[value].to_numpy(dtype=float), groups=groups, model=model, x_min=x_min,
+                                 censored=None if censored is None else df[censored].to_numpy(dtype=bool),
+                                 n_boot=n_boot, ci=ci, seed=seed)
+    if isinstance(by, list):
+        result.index = pd.MultiIndex.from_tuples(result.index, names=by)
+    elif by is not None:
+        result.index.name = by
+    return result
+
+
+def pause_durations(archives, prefix='Cohesin_1_', col='B'):
+    """
+    Durations of all detected pauses (see DnaMoleculeArchive.detect_pauses) of the passed archives.
+    Returns DataFrame with uid, nucleotide, nacl, mcm, pause_duration (X2 - X1), pause_start (X1) and
+    pause_position_on_dna (Y1)
+    """
+    if not isinstance(archives, (list, tuple, set)):
+        archives = [archives]
+    columns = ['uid', 'nucleotide', 'nacl', 'mcm', 'pause_duration', 'pause_start', 'pause_position_on_dna']
+    # arrays are collected per SegmentsTable and concatenated once
+    uids, conditions, segments = list(), list(), list()
+    for archive in archives:
+        for molecule in archive.molecules:
+            for seg_df in molecule.seg_dfs or ():
+                if seg_df.type != 'rate' or seg_df.prefix != prefix or 'pause_' + col not in seg_df.df.columns:
+                    continue
+                df = seg_df.df
+                block = df[['X1', 'X2', 'Y1']].to_numpy(dtype=float)[df['pause_' + col].to_numpy(dtype=bool)]
+                uids.append(np.repeat(molecule.uid, len(block)).astype(object))
+                conditions.append(np.repeat([[archive.nucleotide, archive.nacl, archive.mcm]], len(block), axis=0))
+                segments.append(block)
+    if not segments:
+        return pd.DataFrame(columns=columns)
+    segments = np.concatenate(segments)
+    conditions = np.concatenate(conditions)
+    return pd.DataFrame(dict(zip(columns, [np.concatenate(uids), conditions[:, 0], conditions[:, 1],
+                                           conditions[:, 2], segments[:, 1] - segments[:, 0], segments[:, 0],
+                                           segments[:, 2]])))
+
+
+def _check(model):
+    if model not in MODELS:
+        raise ValueError(f'Unknown model {model}. Use exponential or half_life.')
+    return model
+
+
+def _prepare(durations, x_min, censored):
+    durations = np.asarray(durations, dtype=float)
+    events = np.ones(len(durations), dtype=bool) if censored is None else ~np.asarray(censored, dtype=bool)
+    valid = ~np.isnan(durations) & (durations >= x_min)
+    return durations[valid], events[valid]
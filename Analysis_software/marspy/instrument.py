@@ -0,0 +1,262 @@
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+
+# one timed call of a pipeline stage
+# stage: stage name, uid: molecule UID (None for archive-level stages), wall: wall time (s), nbytes: bytes converted
+# (0 if not counted), peak: peak traced memory (bytes, None if memory tracing is off or the stage overlapped with stages
+# of other threads, see enable), thread: thread name
+StageRecord = namedtuple('StageRecord', ['stage', 'uid', 'wall', 'nbytes', 'peak', 'thread'])
+
+# active sinks (instrumentation is disabled if empty)
+_sinks = []
+_memory = False
+# tracemalloc was started by enable (and is stopped by disable)
+_tracing_started = False
+_lock = threading.Lock()
+_local = threading.local()
+# number of open stages per thread (thread ident: depth) and number of stages entered while other threads had open
+# stages (memory tracing only)
+_open = dict()
+_overlaps = 0
+
+
+def enable(*sinks, memory=False):
+    """
+    Enables instrumentation of marspy stages.
+    sinks: objects with an emit(record) method (e.g. Collector, LoggingSink, JsonSink), records are passed as
+    StageRecord
+    memory: Set to True to trace peak memory per stage with tracemalloc (slows down the pipeline considerably).
+    The traced peak is process-wide: stages which overlap with stages of other threads (e.g. workers > 1) report no
+    peak (None), except for the outermost stage, whose peak includes the allocations of all threads.
+    """
+    global _memory, _tracing_started
+    if not sinks:
+        raise ValueError('Pass at least one sink.')
+    _sinks[:] = sinks
+    _memory = memory
+    _open.clear()
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _tracing_started = True
+
+
+def disable():
+    """
+    Disables instrumentation and closes all sinks.
+    """
+    global _memory, _tracing_started
+    sinks = list(_sinks)
+    _sinks.clear()
+    if _tracing_started:
+        tracemalloc.stop()
+    _memory, _tracing_started = False, False
+    for sink in sinks:
+        if hasattr(sink, 'close'):
+            sink.close()
+
+
+def enabled():
+    return bool(_sinks)
+
+
+@contextmanager
+def profile(*sinks, memory=False):
+    """
+    Instrumentation enabled within a with-block, yields the first sink (a new Collector if no sink was passed).
+    E.g.
+        with profile() as collector:
+            archive.detect_pauses()
+        collector.slowest()
+    """
+    sinks = sinks or (Collector(),)
+    enable(*sinks, memory=memory)
+    try:
+        yield sinks[0]
+    finally:
+        disable()
+
+
+def stage(name, uid=None):
+    """
+    Context manager timing one call of stage name (for molecule uid). Returns a shared no-op object if
+    instrumentation is disabled.
+    Bytes converted within the stage are reported with count_bytes(obj) on the object returned by the with-statement.
+    """
+    if not _sinks:
+        return _NULL_STAGE
+    return _Stage(name, uid)
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def count_bytes(self, obj):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('name', 'uid', 'nbytes', 'start', 'child_peak', 'traced', 'root', 'shared', 'overlaps')
+
+    def __init__(self, name, uid):
+        self.name = name
+        self.uid = uid
+        self.nbytes = 0
+        self.child_peak = 0
+
+    def __enter__(self):
+        global _overlaps
+        self.traced = _memory
+        if self.traced:
+            thread = threading.get_ident()
+            with _lock:
+                # outermost stage of all threads
+                self.root = not _open
+                # stages of other threads are open, the traced peak is not reset (their peaks would be lost)
+                self.shared = any(other != thread for other in _open)
+                if self.shared:
+                    _overlaps += 1
+                self.overlaps = _overlaps
+                _open[thread] = _open.get(thread, 0) + 1
+            stack = _local.__dict__.setdefault('stack', [])
+            if not self.shared:
+                # peak of the enclosing stage so far is kept, as the traced peak is reset for this stage
+                if stack:
+                    stack[-1].child_peak = max(stack[-1].child_peak, tracemalloc.get_traced_memory()[1])
+                tracemalloc.reset_peak()
+            stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter() - self.start
+        peak = None
+        if self.traced:
+            thread = threading.get_ident()
+            with _lock:
+                if _open.get(thread, 0) > 1:
+                    _open[thread] -= 1
+                else:
+                    _open.pop(thread, None)
+                # no stage of another thread overlapped with this one
+                exclusive = not self.shared and self.overlaps == _overlaps
+            stack = _local.stack
+            stack.pop()
+            if (self.root or exclusive) and tracemalloc.is_tracing():
+                peak = max(self.child_peak, tracemalloc.get_traced_memory()[1])
+                if stack:
+                    stack[-1].child_peak = max(stack[-1].child_peak, peak)
+        record = StageRecord(self.name, self.uid, wall, self.nbytes, peak, threading.current_thread().name)
+        with _lock:
+            for sink in _sinks:
+                sink.emit(record)
+        return False
+
+    def count_bytes(self, obj):
+        """
+        Adds size of obj (DataFrame, Series or array) to the bytes converted in this stage (column data estimated
+        from dtypes, DataFrame.memory_usage is too slow to be called per table).
+        """
+        if hasattr(obj, 'columns'):
+            self.nbytes += len(obj) * sum(dtype.itemsize for dtype in obj.dtypes)
+        else:
+            self.nbytes += int(getattr(obj, 'nbytes', 0))
+
+
+class Collector:
+    """
+    In-memory sink keeping all StageRecords.
+    """
+
+    def __init__(self):
+        self.records = list()
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def frame(self):
+        """
+        All records as DataFrame (one row per timed call).
+        """
+        import pandas as pd
+        return pd.DataFrame(self.records, columns=StageRecord._fields)
+
+    def summary(self):
+        """
+        DataFrame (index: stage) with calls, total / mean / max wall time (s), bytes converted and peak memory.
+        """
+        df = self.frame()
+        return df.groupby('stage', sort=False).agg(calls=('wall', 'size'), wall=('wall', 'sum'),
+                                                   mean_wall=('wall', 'mean'), max_wall=('wall', 'max'),
+                                                   nbytes=('nbytes', 'sum'), peak=('peak', 'max')
+                                                   ).sort_values('wall', ascending=False)
+
+    def slowest(self, n=10, stage=None):
+        """
+        Molecules with the largest total wall time (of stage, default all molecule-level stages).
+        Returns DataFrame (index: uid) with wall time (s), calls and bytes converted
+        """
+        df = self.frame().dropna(subset=['uid'])
+        if stage is not None:
+            df = df[df['stage'] == stage]
+        return df.groupby('uid').agg(wall=('wall', 'sum'), calls=('wall', 'size'), nbytes=('nbytes', 'sum')
+                                     ).nlargest(n, 'wall')
+
+    def to_json(self, path):
+        """
+        Exports all records as JSON list of objects.
+        """
+        with open(path, 'w') as f:
+            json.dump([record._asdict() for record in self.records], f)
+
+    def clear(self):
+        self.records.clear()
+
+
+class LoggingSink:
+    """
+    Sink writing one log message per record (default logger marspy.instrument, level DEBUG).
+    """
+
+    def __init__(self, logger='marspy.instrument', level=logging.DEBUG):
+        self.logger = logging.getLogger(logger) if isinstance(logger, str) else logger
+        self.level = level
+
+    def emit(self, record):
+        if self.logger.isEnabledFor(self.level):
+            peak = '' if record.peak is None else f' peak={record.peak}B'
+            self.logger.log(self.level, f'{record.stage} uid={record.uid} wall={record.wall:.6f}s '
+                                        f'bytes={record.nbytes}{peak}')
+
+
+class JsonSink:
+    """
+    Sink appending records as JSON lines to path (file is opened on the first record).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def emit(self, record):
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        self._file.write(json.dumps(record._asdict()) + '\n')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,188 @@
+import os
+from contextlib import contextmanager
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba
+
+# figure_style functions setting the rcParams
+STYLES = {'paper': 'set_style_paper', 'talk': 'set_style_talk'}
+
+
+@contextmanager
+def style_context(style='paper'):
+    """
+    Applies a style of figure_style.py ('paper' or 'talk') within a with-block, rcParams are restored afterwards.
+    style=None keeps the current rcParams.
+    """
+    with plt.rc_context():
+        if style is not None:
+            import figure_style
+            getattr(figure_style, STYLES[style])()
+        yield
+
+
+def colors(style='paper'):
+    """
+    Colors of trajectories, segments and pause segments (figure_style.palette_qual if a style is used).
+    """
+    if style is None:
+        return 'C0', 'C1', 'C3'
+    import figure_style
+    return figure_style.palette_qual[2], figure_style.palette_qual[1], figure_style.palette_qual[0]
+
+
+def trajectory_lines(molecules, prefix='Cohesin_1_', x_col='Time_(s)', y_col='Position_on_DNA', noidle=False,
+                     offsets=None):
+    """
+    Trajectories of molecules as list of (n, 2) arrays (input for LineCollection), NaN rows break the line.
+    noidle: use df_noidle (see DnaMoleculeArchive.add_df_noidle)
+    offsets: values added to y of each molecule (e.g. to stack molecules in one panel)
+    """
+    lines = list()
+    for i, molecule in enumerate(molecules):
+        df = molecule.df_noidle if noidle else molecule.df
+        if prefix + x_col not in df.columns or prefix + y_col not in df.columns:
+            continue
+        line = np.column_stack([df[prefix + x_col].to_numpy(dtype=float), df[prefix + y_col].to_numpy(dtype=float)])
+        if offsets is not None:
+            line[:, 1] += offsets[i]
+        lines.append(line)
+    return lines
+
+
+def segment_lines(molecules, prefix='Cohesin_1_', kind='rate', pause_col='pause_B', offsets=None):
+    """
+    Fitted segments of SegmentsTables (type kind, see add_segments_tables) of molecules as one (n, 2, 2) array
+    [[X1, Y1], [X2, Y2]] and a boolean array marking pauses (all False if no pauses were detected).
+    offsets: values added to y of each molecule
+    """
+    blocks, pauses = list(), list()
+    for i, molecule in enumerate(molecules):
+        for seg_df in molecule.seg_dfs or ():
+            if seg_df.type != kind or seg_df.prefix != prefix:
+                continue
+            df = seg_df.df
+            block = df[['X1', 'Y1', 'X2', 'Y2']].to_numpy(dtype=float, copy=True).reshape(-1, 2, 2)
+            if offsets is not None:
+                block[:, :, 1] += offsets[i]
+            blocks.append(block)
+            pauses.append(df[pause_col].to_numpy(dtype=bool) if pause_col in df.columns
+                          else np.zeros(len(df), dtype=bool))
+    if not blocks:
+        return np.empty((0, 2, 2)), np.empty(0, dtype=bool)
+    return np.concatenate(blocks), np.concatenate(pauses)
+
+
+def plot_molecules(molecules, prefix='Cohesin_1_', kind='rate', ax=None, x_col='Time_(s)', y_col=None,
+                   noidle=False, offsets=None, segments=True, style='paper', linewidth=0.5, segment_linewidth=1.):
+    """
+    Draws trajectories and fitted segments of all molecules into ax with one LineCollection each (pause segments
+    get their own color).
+    kind: 'rate' (y: Position_on_DNA) or 'bleaching' (y: Intensity)
+    y_col: column of trajectories (default according to kind)
+    offsets: values added to y of each molecule (e.g. to stack molecules kymograph-style)
+    segments: Set to False to only draw trajectories
+    style: figure_style used for colors (None: matplotlib defaults)
+    Returns ax
+    """
+    if ax is None:
+        ax = plt.gca()
+    if y_col is None:
+        y_col = 'Intensity' if kind == 'bleaching' else 'Position_on_DNA'
+    molecules = list(molecules)
+    trajectory_color, segment_color, pause_color = colors(style)
+
+    ax.add_collection(LineCollection(trajectory_lines(molecules, prefix=prefix, x_col=x_col, y_col=y_col,
+                                                      noidle=noidle, offsets=offsets),
+                                     colors=trajectory_color, linewidths=linewidth))
+    if segments:
+        lines, pauses = segment_lines(molecules, prefix=prefix, kind=kind, offsets=offsets)
+        ax.add_collection(LineCollection(lines, colors=np.where(pauses[:, None], to_rgba(pause_color),
+                                                                to_rgba(segment_color)),
+                                         linewidths=segment_linewidth))
+    ax.autoscale_view()
+    ax.set_xlabel(x_col)
+    ax.set_ylabel(y_col)
+    return ax
+
+
+def overview_pages(molecules, prefix='Cohesin_1_', kind='rate', nrows=4, ncols=4, panel_size=(1.6, 1.2),
+                   stacked=False, spacing=None, style='paper', **kwargs):
+    """
+    Overview figures of molecules generated page by page (nrows x ncols molecules per page).
+    The style is active while the pages are iterated (save pages within the loop, e.g. with save_pages).
+    stacked: Set to True to draw all molecules of a page into one panel, offset by spacing (kymograph-style, much
+    faster than one panel per molecule)
+    spacing: offset between stacked molecules (default: largest y range of the page, of df_noidle with noidle=True)
+    kwargs: passed to plot_molecules, offsets (one per molecule) are added to the stacking offsets
+    Yields figures
+    """
+    molecules = list(molecules)
+    per_page = nrows * ncols
+    y_col = kwargs.get('y_col') or ('Intensity' if kind == 'bleaching' else 'Position_on_DNA')
+    offsets = kwargs.pop('offsets', None)
+    if offsets is not None:
+        offsets = np.asarray(offsets, dtype=float)
+    with style_context(style):
+        for start in range(0, len(molecules), per_page):
+            page = molecules[start:start + per_page]
+            page_offsets = None if offsets is None else offsets[start:start + len(page)]
+            if stacked:
+                fig, ax = plt.subplots(figsize=(ncols * panel_size[0], nrows * panel_size[1]))
+                stack = np.arange(len(page)) * (_y_range(page, prefix + y_col, noidle=kwargs.get('noidle', False))
+                                                if spacing is None else spacing)
+                if page_offsets is not None:
+                    stack = stack + page_offsets
+                plot_molecules(page, prefix=prefix, kind=kind, ax=ax, offsets=stack, style=style, **kwargs)
+                ax.set_yticks(stack)
+                ax.set_yticklabels([molecule.uid[:8] for molecule in page])
+                yield fig
+                continue
+
+            fig, axes = plt.subplots(nrows, ncols, figsize=(ncols * panel_size[0], nrows * panel_size[1]),
+                                     squeeze=False)
+            # fixed margins (constrained layout dominates the rendering time of large grids)
+            fig.subplots_adjust(left=0.1, right=0.98, bottom=0.08, top=0.92, wspace=0.5, hspace=0.6)
+            for i, (ax, molecule) in enumerate(zip(axes.flat, page)):
+                plot_molecules([molecule], prefix=prefix, kind=kind, ax=ax, style=style,
+                               offsets=None if page_offsets is None else page_offsets[i:i + 1], **kwargs)
+                ax.set_title(molecule.uid[:8])
+                ax.set_xlabel('')
+                ax.set_ylabel('')
+            for ax in axes.flat[len(page):]:
+                ax.axis('off')
+            yield fig
+
+
+def _y_range(molecules, column, noidle=False):
+    dfs = (molecule.df_noidle if noidle else molecule.df for molecule in molecules)
+    ranges = [np.nanmax(values) - np.nanmin(values) for values in
+              (df[column].to_numpy(dtype=float) for df in dfs if column in df.columns)
+              if np.isfinite(values).any()]
+    return max(ranges, default=1.)
+
+
+def save_pages(figures, path):
+    """
+    Saves figures (e.g. overview_pages) as multi-page PDF (path ending in .pdf) or as one SVG per page
+    ({name}_{page}.svg). Figures are closed after saving.
+    Returns list of written files
+    """
+    name, extension = os.path.splitext(path)
+    if extension == '.pdf':
+        with PdfPages(path) as pdf:
+            for fig in figures:
+                pdf.savefig(fig)
+                plt.close(fig)
+        return [path]
+    if extension != '.svg':
+        raise ValueError(f'Unknown format {extension}. Use .pdf or .svg.')
+    files = list()
+    for page, fig in enumerate(figures):
+        files.append(f'{name}_{page:03d}.svg')
+        fig.savefig(files[-1])
+        plt.close(fig)
+    return files
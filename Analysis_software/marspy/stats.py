@@ -1,44 +1,340 @@
+import warnings
+from itertools import combinations
+
 import numpy as np
-from sklearn.utils import resample
+from scipy.special import chdtrc, ndtr, ndtri
+
+# default memory cap (bytes) for resampled data held at once
+MAX_BYTES = 2 ** 26
 
 
-def bootstrap(data, n_boot=10000, sample_size=1, estimator=np.mean):
+def bootstrap(data, n_boot=10000, sample_size=1, estimator=np.mean, seed=None, max_bytes=MAX_BYTES):
     """
+    Vectorized bootstrap: resampling indices are drawn as (chunk, n) matrices, chunks are sized to max_bytes
     :param data: array with data
     :param n_boot: number for bootstrapping iterations (default 10000)
     :param sample_size: sample coverage ]0;1] (default 1)
-    :param estimator: default np.mean
-    :return: list of bootstrap samples
+    :param estimator: axis-aware estimator, called as estimator(samples, axis=1) (default np.mean)
+    :param seed: seed or np.random.Generator (default None)
+    :param max_bytes: memory cap for index and sample matrices of one chunk (default 64 MiB)
+    :return: array of n_boot bootstrap estimates
+    """
+    data = np.asarray(data)
+    rng = np.random.default_rng(seed)
+    n_samples = int(sample_size * len(data))
+    # int64 indices + resampled values
+    chunk = max(1, int(max_bytes // (max(n_samples, 1) * (8 + data.itemsize))))
+    estimates = list()
+    for start in range(0, n_boot, chunk):
+        indices = rng.integers(0, len(data), size=(min(chunk, n_boot - start), n_samples))
+        estimates.append(np.asarray(estimator(data[indices], axis=1)))
+    return np.concatenate(estimates)
+
+
+def bootstrap_groups(data, groups, n_boot=10000, sample_size=1, estimator=np.mean, seed=None, max_bytes=MAX_BYTES):
+    """
+    Bootstraps every group (e.g. condition) of data in one call
+    :param data: array with data
+    :param groups: group label of each data point (same length as data)
+    :param n_boot, sample_size, estimator, max_bytes: see bootstrap
+    :param seed: seed or np.random.Generator, one generator is used for all groups (default None)
+    :return: dict group: array of n_boot bootstrap estimates (groups sorted)
     """
-    return estimator(
-        [resample(data, replace=True, n_samples=int(sample_size * len(data))) for _ in range(n_boot)],
-        axis=1)
+    data = np.asarray(data)
+    groups = np.asarray(groups)
+    rng = np.random.default_rng(seed)
+    labels, inverse = np.unique(groups, return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.searchsorted(inverse[order], np.arange(len(labels) + 1))
+    return {label: bootstrap(data[order[bounds[i]:bounds[i + 1]]], n_boot=n_boot, sample_size=sample_size,
+                             estimator=estimator, seed=rng, max_bytes=max_bytes)
+            for i, label in enumerate(labels)}
 
 
-def calc_ci(data, ci=95):
+def calc_ci(data, ci=95, method='percentile', sample=None, estimator=np.mean, max_bytes=MAX_BYTES):
     """
     Calculates values for confidence interval
-    :param data: arrayed data
+    :param data: arrayed data (bootstrap estimates)
     :param ci: confidence interval (default 95)
+    :param method: 'percentile' (default) or 'bca' (bias-corrected and accelerated)
+    :param sample: original data (required for bca)
+    :param estimator: axis-aware estimator used for bootstrapping (bca only, default np.mean)
+    :param max_bytes: memory cap for jackknife samples (bca only)
     :return: lower_bound, upper_bound
     """
-    return np.percentile(data, 50 - ci / 2), np.percentile(data, 50 + ci / 2)
+    data = np.asarray(data)
+    if method == 'percentile':
+        return np.percentile(data, 50 - ci / 2), np.percentile(data, 50 + ci / 2)
+    if method != 'bca':
+        raise ValueError(f'Unknown method {method}. Use percentile or bca.')
+    if sample is None:
+        raise ValueError('BCa intervals require the original sample.')
+
+    sample = np.asarray(sample)
+    # bias correction
+    z0 = ndtri(np.mean(data < estimator(sample)))
+    # acceleration from jackknife estimates
+    jackknife = _jackknife(sample, estimator, max_bytes)
+    deviation = jackknife.mean() - jackknife
+    denominator = 6 * np.sum(deviation ** 2) ** 1.5
+    acceleration = np.sum(deviation ** 3) / denominator if denominator > 0 else 0.
+
+    z = ndtri(np.array([0.5 - ci / 200, 0.5 + ci / 200]))
+    alphas = ndtr(z0 + (z0 + z) / (1 - acceleration * (z0 + z)))
+    lower, upper = np.percentile(data, 100 * alphas)
+    return lower, upper
+
+
+def _jackknife(sample, estimator, max_bytes=MAX_BYTES):
+    """
+    Leave-one-out estimates of sample, computed in chunks of index matrices
+    """
+    n = len(sample)
+    chunk = max(1, int(max_bytes // (max(n - 1, 1) * (8 + sample.itemsize))))
+    estimates = list()
+    for start in range(0, n, chunk):
+        left_out = np.arange(start, min(start + chunk, n))[:, None]
+        indices = np.arange(n - 1)[None, :]
+        # skip index of left out data point
+        indices = indices + (indices >= left_out)
+        estimates.append(np.asarray(estimator(sample[indices], axis=1)))
+    return np.concatenate(estimates)
+
+
+# (alpha, symbol) from the smallest alpha, p-values above all alphas are 'ns'
+SIGNIFICANCE_LEVELS = ((0.0001, '****'), (0.001, '***'), (0.01, '**'), (0.05, '*'))
 
 
 def significance(p):
     """
     Returns significance symbol based on set alpha values
-    :param p: probability of statistical test
-    :return: string expression for significance
-    """
-    if p < 0.0001:
-        expression = "****"
-    elif p < 0.001:
-        expression = "***"
-    elif p < 0.01:
-        expression = "**"
-    elif p < 0.05:
-        expression = "*"
-    else:
-        expression = "ns"
-    return expression
+    :param p: probability of statistical test (scalar or array)
+    :return: string expression for significance (array of strings if an array was passed)
+    """
+    p = np.asarray(p, dtype=float)
+    expression = np.select([p < alpha for alpha, _ in SIGNIFICANCE_LEVELS],
+                           [symbol for _, symbol in SIGNIFICANCE_LEVELS], default='ns')
+    return str(expression) if expression.ndim == 0 else expression
+
+
+def rank_columns(values):
+    """
+    Ranks (1..n, ties averaged) of each column of values, NaNs are left out and keep NaN as rank
+    :param values: array of shape (n, m)
+    :return: ranks of shape (n, m) and tie term sum(t^3 - t) of each column (m)
+    """
+    values = np.asarray(values, dtype=float)
+    n, m = values.shape
+    # NaNs are sorted last and never tie (NaN != NaN)
+    order = np.argsort(values, axis=0, kind='stable')
+    ordered = np.take_along_axis(values, order, axis=0)
+    new_group = np.ones((n, m), dtype=bool)
+    new_group[1:] = ordered[1:] != ordered[:-1]
+    # tie groups numbered over all columns
+    group = np.cumsum(new_group.T.ravel()) - 1
+    position = np.tile(np.arange(1, n + 1, dtype=float), m)
+    sizes = np.bincount(group)
+    average = np.bincount(group, weights=position) / sizes
+
+    ranks = np.empty((n, m))
+    np.put_along_axis(ranks, order, average[group].reshape(m, n).T, axis=0)
+    ranks[np.isnan(values)] = np.nan
+    # tie term only counts groups of valid values
+    valid_group = ~np.isnan(ordered.T.ravel()[new_group.T.ravel()])
+    ties = np.bincount(np.repeat(np.arange(m), new_group.sum(axis=0))[valid_group],
+                       weights=(sizes ** 3 - sizes)[valid_group].astype(float), minlength=m)
+    return ranks, ties
+
+
+def _group_codes(groups, order=None):
+    """
+    Sorted labels (or order) and integer code of each row (-1 for rows with missing or excluded label)
+    """
+    groups = np.asarray(groups, dtype=object)
+    present = [label for label in groups if label is not None and label == label]
+    labels = sorted(set(present)) if order is None else [label for label in order if label in set(present)]
+    lookup = {label: code for code, label in enumerate(labels)}
+    return labels, np.array([lookup.get(label, -1) for label in groups], dtype=np.int64)
+
+
+def _rank_sums(values, codes, n_groups):
+    """
+    Rank statistics of all columns: ranks, tie term, number of valid values (m), group sizes and rank sums (k, m)
+    """
+    ranks, ties = rank_columns(values)
+    valid = ~np.isnan(values)
+    onehot = (codes[:, None] == np.arange(n_groups)[None, :]).astype(float)
+    sizes = onehot.T @ valid
+    rank_sums = onehot.T @ np.where(valid, ranks, 0)
+    return valid.sum(axis=0), ties, sizes, rank_sums
+
+
+def kruskal(values, groups, order=None):
+    """
+    Kruskal-Wallis H-test (tie corrected) of all columns of values at once
+    :param values: array of shape (n,) or (n, m), NaNs are left out per column
+    :param groups: group label of each row
+    :param order: labels (groups) to test, in this order (default: all sorted)
+    :return: H and p arrays (m)
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[:, None] if values.ndim == 1 else values
+    labels, codes = _group_codes(groups, order)
+    values = values[codes >= 0]
+    codes = codes[codes >= 0]
+    n, ties, sizes, rank_sums = _rank_sums(values, codes, len(labels))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        h = (12 / (n * (n + 1)) * np.where(sizes > 0, rank_sums ** 2 / sizes, 0).sum(axis=0) - 3 * (n + 1))
+        h /= 1 - ties / (n ** 3 - n)
+    return h, chdtrc((sizes > 0).sum(axis=0) - 1, h)
+
+
+def holm(p, axis=0):
+    """
+    Holm-Bonferroni adjusted p-values (along axis, NaNs are left out)
+    """
+    p = np.moveaxis(np.asarray(p, dtype=float), axis, 0)
+    n_tests = (~np.isnan(p)).sum(axis=0)
+    # NaNs sorted last
+    order = np.argsort(p, axis=0, kind='stable')
+    ordered = np.take_along_axis(p, order, axis=0)
+    factor = n_tests - np.arange(len(p)).reshape((-1,) + (1,) * (p.ndim - 1))
+    adjusted = np.fmin(np.fmax.accumulate(ordered * factor, axis=0), 1)
+    adjusted[np.isnan(ordered)] = np.nan
+    result = np.empty_like(p)
+    np.put_along_axis(result, order, adjusted, axis=0)
+    return np.moveaxis(result, 0, axis)
+
+
+def dunn(values, groups, order=None, correction='holm'):
+    """
+    Dunn's post-hoc test (tie corrected) for all pairs of groups and all columns of values at once
+    :param values: array of shape (n,) or (n, m), NaNs are left out per column
+    :param groups: group label of each row
+    :param order: labels (groups) to test, in this order (default: all sorted)
+    :param correction: 'holm' (default, per column over all pairs) or None
+    :return: list of pairs (label1, label2), z and p arrays of shape (pairs, m)
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[:, None] if values.ndim == 1 else values
+    labels, codes = _group_codes(groups, order)
+    values = values[codes >= 0]
+    codes = codes[codes >= 0]
+    n, ties, sizes, rank_sums = _rank_sums(values, codes, len(labels))
+
+    pairs = list(combinations(range(len(labels)), 2))
+    first, second = (np.array([pair[i] for pair in pairs], dtype=np.int64) for i in (0, 1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_ranks = rank_sums / sizes
+        variance = n * (n + 1) / 12 - ties / (12 * (n - 1))
+        z = (mean_ranks[first] - mean_ranks[second]) / np.sqrt(variance * (1 / sizes[first] + 1 / sizes[second]))
+    p = 2 * ndtr(-np.abs(z))
+    if correction == 'holm':
+        p = holm(p, axis=0)
+    elif correction is not None:
+        raise ValueError(f'Unknown correction {correction}. Use holm or None.')
+    return [(labels[i], labels[j]) for i, j in pairs], z, p
+
+
+def permutation_test(values, groups, order=None, n_perm=10000, seed=None, correction='holm', max_bytes=MAX_BYTES):
+    """
+    Two-sided permutation test of the difference in means for all pairs of groups and all columns of values at once.
+    Group labels are permuted with index matrices (one permutation is applied to all columns), NaNs are left out.
+    :param values: array of shape (n,) or (n, m)
+    :param groups: group label of each row
+    :param order: labels (groups) to test, in this order (default: all sorted)
+    :param n_perm: number of permutations (default 10000)
+    :param seed: seed or np.random.Generator (default None)
+    :param correction: 'holm' (default, per column over all pairs) or None
+    :param max_bytes: memory cap for permuted samples of one chunk (default 64 MiB)
+    :return: list of pairs (label1, label2), differences in means and p arrays of shape (pairs, m)
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[:, None] if values.ndim == 1 else values
+    labels, codes = _group_codes(groups, order)
+    rng = np.random.default_rng(seed)
+
+    pairs = list(combinations(range(len(labels)), 2))
+    differences = np.full((len(pairs), values.shape[1]), np.nan)
+    p = np.full((len(pairs), values.shape[1]), np.nan)
+    for row, (i, j) in enumerate(pairs):
+        first, second = values[codes == i], values[codes == j]
+        data = np.concatenate([first, second])
+        n_first = len(first)
+        with np.errstate(invalid='ignore'), warnings.catch_warnings():
+            # all-NaN slices
+            warnings.simplefilter('ignore', RuntimeWarning)
+            differences[row] = np.nanmean(first, axis=0) - np.nanmean(second, axis=0)
+            exceed = np.zeros(values.shape[1])
+            chunk = max(1, int(max_bytes // (max(data.size, 1) * 8 * 2)))
+            for start in range(0, n_perm, chunk):
+                size = min(chunk, n_perm - start)
+                # random permutation of rows per iteration: (size, n)
+                permutation = np.argsort(rng.random((size, len(data))), axis=1)
+                permuted = data[permutation]
+                permuted_difference = (np.nanmean(permuted[:, :n_first], axis=1) -
+                                       np.nanmean(permuted[:, n_first:], axis=1))
+                exceed += (np.abs(permuted_difference) >= np.abs(differences[row]) - 1e-12).sum(axis=0)
+        p[row] = np.where(np.isnan(differences[row]), np.nan, (exceed + 1) / (n_perm + 1))
+    if correction == 'holm':
+        p = holm(p, axis=0)
+    elif correction is not None:
+        raise ValueError(f'Unknown correction {correction}. Use holm or None.')
+    return [(labels[i], labels[j]) for i, j in pairs], differences, p
+
+
+def compare_groups(df, group, columns=None, by=None, order=None, tests=('kruskal', 'dunn'), n_perm=10000, seed=None,
+                   correction='holm'):
+    """
+    Runs the selected tests for many metric columns of a (summary) table at once
+    :param df: pandas DataFrame, one row per molecule (e.g. summarize_molecules)
+    :param group: column with the compared groups (e.g. MCM variant)
+    :param columns: metric columns to test (default: all numeric columns besides group and by)
+    :param by: column or list of columns (e.g. salt condition), tests are run separately for each combination
+    :param order: labels (groups) to test, in this order (default: all sorted)
+    :param tests: any of 'kruskal', 'dunn' and 'permutation'
+    :param n_perm, seed: see permutation_test
+    :param correction: multiple testing correction of post-hoc tests ('holm' or None)
+    :return: tidy pandas DataFrame with by columns, metric, test, group1, group2, statistic, p and stars
+    """
+    import pandas as pd
+    by = [] if by is None else [by] if not isinstance(by, list) else by
+    if columns is None:
+        columns = [column for column in df.select_dtypes('number').columns if column != group and column not in by]
+    unknown = set(tests) - {'kruskal', 'dunn', 'permutation'}
+    if unknown:
+        raise ValueError(f'Unknown tests {sorted(unknown)}. Use kruskal, dunn and/or permutation.')
+    rng = np.random.default_rng(seed)
+
+    results = list()
+    subsets = df.groupby(by, sort=True, dropna=False) if by else [((), df)]
+    for key, subset in subsets:
+        key = key if isinstance(key, tuple) else (key,)
+        values = subset[columns].to_numpy(dtype=float)
+        labels = subset[group].to_numpy()
+        rows = list()
+        if 'kruskal' in tests:
+            statistic, p = kruskal(values, labels, order=order)
+            rows.append(dict(metric=columns, test='kruskal', group1=None, group2=None, statistic=statistic, p=p))
+        if 'dunn' in tests:
+            pairs, statistic, p = dunn(values, labels, order=order, correction=correction)
+            rows.extend(dict(metric=columns, test='dunn', group1=first, group2=second, statistic=statistic[i],
+                             p=p[i]) for i, (first, second) in enumerate(pairs))
+        if 'permutation' in tests:
+            pairs, statistic, p = permutation_test(values, labels, order=order, n_perm=n_perm, seed=rng,
+                                                   correction=correction)
+            rows.extend(dict(metric=columns, test='permutation', group1=first, group2=second,
+                             statistic=statistic[i], p=p[i]) for i, (first, second) in enumerate(pairs))
+        for row in rows:
+            table = pd.DataFrame(row)
+            for position, (name, value) in enumerate(zip(by, key)):
+                table.insert(position, name, value)
+            results.append(table)
+
+    columns_out = by + ['metric', 'test', 'group1', 'group2', 'statistic', 'p', 'stars']
+    if not results:
+        return pd.DataFrame(columns=columns_out)
+    result = pd.concat(results, ignore_index=True)
+    result['stars'] = significance(result['p'].to_numpy(dtype=float))
+    return result[columns_out]
@@ -0,0 +1,203 @@
+"""
+Tests of archive ingestion on the in-process stand-ins (marspy.convert.records / synthetic).
+"""
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from marspy.convert.archive import DnaMoleculeArchive, SingleMoleculeArchive
+from marspy.convert.columnar import extract_archive
+from marspy.convert.molecule import MarsPyException, MarsPyWarning
+from marspy.convert.records import MoleculeRecord
+from marspy.convert.synthetic import synthetic_archive
+
+LABELS = dict(Cohesin='', MCM='')
+
+
+@pytest.fixture(scope='module')
+def archive_link():
+    return synthetic_archive(n_molecules=40, n_frames=60, seed=7)
+
+
+@pytest.fixture
+def make_archive():
+    archives = list()
+
+    def make(archive_link, filepath='synthetic.yama', **options):
+        archives.append(DnaMoleculeArchive(filepath, 'accept', labels=LABELS, archive_link=archive_link, **options))
+        return archives[-1]
+
+    yield make
+    for archive in archives:
+        DnaMoleculeArchive.collection.discard(archive)
+
+
+def test_accepted_molecules(archive_link, make_archive):
+    archive = make_archive(archive_link)
+    accepted = [uid for uid in archive_link.getMoleculeUIDs() if 'accept' in archive_link.get(uid).tags]
+    assert [molecule.uid for molecule in archive.molecules] == accepted
+    assert archive.dna_molecule_count == len(archive_link.getMoleculeUIDs()) - sum(
+        'reject_dna' in archive_link.get(uid).tags for uid in archive_link.getMoleculeUIDs())
+
+
+def test_missing_condition_warns(make_archive, capsys):
+    archive_link = synthetic_archive(n_molecules=4, n_frames=20, conditions=dict(nucleotide='ATP', mcm='wt'))
+    with pytest.warns(MarsPyWarning, match='NaCl concentration not found'):
+        archive = make_archive(archive_link, filepath='no_nacl.yama')
+    assert archive.nacl == 'n/a'
+    assert capsys.readouterr().out == ''
+
+
+@pytest.mark.parametrize('bulk', [False, True])
+def test_tags_are_read_once(archive_link, make_archive, monkeypatch, bulk):
+    calls = list()
+    get_tags = MoleculeRecord.getTags
+
+    def counting_get_tags(record):
+        calls.append(record.uid)
+        return get_tags(record)
+
+    monkeypatch.setattr(MoleculeRecord, 'getTags', counting_get_tags)
+    archive = make_archive(archive_link, bulk=bulk)
+    # tags of the scan are passed on to the molecules
+    assert sorted(calls) == sorted(archive_link.getMoleculeUIDs())
+    for molecule in archive.molecules:
+        assert molecule.tags == archive_link.get(molecule.uid).tags
+        assert molecule.tags is not archive.scan.tags[molecule.uid]
+
+
+def test_tables_are_loaded_lazily(archive_link, make_archive):
+    archive = make_archive(archive_link)
+    assert len(archive.cache) == 0
+    molecule = archive.molecules[0]
+    pd.testing.assert_frame_equal(molecule.df, archive_link.get(molecule.uid).table.df)
+    assert len(archive.cache) == 1
+    # same object on repeated access
+    assert molecule.df is molecule.df
+
+
+def test_memory_budget_evicts_and_reloads(archive_link, make_archive):
+    archive = make_archive(archive_link)
+    size = int(archive.molecules[0].df.memory_usage(index=True, deep=True).sum())
+    archive.clear_cache()
+
+    archive = make_archive(archive_link, memory_budget=3 * size)
+    frames = {molecule.uid: molecule.df.copy() for molecule in archive.molecules}
+    assert archive.cache.nbytes <= 3 * size
+    assert len(archive.cache) < len(archive.molecules)
+    # evicted tables are converted again on access
+    for molecule in archive.molecules:
+        pd.testing.assert_frame_equal(molecule.df, frames[molecule.uid])
+
+
+def test_concurrent_ingestion(archive_link, make_archive):
+    serial = make_archive(archive_link)
+    concurrent = make_archive(archive_link, filepath='concurrent.yama', workers=4)
+    assert [molecule.uid for molecule in concurrent.molecules] == [molecule.uid for molecule in serial.molecules]
+    for a, b in zip(serial.molecules, concurrent.molecules):
+        assert a.params == b.params
+        pd.testing.assert_frame_equal(a.df, b.df)
+
+
+def test_segments_tables_are_loaded_lazily(archive_link, make_archive):
+    archive = make_archive(archive_link)
+    archive.add_segments_tables(types='rate')
+    assert len(archive.cache) == 0
+    molecule = archive.molecules[0]
+    seg_df = molecule.seg_dfs[0]
+    assert {seg_df.type for seg_df in molecule.seg_dfs} == {'rate'}
+    pd.testing.assert_frame_equal(seg_df.df, archive_link.get(molecule.uid).segments_tables[
+        (seg_df.prefix + seg_df.col_x, seg_df.prefix + seg_df.col_y, seg_df.region)])
+    assert seg_df.key in archive.cache
+
+
+def test_segments_tables_of_single_molecules(archive_link):
+    archive = SingleMoleculeArchive('single.yama', 'accept', label=dict(Cohesin=''), archive_link=archive_link)
+    try:
+        molecule = archive.molecules[0]
+        molecule.segments_requested = True
+        with pytest.raises(MarsPyException, match='only supported for DnaMolecule'):
+            molecule.seg_dfs
+    finally:
+        SingleMoleculeArchive.collection.discard(archive)
+
+
+@pytest.fixture(scope='module')
+def mixed_dtype_link():
+    archive_link = synthetic_archive(n_molecules=12, n_frames=30, seed=11)
+    for i, uid in enumerate(archive_link.getMoleculeUIDs()):
+        df = archive_link.get(uid).table.df
+        # integer column missing on every second molecule, column with int or float dtype depending on molecule
+        if i % 2 == 0:
+            df['slice'] = np.arange(len(df), dtype=np.int64)
+        df['channel'] = np.ones(len(df), dtype=np.int64 if i % 3 else np.float64)
+    return archive_link
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_bulk_store_matches_per_molecule_tables(mixed_dtype_link, make_archive, workers):
+    archive = make_archive(mixed_dtype_link)
+    bulk = make_archive(mixed_dtype_link, filepath='bulk.yama', bulk=True, workers=workers)
+    assert bulk.store is not None
+    for a, b in zip(archive.molecules, bulk.molecules):
+        pd.testing.assert_frame_equal(a.df, b.df)
+    assert bulk.molecules[0].df['slice'].dtype == np.int64
+
+
+def test_bulk_frames_are_cached(archive_link, make_archive):
+    archive = make_archive(archive_link, bulk=True)
+    molecule = archive.molecules[0]
+    assert molecule.df is molecule.df
+    assert (molecule.uid, 'df') in archive.cache
+    # views on the store
+    assert np.shares_memory(molecule.df['Cohesin_1_Time_(s)'].to_numpy(), archive.store.arrays['Cohesin_1_Time_(s)'])
+
+
+def test_bulk_views_are_not_counted(mixed_dtype_link, make_archive):
+    archive = make_archive(mixed_dtype_link, bulk=True)
+    frames = [molecule.df for molecule in archive.molecules]
+    # only columns cast to the molecule's dtype are copies
+    assert archive.cache.nbytes == sum(archive.store.copied_nbytes(molecule.uid) for molecule in archive.molecules)
+    assert archive.cache.nbytes < sum(int(df.memory_usage().sum()) for df in frames)
+
+    # views are never evicted to meet the budget
+    archive = make_archive(mixed_dtype_link, filepath='budget.yama', bulk=True, memory_budget=1)
+    for molecule in archive.molecules:
+        molecule.df
+    no_copies = [molecule for molecule in archive.molecules if archive.store.copied_nbytes(molecule.uid) == 0]
+    assert no_copies and all((molecule.uid, 'df') in archive.cache for molecule in no_copies)
+
+
+def test_bulk_extraction_peak_memory():
+    archive_link = synthetic_archive(n_molecules=200, n_frames=500, seed=5)
+    uids = archive_link.getMoleculeUIDs()
+    tracemalloc.start()
+    try:
+        _, store = extract_archive(archive_link, uids)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # converted tables are not all held until the store is built (that would be about twice the store)
+    assert peak < 1.3 * store.nbytes
+
+
+def test_summarize_both_archive_types(archive_link, make_archive):
+    dna = make_archive(archive_link)
+    single = SingleMoleculeArchive('single.yama', 'accept', label=dict(Cohesin=''), archive_link=archive_link)
+    try:
+        df = dna.summarize()
+        assert list(df.columns[:5]) == [('dna_length', ''), ('nucleotide', ''), ('nacl', ''), ('MCM_variant', ''),
+                                        ('tags', '')]
+        assert df[('dna_length', '')].notna().all()
+        with_mcm = np.array([molecule.proteins['MCM'] > 0 for molecule in dna.molecules])
+        assert (df[('MCM_variant', '')][with_mcm] == 'wt').all()
+        assert (df[('MCM_variant', '')][~with_mcm] == 'n/a').all()
+
+        df = single.summarize()
+        assert len(df) == len(single.molecules)
+        assert df[('dna_length', '')].isna().all()
+        assert (df[('MCM_variant', '')] == 'wt').all()
+    finally:
+        SingleMoleculeArchive.collection.discard(single)
@@ -0,0 +1,54 @@
+"""
+Tests of the vectorized photobleaching analysis (Archive.analyze_bleaching).
+"""
+import pandas as pd
+import pytest
+
+from marspy.convert.archive import DnaMoleculeArchive
+from marspy.convert.synthetic import synthetic_archive
+
+LABELS = dict(Cohesin='', MCM='')
+
+
+def bleaching_table(levels):
+    x1 = [float(10 * i) for i in range(len(levels))]
+    return pd.DataFrame(dict(X1=x1, Y1=levels, X2=[x + 10 for x in x1], Y2=levels, A=levels))
+
+
+@pytest.fixture
+def archive():
+    archive_link = synthetic_archive(n_molecules=6, n_frames=40, reject_fraction=0, seed=5)
+    for uid in archive_link.getMoleculeUIDs():
+        molecule = archive_link.get(uid)
+        df = molecule.table.df
+        for column in [column for column in df.columns if column.startswith('Cohesin_1_')]:
+            df['Cohesin_2_' + column[len('Cohesin_1_'):]] = df[column]
+        # second Cohesin with two steps on the whole trace, one step of Cohesin_1 within the bleaching region
+        molecule.segments_tables[('Cohesin_2_Time_(s)', 'Cohesin_2_Intensity', '')] = bleaching_table([900., 400., 0.])
+        molecule.segments_tables[('Cohesin_1_Time_(s)', 'Cohesin_1_Intensity', 'bleaching')] = bleaching_table(
+            [500., 0.])
+        cohesin_1 = molecule.segments_tables[('Cohesin_1_Time_(s)', 'Cohesin_1_Intensity', '')]
+        molecule.parameters['Cohesin_bleaching_steps'] = float(len(cohesin_1) - 1 + 2)
+    archive = DnaMoleculeArchive('bleaching.yama', 'accept', labels=LABELS, archive_link=archive_link)
+    archive.add_segments_tables(types='bleaching')
+    yield archive
+    DnaMoleculeArchive.collection.discard(archive)
+
+
+def test_protein_steps_of_all_prefixes(archive):
+    result = archive.analyze_bleaching()
+    trace = result.xs('', level='region')
+    cohesin = trace[trace.index.get_level_values('prefix').str.startswith('Cohesin_')]
+    assert not cohesin['mismatch'].any()
+    assert (cohesin.xs('Cohesin_2_', level='prefix')['steps'] == 2).all()
+    # tables of another region are counted separately
+    region = result.xs('bleaching', level='region')
+    assert (region['protein_steps'] == 1).all()
+
+
+def test_protein_steps_independent_of_prefixes(archive):
+    result = archive.analyze_bleaching()
+    selected = archive.analyze_bleaching(prefixes=['Cohesin_1_'])
+    assert set(selected.index.get_level_values('prefix')) == {'Cohesin_1_'}
+    pd.testing.assert_frame_equal(selected, result[result.index.get_level_values('prefix') == 'Cohesin_1_'])
+    assert not selected.xs('', level='region')['mismatch'].any()
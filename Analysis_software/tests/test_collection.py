@@ -0,0 +1,85 @@
+"""
+Tests of the archive registry and condition queries (marspy.convert.collection).
+"""
+import gc
+import weakref
+
+import pytest
+
+from marspy.convert.archive import Archive, DnaMoleculeArchive
+from marspy.convert.collection import ArchiveCollection
+from marspy.convert.molecule import MarsPyException
+from marspy.convert.synthetic import synthetic_archive
+
+LABELS = dict(Cohesin='', MCM='')
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    # archives of the test are registered in their own collection
+    collection = ArchiveCollection()
+    monkeypatch.setattr(Archive, 'collection', collection)
+    return collection
+
+
+def make_archive(filepath, nacl='150 mM', mcm='wt', seed=0, **options):
+    archive_link = synthetic_archive(n_molecules=20, n_frames=40, seed=seed,
+                                     conditions=dict(nucleotide='ATP', nacl=nacl, mcm=mcm))
+    return DnaMoleculeArchive(filepath, 'accept', labels=LABELS, archive_link=archive_link, **options)
+
+
+def test_archives_are_registered(collection):
+    a = make_archive('a.yama')
+    b = make_archive('b.yama', nacl='50 mM')
+    assert list(collection) == [a, b]
+    assert DnaMoleculeArchive.instances == [a, b]
+    assert collection['b.yama'] is b
+    assert collection.conditions()['nacl'] == ['150 mM', '50 mM']
+
+
+def test_replaced_archive_is_released(collection):
+    old = make_archive('a.yama', bulk=True)
+    [molecule.df for molecule in old.molecules]
+    molecule = old.molecules[0]
+    store = weakref.ref(old.store)
+    new = make_archive('a.yama', bulk=True)
+
+    assert list(collection) == [new]
+    assert len(old.molecules) == 0
+    assert old.store is None and old.archive_link is None
+    assert len(old.cache) == 0 and old.uid_index == {} and old.tag_index == {} and len(old.regions) == 0
+    # a molecule kept by the caller does not keep the store alive
+    assert molecule.store is None
+    gc.collect()
+    assert store() is None
+
+
+def test_select(collection):
+    a = make_archive('a.yama', nacl='150 mM', mcm='wt', seed=1)
+    b = make_archive('b.yama', nacl='150 mM', mcm='dCt', seed=2)
+    make_archive('c.yama', nacl='50 mM', mcm='wt', seed=3)
+
+    assert collection.select_archives(nacl='150 mM') == [a, b]
+    assert collection.select_archives(nacl='150 mM', mcm=['wt', 'x']) == [a]
+
+    selection = collection.select(nacl='150 mM', mcm='wt', tags=['accept'],
+                                  params={'Number_MCM': lambda value: value >= 1})
+    expected = [molecule for molecule in a.molecules if molecule.params['Number_MCM'] >= 1]
+    assert selection.molecules == expected
+    # molecules are not copied
+    assert all(x is y for x, y in zip(selection, expected))
+    assert [archive.archive for archive in selection.archives] == [a]
+    assert selection.summarize().shape[0] == len(expected)
+
+    with pytest.raises(MarsPyException):
+        collection.select(salt='150 mM')
+
+
+def test_condition_index_follows_readded_archive(collection):
+    a = make_archive('a.yama', nacl='150 mM')
+    a.nacl = '300 mM'
+    collection.add(a)
+    assert collection.select_archives(nacl='150 mM') == []
+    assert collection.select_archives(nacl='300 mM') == [a]
+    collection.remove(a)
+    assert len(collection) == 0 and collection.conditions()['nacl'] == []
@@ -0,0 +1,154 @@
+"""
+Tests of the persistent conversion cache (marspy.convert.diskcache).
+"""
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from marspy.convert import diskcache
+from marspy.convert.archive import DnaMoleculeArchive
+from marspy.convert.diskcache import DiskCache
+from marspy.convert.molecule import MarsPyWarning
+from marspy.convert.synthetic import synthetic_archive
+from marspy.convert.yama import read_yama
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'archive_smile.yama')
+
+
+@pytest.fixture
+def yama_file(tmp_path):
+    path = str(tmp_path / 'archive.yama')
+    shutil.copy(FIXTURE, path)
+    return path
+
+
+@pytest.fixture
+def open_archive():
+    archives = list()
+
+    def open_(filepath, cache_dir):
+        archives.append(DnaMoleculeArchive(filepath, 'accept', labels=dict(Cohesin='', MCM=''), reader='native',
+                                           cache_dir=cache_dir))
+        return archives[-1]
+
+    yield open_
+    for archive in archives:
+        DnaMoleculeArchive.collection.discard(archive)
+
+
+def entries(cache_dir):
+    return [key for key in os.listdir(cache_dir) if not key.startswith('.')]
+
+
+def test_cache_roundtrip(yama_file, tmp_path, open_archive):
+    cache_dir = str(tmp_path / 'cache')
+    converted = open_archive(yama_file, cache_dir)
+    assert len(entries(cache_dir)) == 1
+    # the converted archive is released once the cached one replaces it
+    expected = [(molecule.uid, molecule.params, molecule.tags, molecule.df) for molecule in converted.molecules]
+    cached = open_archive(yama_file, cache_dir)
+    assert cached.nacl == '150 mM'
+    assert len(cached.molecules) == len(expected)
+    for molecule, (uid, params, tags, df) in zip(cached.molecules, expected):
+        assert (molecule.uid, molecule.params, molecule.tags) == (uid, params, tags)
+        pd.testing.assert_frame_equal(molecule.df, df)
+
+
+def test_tables_are_memory_mapped(yama_file, tmp_path):
+    cache = DiskCache(str(tmp_path / 'cache'))
+    cache.store(yama_file, read_yama(yama_file))
+    record = cache.load(yama_file)
+    uid = record.getMoleculeUIDs()[0]
+    df = record.get(uid).getTable().to_pandas()
+    # no copy of the memory-mapped column
+    array = df['Cohesin_1_Time_(s)'].to_numpy()
+    while array is not None and not isinstance(array, np.memmap):
+        array = array.base
+    assert array is not None
+
+
+def test_string_columns_are_not_pickled(yama_file, tmp_path):
+    record = synthetic_archive(n_molecules=4, n_frames=10, seed=2)
+    for i, uid in enumerate(record.getMoleculeUIDs()):
+        # string column missing on every second molecule (padded with None)
+        if i % 2:
+            record.get(uid).table.df['Note'] = [f'{uid}_{frame}' for frame in range(10)]
+    cache = DiskCache(str(tmp_path / 'cache'))
+    cache.store(yama_file, record)
+    entry = os.path.join(cache.cache_dir, entries(cache.cache_dir)[0])
+    assert not any(np.load(os.path.join(entry, 'tables', name)).dtype.hasobject
+                   for name in os.listdir(os.path.join(entry, 'tables')) if name.endswith('.npy'))
+    cached = cache.load(yama_file)
+    for uid in record.getMoleculeUIDs():
+        df = cached.get(uid).getTable().to_pandas()
+        expected = record.get(uid).table.df
+        assert list(df.columns) == list(expected.columns)
+        if 'Note' in expected:
+            assert df['Note'].tolist() == expected['Note'].tolist()
+
+
+@pytest.fixture
+def count_hashes(monkeypatch):
+    calls = list()
+
+    def counting_fingerprint(filepath):
+        calls.append(filepath)
+        return fingerprint(filepath)
+
+    fingerprint = diskcache.fingerprint
+    monkeypatch.setattr(diskcache, 'fingerprint', counting_fingerprint)
+    return calls
+
+
+def test_file_is_hashed_once_on_miss(yama_file, tmp_path, open_archive, count_hashes):
+    open_archive(yama_file, str(tmp_path / 'cache'))
+    assert count_hashes == [yama_file]
+
+
+def test_file_is_not_hashed_on_hit(yama_file, tmp_path, open_archive, count_hashes):
+    cache_dir = str(tmp_path / 'cache')
+    open_archive(yama_file, cache_dir)
+    archive = open_archive(yama_file, cache_dir)
+    assert count_hashes == [yama_file]
+    assert isinstance(archive.archive_link.get(archive.molecules[0].uid).table.df, pd.DataFrame)
+    # modified files are hashed again
+    os.utime(yama_file, (0, 0))
+    open_archive(yama_file, cache_dir)
+    assert count_hashes == [yama_file, yama_file]
+
+
+@pytest.mark.parametrize('filename', ['fingerprint.json', 'manifest.json'])
+def test_corrupt_json_of_other_entry(yama_file, tmp_path, filename):
+    cache = DiskCache(str(tmp_path / 'cache'))
+    other = str(tmp_path / 'other.yama')
+    shutil.copy(FIXTURE, other)
+    cache.store(other, read_yama(other))
+    with open(os.path.join(cache.cache_dir, entries(cache.cache_dir)[0], filename), 'w') as file:
+        file.write('{"path": ')
+    with pytest.warns(MarsPyWarning, match='corrupt cache entry'):
+        cache.store(yama_file, read_yama(yama_file))
+        assert [manifest['fingerprint']['path'] for manifest in cache.manifests()] == [os.path.abspath(yama_file)]
+    assert cache.load(yama_file) is not None
+
+
+@pytest.mark.parametrize('damage', ['manifest', 'column'])
+def test_corrupt_entry_is_reconverted(yama_file, tmp_path, open_archive, damage):
+    cache_dir = str(tmp_path / 'cache')
+    expected = [molecule.df for molecule in open_archive(yama_file, cache_dir).molecules]
+    entry = os.path.join(cache_dir, entries(cache_dir)[0])
+    if damage == 'manifest':
+        with open(os.path.join(entry, 'manifest.json'), 'w') as file:
+            file.write('{"molecules": [')
+    else:
+        os.remove(os.path.join(entry, 'tables', '0.npy'))
+
+    with pytest.warns(MarsPyWarning, match='corrupt cache entry'):
+        archive = open_archive(yama_file, cache_dir)
+    assert len(archive.molecules) == len(expected)
+    for molecule, df in zip(archive.molecules, expected):
+        pd.testing.assert_frame_equal(molecule.df, df)
+    # entry was written again
+    assert DiskCache(cache_dir).load(yama_file) is not None
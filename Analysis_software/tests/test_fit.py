@@ -0,0 +1,59 @@
+"""
+Tests of the dwell-time fits (marspy.fit).
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from marspy.convert.archive import DnaMoleculeArchive
+from marspy.convert.synthetic import synthetic_archive
+from marspy.fit import bootstrap_durations, fit_durations, fit_table, pause_durations
+
+
+def test_fit_durations():
+    durations = np.array([1., 2., 3., 6.])
+    assert fit_durations(durations, model='exponential') == pytest.approx(3.)
+    assert fit_durations(durations, model='half_life') == pytest.approx(3. * np.log(2))
+    # truncation at x_min, censored durations only count towards the exposure
+    assert fit_durations(durations, model='exponential', x_min=2.) == pytest.approx((0. + 1. + 4.) / 3)
+    assert fit_durations(durations, model='exponential', censored=[False, False, False, True]) == pytest.approx(4.)
+
+
+def test_bootstrap_matches_loop():
+    rng = np.random.default_rng(0)
+    durations = rng.exponential(5., 60)
+    groups = np.repeat(['a', 'b', 'c'], [10, 20, 30])
+    result = bootstrap_durations(durations, groups=groups, model='exponential', n_boot=2000, seed=1)
+    assert list(result.index) == ['a', 'b', 'c']
+    assert list(result['n']) == [10, 20, 30]
+    for label, row in result.iterrows():
+        assert row['parameter'] == pytest.approx(durations[groups == label].mean())
+        assert row['ci_lower'] < row['parameter'] < row['ci_upper']
+        assert len(row['replicates']) == 2000
+
+
+@pytest.mark.parametrize('durations', [np.array([]), np.array([np.nan, np.nan])])
+def test_bootstrap_without_durations(durations):
+    result = bootstrap_durations(durations, n_boot=100, seed=0)
+    assert len(result) == 0
+    assert list(result.columns) == ['n', 'events', 'parameter', 'ci_lower', 'ci_upper', 'replicates']
+
+
+def test_fit_table_without_pauses():
+    archive = DnaMoleculeArchive('no_pauses.yama', 'accept', labels=dict(Cohesin='', MCM=''),
+                                 archive_link=synthetic_archive(n_molecules=5, n_frames=50, seed=2))
+    try:
+        # no pause detection run: no pause durations
+        durations = pause_durations(archive)
+        assert len(durations) == 0
+        assert len(fit_table(durations, 'pause_duration', n_boot=100)) == 0
+        assert len(fit_table(durations, 'pause_duration', by=['nacl', 'mcm'], n_boot=100)) == 0
+    finally:
+        DnaMoleculeArchive.collection.discard(archive)
+
+
+def test_fit_table_by_conditions():
+    df = pd.DataFrame(dict(duration=[1., 2., 3., 4.], nacl=['50', '50', '150', '150'], mcm=['wt'] * 4))
+    result = fit_table(df, 'duration', by=['nacl', 'mcm'], model='exponential', n_boot=100, seed=0)
+    assert result.index.names == ['nacl', 'mcm']
+    assert result.loc[('50', 'wt'), 'parameter'] == pytest.approx(1.5)
@@ -0,0 +1,26 @@
+"""
+Lazy submodule access of the marspy packages (PEP 562 __getattr__ driven by __all__).
+"""
+import importlib
+import os
+
+import pytest
+
+import marspy
+
+
+@pytest.mark.parametrize('package', ['marspy', 'marspy.convert'])
+def test_all_submodules_are_listed(package):
+    module = importlib.import_module(package)
+    directory = os.path.dirname(module.__file__)
+    submodules = {name[:-3] for name in os.listdir(directory) if name.endswith('.py') and name != '__init__.py'}
+    submodules |= {name for name in os.listdir(directory)
+                   if os.path.isfile(os.path.join(directory, name, '__init__.py'))}
+    assert submodules == set(module.__all__)
+    for name in module.__all__:
+        assert getattr(module, name).__name__ == f'{package}.{name}'
+
+
+def test_unknown_attribute():
+    with pytest.raises(AttributeError):
+        marspy.convert.does_not_exist
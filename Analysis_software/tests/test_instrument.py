@@ -0,0 +1,48 @@
+"""
+Tests of the pipeline instrumentation (marspy.instrument).
+"""
+import threading
+
+import numpy as np
+
+from marspy import instrument
+from marspy.convert.parallel import thread_map
+from marspy.instrument import profile, stage
+
+
+def allocate(nbytes):
+    return np.ones(nbytes // 8)
+
+
+def test_nested_peaks():
+    with profile(memory=True) as collector:
+        with stage('outer'):
+            with stage('inner'):
+                data = allocate(8 * 2 ** 20)
+                del data
+            data = allocate(2 ** 20)
+    peaks = {record.stage: record.peak for record in collector.records}
+    assert 8 * 2 ** 20 <= peaks['inner'] < 9 * 2 ** 20
+    # peak of the outer stage includes the inner stage
+    assert peaks['outer'] >= peaks['inner']
+
+
+def test_concurrent_stages_report_no_peak():
+    barrier = threading.Barrier(4)
+
+    def work(i):
+        with stage('worker', str(i)):
+            # all workers run at the same time
+            barrier.wait()
+            data = allocate(2 ** 20)
+            barrier.wait()
+            return data.sum()
+
+    with profile(memory=True) as collector:
+        with stage('outer'):
+            thread_map(work, range(4), workers=4)
+    records = {record.stage: record for record in collector.records}
+    assert all(record.peak is None for record in collector.records if record.stage == 'worker')
+    # outermost stage covers the allocations of all threads
+    assert records['outer'].peak >= 4 * 2 ** 20
+    assert not instrument._open
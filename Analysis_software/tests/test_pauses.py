@@ -0,0 +1,204 @@
+"""
+Tests of the vectorized pause detection and pause masks (marspy.convert.molecule) against the former row-wise
+implementations.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from marspy.convert.archive import DnaMoleculeArchive
+from marspy.convert.molecule import flag_pauses, in_intervals, merge_pauses
+from marspy.convert.synthetic import synthetic_archive
+
+COLUMNS = ['A', 'Sigma_A', 'B', 'Sigma_B']
+
+
+def flag_pauses_rowwise(df, thresh=200, sigma_max=30, global_thresh=True, length=1, col='B'):
+    # row-wise reference (former SegmentsTable.detect_pauses)
+    df = df.copy()
+    df['pause_' + col] = False
+    cutoff = thresh
+    for i in range(len(df)):
+        if not global_thresh:
+            cutoff = df[~df['pause_' + col]][col].mean() / thresh
+    for row in df.index:
+        df.loc[row, 'pause_' + col] = ((abs(df.loc[row, col]) < cutoff) and
+                                       (df.loc[row, 'Sigma_' + col] < sigma_max) and
+                                       (df.loc[row, 'X2'] - df.loc[row, 'X1'] > length))
+    return df['pause_' + col].to_numpy(dtype=bool)
+
+
+def merge_pauses_rowwise(df):
+    # row-wise reference (former SegmentsTable.detect_pauses), note the signed comparison inside abs()
+    df = df.copy().reset_index(drop=True)
+    remove_rows = set()
+    for i in range(1, len(df)):
+        if (df.loc[i - 1, 'pause_B'] and df.loc[i, 'pause_B'] and df.loc[i - 1, 'X2'] == df.loc[i, 'X1'] and
+                abs(df.loc[i - 1, 'Y2'] - df.loc[i, 'Y1'] < 1000)):
+            weights = df[i - 1:i + 1]['X2'] - df[i - 1:i + 1]['X1']
+            values = {column: np.average(df[i - 1:i + 1][column], weights=weights) for column in COLUMNS}
+            remove_rows.add(i - 1)
+            df.loc[i, 'X1'] = df.loc[i - 1, 'X1']
+            df.loc[i, 'Y1'] = df.loc[i - 1, 'Y1']
+            for column, value in values.items():
+                df.loc[i, column] = value
+    df.drop(list(remove_rows), axis=0, inplace=True)
+    df.reset_index(drop=True, inplace=True)
+    return df
+
+
+def random_table(rng, n):
+    x = np.cumsum(rng.integers(1, 10, n + 1)).astype(float)
+    x1, x2 = x[:-1].copy(), x[1:].copy()
+    # some gaps between segments
+    gap = rng.random(n) < 0.15
+    x1[gap] += 0.5
+    y1 = rng.normal(5000, 800, n)
+    # y jumps of both signs around 1 kb
+    y2 = y1 + rng.choice([-2500, -1200, -999, 0, 999, 1200, 2500], n)
+    return pd.DataFrame(dict(X1=x1, Y1=y1, X2=x2, Y2=y2, A=y1, Sigma_A=rng.uniform(1, 40, n),
+                             B=rng.normal(0, 300, n), Sigma_B=rng.uniform(1, 40, n)))
+
+
+def random_tables(seed, n_tables=20):
+    rng = np.random.default_rng(seed)
+    tables = list()
+    for _ in range(n_tables):
+        df = random_table(rng, int(rng.integers(1, 15)))
+        pause = rng.random(len(df)) < 0.6
+        # runs of pauses at the start and the end of the table
+        if rng.random() < 0.5:
+            pause[:3] = True
+        if rng.random() < 0.5:
+            pause[-3:] = True
+        df['pause_B'] = pause
+        tables.append(df)
+    return tables
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('global_thresh,thresh', [(True, 200), (False, 2)])
+def test_flag_pauses_matches_rowwise(seed, global_thresh, thresh):
+    for df in random_tables(seed):
+        np.testing.assert_array_equal(flag_pauses(df, thresh=thresh, global_thresh=global_thresh),
+                                      flag_pauses_rowwise(df, thresh=thresh, global_thresh=global_thresh))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_merge_pauses_matches_rowwise(seed):
+    tables = random_tables(seed)
+    expected = [merge_pauses_rowwise(df) for df in tables]
+    for df, reference in zip(tables, expected):
+        pd.testing.assert_frame_equal(merge_pauses(df), reference, check_exact=False, rtol=1e-12)
+
+    # concatenated tables: runs are never merged across group boundaries
+    groups = np.repeat(np.arange(len(tables)), [len(df) for df in tables])
+    merged = merge_pauses(pd.concat(tables, ignore_index=True), groups=groups)
+    pd.testing.assert_frame_equal(merged, pd.concat(expected, ignore_index=True), check_exact=False, rtol=1e-12)
+
+
+def test_merge_pauses_signed_y_difference():
+    # Y2 - Y1 < 1000 is evaluated signed: a segment starting more than 1 kb below the end of the previous one is not
+    # merged, one starting more than 1 kb above it is
+    df = pd.DataFrame(dict(X1=[0., 10., 20.], Y1=[5000., 3000., 6500.], X2=[10., 20., 30.], Y2=[5000., 5000., 6500.],
+                           A=[1., 2., 3.], Sigma_A=[1., 1., 1.], B=[0., 0., 0.], Sigma_B=[1., 1., 1.],
+                           pause_B=[True, True, True]))
+    merged = merge_pauses(df)
+    pd.testing.assert_frame_equal(merged, merge_pauses_rowwise(df))
+    assert merged['X1'].tolist() == [0., 10.]
+
+
+@pytest.mark.parametrize('global_thresh,thresh', [(True, 200), (False, 2)])
+def test_batch_matches_serial(global_thresh, thresh):
+    archive_link = synthetic_archive(n_molecules=30, n_frames=200, pause_density=0.5, seed=13)
+    archives = [DnaMoleculeArchive(f'pauses_{batch}.yama', 'accept', labels=dict(Cohesin='', MCM=''),
+                                   archive_link=archive_link) for batch in (False, True)]
+    try:
+        for batch, archive in zip((False, True), archives):
+            archive.add_segments_tables(types='rate')
+            archive.detect_pauses(thresh=thresh, global_thresh=global_thresh, batch=batch)
+        serial, batch = archives
+        n_pauses = 0
+        for a, b in zip(serial.molecules, batch.molecules):
+            for seg_a, seg_b in zip(a.seg_dfs, b.seg_dfs):
+                pd.testing.assert_frame_equal(seg_a.df, seg_b.df)
+                n_pauses += seg_a.df['pause_B'].sum()
+        assert n_pauses > 0
+    finally:
+        for archive in archives:
+            DnaMoleculeArchive.collection.discard(archive)
+
+
+def in_intervals_loop(values, starts, ends):
+    # loop-based reference (former Molecule.df_noidle)
+    mask = np.zeros(len(values), dtype=bool)
+    for start, end in zip(starts, ends):
+        for i, value in enumerate(values):
+            if start <= value <= end:
+                mask[i] = True
+    return mask
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_in_intervals_matches_loop(seed):
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, 100, 12).astype(float)
+    # overlapping and nested intervals, zero length intervals
+    ends = starts + rng.integers(0, 30, 12)
+    # values on all X1 / X2 boundaries, in between and missing
+    values = np.concatenate([starts, ends, rng.uniform(-10, 140, 50), [np.nan]])
+    np.testing.assert_array_equal(in_intervals(values, starts, ends), in_intervals_loop(values, starts, ends))
+
+
+def test_in_intervals_edge_cases():
+    values = np.array([0., 1., 2., 3., 4., 5.])
+    assert not in_intervals(values, np.array([]), np.array([])).any()
+    # intervals with missing bounds are ignored
+    assert not in_intervals(values, np.array([np.nan, 1.]), np.array([3., np.nan])).any()
+    # closed intervals, the second interval lies inside the first
+    np.testing.assert_array_equal(in_intervals(values, np.array([1., 1.5]), np.array([3., 2.])),
+                                  [False, True, True, True, False, False])
+
+
+def test_noidle_mask_matches_loop():
+    archive_link = synthetic_archive(n_molecules=20, n_frames=80, pause_density=0.3, reject_fraction=0, seed=9)
+    archive = DnaMoleculeArchive('noidle.yama', 'accept', labels=dict(Cohesin='', MCM=''), archive_link=archive_link)
+    try:
+        archive.add_segments_tables(types='rate')
+        archive.detect_pauses(thresh=50)
+        archive.add_df_noidle('Cohesin_1_')
+        n_empty = 0
+        for molecule in archive.molecules:
+            seg_df = next(seg_df for seg_df in molecule.seg_dfs if seg_df.prefix == 'Cohesin_1_')
+            pauses = seg_df.df[seg_df.df['pause_B']]
+            n_empty += pauses.empty
+            time = molecule.df['Cohesin_1_Time_(s)'].to_numpy(dtype=float)
+            expected = ~in_intervals_loop(time, pauses['X1'], pauses['X2'])
+            np.testing.assert_array_equal(molecule.noidle_mask, expected)
+            pd.testing.assert_frame_equal(molecule.df_noidle, molecule.df[expected].reset_index(drop=True))
+        # molecules without pauses keep all rows
+        assert 0 < n_empty < len(archive.molecules)
+    finally:
+        DnaMoleculeArchive.collection.discard(archive)
+
+
+@pytest.mark.parametrize('global_thresh,thresholds', [(True, [20., 100., 400.]), (False, [0.5, 2., 8.])])
+def test_sweep_matches_detect_pauses(global_thresh, thresholds):
+    archive_link = synthetic_archive(n_molecules=25, n_frames=200, pause_density=0.5, seed=21)
+    archive = DnaMoleculeArchive('sweep.yama', 'accept', labels=dict(Cohesin='', MCM=''), archive_link=archive_link)
+    try:
+        archive.add_segments_tables(types='rate')
+        sweep = archive.sweep_pauses(thresholds, sigma_max=[10, 30], global_thresh=global_thresh, length=[1, 5])
+        assert len(sweep) == 3 * 2 * 2
+        for row in sweep.itertuples():
+            archive.detect_pauses(thresh=row.thresh, sigma_max=row.sigma_max, global_thresh=global_thresh,
+                                  length=row.length)
+            seg_dfs = [seg_df for molecule in archive.molecules for seg_df in molecule.seg_dfs]
+            pauses = pd.concat([seg_df.df[seg_df.df['pause_B']] for seg_df in seg_dfs])
+            assert row.pauses == len(pauses)
+            assert row.idle_time == pytest.approx((pauses['X2'] - pauses['X1']).sum())
+            assert row.total_time == pytest.approx(sum((seg_df.raw['X2'] - seg_df.raw['X1']).sum()
+                                                       for seg_df in seg_dfs))
+        assert sweep['pauses'].nunique() > 1
+    finally:
+        DnaMoleculeArchive.collection.discard(archive)
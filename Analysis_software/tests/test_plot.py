@@ -0,0 +1,46 @@
+"""
+Tests of the overview figures (marspy.plot).
+"""
+import matplotlib
+import numpy as np
+import pytest
+
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+
+from marspy.convert.archive import DnaMoleculeArchive  # noqa: E402
+from marspy.convert.synthetic import synthetic_archive  # noqa: E402
+from marspy.plot import _y_range, overview_pages  # noqa: E402
+
+PREFIX = 'Cohesin_1_'
+
+
+@pytest.fixture(scope='module')
+def archive():
+    archive_link = synthetic_archive(n_molecules=8, n_frames=120, pause_density=0.5, reject_fraction=0, seed=3)
+    archive = DnaMoleculeArchive('plot.yama', 'accept', labels=dict(Cohesin='', MCM=''), archive_link=archive_link)
+    archive.add_segments_tables(types='rate')
+    archive.detect_pauses(thresh=50)
+    archive.add_df_noidle(PREFIX)
+    yield archive
+    DnaMoleculeArchive.collection.discard(archive)
+
+
+def test_y_range_of_df_noidle(archive):
+    column = PREFIX + 'Position_on_DNA'
+    values = [molecule.df_noidle[column].dropna() for molecule in archive.molecules]
+    expected = max(value.max() - value.min() for value in values if len(value))
+    assert _y_range(archive.molecules, column, noidle=True) == pytest.approx(expected)
+    assert _y_range(archive.molecules, column, noidle=True) != _y_range(archive.molecules, column)
+
+
+@pytest.mark.parametrize('stacked', [True, False])
+def test_overview_pages_with_offsets(archive, stacked):
+    offsets = np.arange(len(archive.molecules)) * 10.
+    figures = list(overview_pages(archive.molecules, prefix=PREFIX, nrows=2, ncols=2, stacked=stacked, spacing=1000.,
+                                  offsets=offsets, noidle=True, style=None))
+    assert len(figures) == 2
+    if stacked:
+        np.testing.assert_allclose(figures[1].axes[0].get_yticks(), np.arange(4) * 1000. + offsets[4:])
+    for fig in figures:
+        plt.close(fig)
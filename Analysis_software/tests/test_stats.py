@@ -0,0 +1,98 @@
+"""
+Tests of the statistics helpers (marspy.stats) against scipy.stats and hand-computed values.
+"""
+import numpy as np
+import pytest
+import scipy.stats
+
+from marspy.stats import bootstrap, calc_ci, dunn, holm, kruskal, permutation_test
+
+
+@pytest.fixture
+def grouped():
+    rng = np.random.default_rng(4)
+    groups = np.repeat(['a', 'b', 'c'], [30, 25, 40])
+    values = np.column_stack([rng.normal(0, 1, len(groups)) + (groups == 'c'),
+                              # ties
+                              rng.integers(0, 5, len(groups)).astype(float),
+                              rng.exponential(1, len(groups))])
+    values[rng.random(values.shape) < 0.1] = np.nan
+    return values, groups
+
+
+def test_kruskal_matches_scipy(grouped):
+    values, groups = grouped
+    h, p = kruskal(values, groups)
+    for column in range(values.shape[1]):
+        samples = [values[groups == label, column] for label in 'abc']
+        expected = scipy.stats.kruskal(*[sample[~np.isnan(sample)] for sample in samples])
+        assert h[column] == pytest.approx(expected.statistic, rel=1e-10)
+        assert p[column] == pytest.approx(expected.pvalue, rel=1e-8)
+
+
+def test_dunn_matches_rank_formula(grouped):
+    values, groups = grouped
+    pairs, z, p = dunn(values, groups, correction=None)
+    for column in range(values.shape[1]):
+        valid = ~np.isnan(values[:, column])
+        ranks = scipy.stats.rankdata(values[valid, column])
+        labels = groups[valid]
+        n = len(ranks)
+        _, counts = np.unique(ranks, return_counts=True)
+        variance = n * (n + 1) / 12 - np.sum(counts ** 3 - counts) / (12 * (n - 1))
+        for row, (first, second) in enumerate(pairs):
+            a, b = ranks[labels == first], ranks[labels == second]
+            expected = (a.mean() - b.mean()) / np.sqrt(variance * (1 / len(a) + 1 / len(b)))
+            assert z[row, column] == pytest.approx(expected, rel=1e-10)
+            assert p[row, column] == pytest.approx(2 * scipy.stats.norm.sf(abs(expected)), rel=1e-8)
+
+
+def test_holm():
+    # sorted: 0.005 * 4, 0.01 * 3, 0.03 * 2 = 0.06, 0.04 * 1 = 0.04 raised to 0.06 (monotonicity)
+    np.testing.assert_allclose(holm([0.01, 0.04, 0.03, 0.005]), [0.03, 0.06, 0.06, 0.02])
+    # NaNs are not counted as tests
+    np.testing.assert_allclose(holm([0.01, np.nan, 0.04]), [0.02, np.nan, 0.04])
+    # capped at 1
+    np.testing.assert_allclose(holm([0.5, 0.6]), [1., 1.])
+    # along axis
+    np.testing.assert_allclose(holm(np.array([[0.01, 0.5], [0.04, 0.6]]), axis=0), [[0.02, 1.], [0.04, 1.]])
+    np.testing.assert_allclose(holm(np.array([[0.01, 0.04, 0.03, 0.005]]), axis=1), [[0.03, 0.06, 0.06, 0.02]])
+
+
+@pytest.mark.parametrize('estimator', [np.mean, np.median])
+def test_bca_matches_scipy(estimator):
+    sample = np.random.default_rng(6).exponential(2, 60)
+    estimates = bootstrap(sample, n_boot=100000, estimator=estimator, seed=1)
+    lower, upper = calc_ci(estimates, method='bca', sample=sample, estimator=estimator)
+    expected = scipy.stats.bootstrap((sample,), estimator, n_resamples=100000, method='BCa',
+                                     random_state=np.random.default_rng(2)).confidence_interval
+    width = expected.high - expected.low
+    assert lower == pytest.approx(expected.low, abs=0.03 * width)
+    assert upper == pytest.approx(expected.high, abs=0.03 * width)
+
+
+def mean_difference(x, y):
+    return np.mean(x) - np.mean(y)
+
+
+def test_permutation_test():
+    rng = np.random.default_rng(8)
+    values = np.concatenate([rng.normal(0, 1, 5), rng.normal(1, 1, 6), rng.normal(0, 1, 30), rng.normal(0, 1, 30)])
+    groups = np.repeat(['a', 'b', 'c', 'd'], [5, 6, 30, 30])
+    pairs, differences, p = permutation_test(values, groups, n_perm=20000, seed=3, correction=None)
+    # fixed seed: same result
+    np.testing.assert_array_equal(permutation_test(values, groups, n_perm=20000, seed=3, correction=None)[2], p)
+
+    row = pairs.index(('a', 'b'))
+    a, b = values[groups == 'a'], values[groups == 'b']
+    assert differences[row, 0] == pytest.approx(a.mean() - b.mean())
+    # exact test (all 462 splits)
+    expected = scipy.stats.permutation_test((a, b), mean_difference, permutation_type='independent',
+                                            alternative='two-sided', n_resamples=np.inf).pvalue
+    assert p[row, 0] == pytest.approx(expected, abs=0.01)
+
+    row = pairs.index(('c', 'd'))
+    c, d = values[groups == 'c'], values[groups == 'd']
+    expected = scipy.stats.permutation_test((c, d), mean_difference, permutation_type='independent',
+                                            alternative='two-sided', n_resamples=20000, random_state=5).pvalue
+    assert p[row, 0] == pytest.approx(expected, abs=0.02)
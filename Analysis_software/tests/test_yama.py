@@ -0,0 +1,166 @@
+"""
+Tests of the JVM-free .yama reader (marspy.convert.yama).
+
+Fixtures (tests/fixtures):
+archive_json.yama: 4 molecules of synthetic_archive(n_molecules=4, n_frames=30, seed=1) written with write_yama,
+molecule_000003 is tagged reject_dna, every molecule carries 40 extra tags label_00 - label_39 (more shared values than
+fit into short references) and a parameter with a name longer than 64 bytes
+molecule_mars.json: molecule record in the layout written by MARS (tables as {"Columns": [{"Header", "Type", "Values"}]}
+with an integer slice column, "NaN" / null values and a string column), written by hand
+archive_smile.yama: archive_json.yama converted to Smile by Jackson 2.20.1 (SmileFactory with CHECK_SHARED_NAMES and
+CHECK_SHARED_STRING_VALUES, JsonGenerator.copyCurrentStructure)
+"""
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from marspy.convert.archive import DnaMoleculeArchive
+from marspy.convert.synthetic import synthetic_archive
+from marspy.convert.molecule import MarsPyException
+from marspy.convert.yama import (SmileDecoder, SmileEncoder, iter_molecules, molecule_record, read_yama, table_to_frame,
+                                 write_yama)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+JSON_FIXTURE = os.path.join(FIXTURES, 'archive_json.yama')
+SMILE_FIXTURE = os.path.join(FIXTURES, 'archive_smile.yama')
+MARS_FIXTURE = os.path.join(FIXTURES, 'molecule_mars.json')
+LONG_NAME = 'Cohesin_1_mean_squared_displacement_of_all_frames_before_photobleaching'
+
+
+def assert_records_equal(a, b):
+    assert a.getMoleculeUIDs() == b.getMoleculeUIDs()
+    assert a.getMetadataUIDs() == b.getMetadataUIDs()
+    for uid in a.getMetadataUIDs():
+        assert a.getMetadata(uid).parameters == b.getMetadata(uid).parameters
+        assert a.getMetadata(uid).string_parameters == b.getMetadata(uid).string_parameters
+    for uid in a.getMoleculeUIDs():
+        x, y = a.get(uid), b.get(uid)
+        assert x.metadata_uid == y.metadata_uid
+        assert x.tags == y.tags
+        assert x.parameters == y.parameters
+        pd.testing.assert_frame_equal(x.table.df, y.table.df, check_dtype=False)
+        assert list(x.segments_tables) == list(y.segments_tables)
+        for key, df in x.segments_tables.items():
+            pd.testing.assert_frame_equal(df, y.segments_tables[key], check_dtype=False)
+        assert {name: (region.column, region.start, region.end) for name, region in x.regions.items()} == \
+               {name: (region.column, region.start, region.end) for name, region in y.regions.items()}
+
+
+def test_json_fixture():
+    record = read_yama(JSON_FIXTURE)
+    assert len(record.getMoleculeUIDs()) == 4
+    molecule = record.get('molecule_000000')
+    assert molecule.tags[-1] == 'label_39'
+    assert molecule.parameters[LONG_NAME] == 0.0
+    assert molecule.table.df.shape == (30, 8)
+    assert record.getMetadata('metadata_0').getStringParameter('nacl') == '150 mM'
+
+
+def test_mars_table_layout():
+    with open(MARS_FIXTURE) as file:
+        record = molecule_record(json.load(file))
+    df = record.table.df
+    assert list(df.columns) == ['slice', 'Cohesin_1_T', 'Cohesin_1_Time_(s)', 'Cohesin_1_Position_on_DNA',
+                                'Cohesin_1_Intensity', 'Note']
+    assert df.dtypes.drop('Note').to_dict() == {'slice': np.int64, 'Cohesin_1_T': np.float64,
+                                                'Cohesin_1_Time_(s)': np.float64,
+                                                'Cohesin_1_Position_on_DNA': np.float64,
+                                                'Cohesin_1_Intensity': np.float64}
+    assert pd.api.types.is_string_dtype(df['Note'])
+    assert df['slice'].tolist() == [1, 2, 3, 4, 5]
+    assert df['Cohesin_1_T'].isna().tolist() == [False, False, False, True, False]
+    assert df['Cohesin_1_Position_on_DNA'].isna().sum() == 1
+    seg_df = record.segments_tables[('Cohesin_1_Time_(s)', 'Cohesin_1_Intensity', '')]
+    assert list(seg_df.columns) == ['X1', 'Y1', 'X2', 'Y2', 'A', 'Sigma_A', 'B', 'Sigma_B']
+    assert (seg_df.dtypes == np.float64).all()
+
+
+def test_table_layouts():
+    columns = [dict(header='slice', values=[1, 2]), dict(header='x', values=[0.5, None])]
+    expected = pd.DataFrame(dict(slice=np.array([1, 2]), x=[0.5, np.nan]))
+    pd.testing.assert_frame_equal(table_to_frame(columns), expected)
+    pd.testing.assert_frame_equal(table_to_frame(dict(Columns=columns)), expected)
+    pd.testing.assert_frame_equal(table_to_frame(dict(slice=[1, 2], x=[0.5, None])), expected)
+
+
+@pytest.mark.parametrize('raw', [dict(Rows=[dict(x=1.0)]), dict(Columns=dict(x=[1.0])), [[1.0, 2.0]],
+                                 [dict(values=[1.0])], 'x', dict(Columns=[dict(Header='x', Type='double',
+                                                                               Values=['a'])])])
+def test_unknown_table_layout(raw):
+    with pytest.raises(MarsPyException):
+        table_to_frame(raw)
+
+
+def test_jackson_smile_fixture():
+    # shared names (incl. names after a long name) and short / long shared value references written by Jackson
+    assert_records_equal(read_yama(SMILE_FIXTURE), read_yama(JSON_FIXTURE))
+
+
+def test_smile_encoder_matches_jackson():
+    with open(JSON_FIXTURE) as file:
+        archive = json.load(file)
+    with open(SMILE_FIXTURE, 'rb') as file:
+        assert SmileEncoder().encode(archive) == file.read()
+
+
+def test_smile_specification_example():
+    # assembled by hand from the Smile format specification (independent of SmileEncoder and the Jackson fixture)
+    data = bytes([0x3A, 0x29, 0x0A, 0x03,  # header, shared names and shared string values enabled
+                  0xFA,  # start object
+                  0x81, ord('a'), ord('b'), 0x42, ord('x'), ord('y'), ord('z'),  # "ab": "xyz" (short ASCII)
+                  0x81, ord('c'), ord('d'), 0x01,  # "cd": shared value reference 0x01 -> "xyz"
+                  0x80, ord('n'), 0xC6,  # "n": small int 3 (zigzag 6)
+                  0x80, ord('e'), 0xF8, 0xFA, 0x40, 0xC1, 0xFB, 0xF9,  # "e": [{shared name 0 ("ab"): -1}]
+                  0x80, ord('t'), 0x23,  # "t": true
+                  0x80, ord('z'), 0x21,  # "z": null
+                  0xFB])
+    assert SmileDecoder(io.BytesIO(data)).value() == dict(ab='xyz', cd='xyz', n=3, e=[dict(ab=-1)], t=True, z=None)
+
+
+def test_shared_value_references():
+    data = SmileEncoder().encode(dict(a='abc', b='abc'))
+    # second 'abc' refers to shared value 0 as 0x01 (0x00 is reserved)
+    assert data[-4:] == bytes([0x80, ord('b'), 0x01, 0xFB])
+    decoder = SmileDecoder(io.BytesIO(data))
+    assert decoder.value() == dict(a='abc', b='abc')
+
+    decoder = SmileDecoder(io.BytesIO(data[:-2] + bytes([0x00, 0xFB])))
+    with pytest.raises(ValueError):
+        decoder.value()
+
+
+@pytest.mark.parametrize('encoding,shared', [('json', True), ('smile', True), ('smile', False)])
+def test_write_read_roundtrip(tmp_path, encoding, shared):
+    record = synthetic_archive(n_molecules=6, n_frames=40, seed=3)
+    path = str(tmp_path / 'synthetic.yama')
+    write_yama(record, path, encoding=encoding, shared=shared)
+    assert_records_equal(read_yama(path), record)
+    assert [molecule.uid for molecule in iter_molecules(path)] == record.getMoleculeUIDs()
+
+
+def test_accept_tag():
+    record = read_yama(SMILE_FIXTURE, accept_tag='accept')
+    for uid in record.getMoleculeUIDs():
+        molecule = record.get(uid)
+        accepted = 'accept' in molecule.tags
+        assert (len(molecule.table.df) > 0) == accepted
+        assert bool(molecule.segments_tables) == accepted
+    # column headings are kept for all molecules
+    assert 'MCM_1_Position_on_DNA' in record.properties().getColumnSet()
+
+
+def test_archive_from_fixture():
+    archive = DnaMoleculeArchive(SMILE_FIXTURE, 'accept', labels=dict(Cohesin='', MCM=''), reader='native')
+    try:
+        assert archive.nacl == '150 mM'
+        assert archive.proteins == {'Cohesin', 'MCM'}
+        reference = read_yama(JSON_FIXTURE)
+        for molecule in archive.molecules:
+            np.testing.assert_allclose(molecule.df['Cohesin_1_Position_on_DNA'].to_numpy(dtype=float),
+                                       reference.get(molecule.uid).table.df['Cohesin_1_Position_on_DNA'])
+    finally:
+        DnaMoleculeArchive.collection.discard(archive)